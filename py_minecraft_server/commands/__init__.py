@@ -1 +1,3 @@
 from .server_connection import ServerRCON, ServerQuery
+from .async_rcon import AsyncRCON, RCONPool, RCONAuthenticationError, get_rcon_pool
+from .status_ping import ServerStatus, StatusScanner, status_ping, get_status_scanner
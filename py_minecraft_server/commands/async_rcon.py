@@ -0,0 +1,226 @@
+from py_minecraft_server import logger
+import asyncio
+import struct
+from typing import Iterable, Optional, Union
+
+TYPE_RESPONSE = 0
+TYPE_COMMAND = 2
+TYPE_LOGIN = 3
+# minecraft answers unknown packet types with "Unknown request <type>", in order, so one is sent after every command
+# to mark the end of a response that may have been split over several packets
+TYPE_SENTINEL = 200
+HEADER = struct.Struct("<iii")
+MAX_RESPONSE_PAYLOAD = 4096
+
+
+def encode_packet(request_id: int, packet_type: int, body: Union[str, bytes]) -> bytes:
+    """Builds a source rcon packet: length, request id, type, body, two null bytes"""
+    payload = body if isinstance(body, bytes) else body.encode("utf-8")
+    return HEADER.pack(len(payload) + 10, request_id, packet_type) + payload + b"\x00\x00"
+
+
+async def read_packet(reader: asyncio.StreamReader) -> tuple[int, int, bytes]:
+    """Reads one packet returning (request id, type, body)"""
+    length = struct.unpack("<i", await reader.readexactly(4))[0]
+    data = await reader.readexactly(length)
+    request_id, packet_type = struct.unpack_from("<ii", data)
+    return request_id, packet_type, data[8:-2]
+
+
+class RCONAuthenticationError(ValueError):
+    """Raised when the server rejects the rcon password"""
+
+
+class AsyncRCON:
+    def __init__(self, host: str, password: str, port: int = 25575, timeout: float = 10.0,
+                 auto_reconnect: bool = True):
+        """
+        A native asyncio rcon client that keeps one connection open and pipelines commands over it
+        :param host: The server host
+        :param password: The rcon.password of the server
+        :param port: The rcon.port of the server
+        :param timeout: Seconds to wait for a connection or a command response
+        :param auto_reconnect: Reconnect and log in again when a command is sent on a dropped connection
+        """
+        self.host = host
+        self.password = password
+        self.port = port
+        self.timeout = timeout
+        self.auto_reconnect = auto_reconnect
+        self._reader = None
+        self._writer = None
+        self._read_task = None
+        self._write_lock = None
+        self._connect_lock = None
+        self._next_id = 0
+        # request id: [future, body fragments], sentinel id: command request id
+        self._pending = {}
+        self._sentinels = {}
+
+    @property
+    def connected(self) -> bool:
+        return self._writer is not None and not self._writer.is_closing() and \
+            self._read_task is not None and not self._read_task.done()
+
+    async def connect(self):
+        """Opens the connection and logs in, does nothing if already connected"""
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+            self._write_lock = asyncio.Lock()
+        async with self._connect_lock:
+            if self.connected:
+                return
+            self._reader, self._writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port),
+                                                                timeout=self.timeout)
+            self._read_task = asyncio.ensure_future(self._read_loop())
+            login_id = self._new_id()
+            future = self._expect(login_id)
+            await self._send(encode_packet(login_id, TYPE_LOGIN, self.password))
+            try:
+                await asyncio.wait_for(future, timeout=self.timeout)
+            except RCONAuthenticationError:
+                await self.close()
+                raise
+            logger.info(f"Connected to server {self.host}:{self.port} with RCON")
+
+    async def command(self, command: str) -> str:
+        """Runs a command and returns its full response, reconnecting first if the connection dropped"""
+        if not self.connected:
+            if self._writer is not None and not self.auto_reconnect:
+                raise ConnectionError(f"RCON connection to {self.host}:{self.port} closed")
+            await self.connect()
+        request_id, sentinel_id = self._new_id(), self._new_id()
+        future = self._expect(request_id)
+        self._sentinels[sentinel_id] = request_id
+        await self._send(encode_packet(request_id, TYPE_COMMAND, command) +
+                         encode_packet(sentinel_id, TYPE_SENTINEL, ""))
+        try:
+            return await asyncio.wait_for(future, timeout=self.timeout)
+        finally:
+            self._pending.pop(request_id, None)
+            self._sentinels.pop(sentinel_id, None)
+
+    async def commands(self, *commands: str) -> list[str]:
+        """Pipelines several commands over the connection, responses are returned in order"""
+        return list(await asyncio.gather(*[self.command(command) for command in commands]))
+
+    async def close(self):
+        """Closes the connection, failing any commands still waiting for a response"""
+        if self._read_task is not None:
+            self._read_task.cancel()
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except (OSError, ConnectionError):
+                pass
+        self._fail_pending(ConnectionError(f"RCON connection to {self.host}:{self.port} closed"))
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def _new_id(self) -> int:
+        self._next_id = self._next_id % 0x7FFFFFFF + 1
+        return self._next_id
+
+    def _expect(self, request_id: int) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = [future, []]
+        return future
+
+    async def _send(self, data: bytes):
+        async with self._write_lock:
+            self._writer.write(data)
+            await self._writer.drain()
+
+    async def _read_loop(self):
+        try:
+            while True:
+                request_id, packet_type, body = await read_packet(self._reader)
+                if request_id == -1:
+                    self._fail_pending(RCONAuthenticationError(f"RCON login to {self.host}:{self.port} failed"))
+                    return
+                if request_id in self._sentinels:
+                    pending = self._pending.get(self._sentinels.pop(request_id))
+                    if pending and not pending[0].done():
+                        pending[0].set_result(b"".join(pending[1]).decode("utf-8", errors="replace"))
+                    continue
+                pending = self._pending.get(request_id)
+                if pending is None:
+                    continue
+                if packet_type == TYPE_COMMAND and not pending[1]:
+                    # login responses have the command type and no body
+                    self._pending.pop(request_id)
+                    if not pending[0].done():
+                        pending[0].set_result("")
+                else:
+                    pending[1].append(body)
+        except (asyncio.IncompleteReadError, ConnectionError, OSError) as error:
+            self._fail_pending(ConnectionError(f"RCON connection to {self.host}:{self.port} lost: {error!r}"))
+        except asyncio.CancelledError:
+            pass
+
+    def _fail_pending(self, error: Exception):
+        for future, _ in self._pending.values():
+            if not future.done():
+                future.set_exception(error)
+        self._pending.clear()
+        self._sentinels.clear()
+
+
+class RCONPool:
+    def __init__(self, timeout: float = 10.0):
+        """Keeps one persistent AsyncRCON per host:port so repeated and fleet wide commands reuse connections"""
+        self.timeout = timeout
+        self._clients = {}
+
+    async def get(self, host: str, password: str, port: int = 25575) -> AsyncRCON:
+        """Returns the connected client for host:port, replacing it if the password changed"""
+        client = self._clients.get((host, port))
+        if client is None or client.password != password:
+            if client is not None:
+                await client.close()
+            client = AsyncRCON(host, password, port, self.timeout)
+            self._clients[(host, port)] = client
+        await client.connect()
+        return client
+
+    async def command(self, host: str, password: str, command: str, port: int = 25575) -> str:
+        return await (await self.get(host, password, port)).command(command)
+
+    async def broadcast(self, targets: Iterable[tuple[str, str, int]], command: str) -> dict:
+        """
+        Runs a command on many servers concurrently
+        :param targets: (host, password, port) of every server
+        :return: A dict of (host, port): response, or the exception raised for that server
+        """
+        targets = list(targets)
+        results = await asyncio.gather(*[self.command(host, password, command, port)
+                                         for host, password, port in targets], return_exceptions=True)
+        return {(host, port): result for (host, _, port), result in zip(targets, results)}
+
+    async def discard(self, host: str, port: int = 25575):
+        """Closes and forgets the client of host:port"""
+        client = self._clients.pop((host, port), None)
+        if client is not None:
+            await client.close()
+
+    async def close(self):
+        for client in self._clients.values():
+            await client.close()
+        self._clients.clear()
+
+
+_default_pool: Optional[RCONPool] = None
+
+
+def get_rcon_pool() -> RCONPool:
+    """Returns the process wide rcon pool"""
+    global _default_pool
+    if _default_pool is None:
+        _default_pool = RCONPool()
+    return _default_pool
@@ -0,0 +1,273 @@
+from py_minecraft_server import logger
+import asyncio
+import json
+import re
+import struct
+import time
+from typing import Iterable, Optional, Union
+
+# handshake next state asking for the status rather than a login
+STATE_STATUS = 1
+PACKET_HANDSHAKE = 0x00
+PACKET_STATUS_REQUEST = 0x00
+PACKET_PING = 0x01
+# the handshake protocol version, -1 is what clients send when they only want the status
+STATUS_PROTOCOL_VERSION = -1
+# status responses are a few KiB (a favicon is ~8KiB base64), anything much larger is not a minecraft server
+MAX_STATUS_LENGTH = 1 << 20
+COLOUR_RE = re.compile(r"§.")
+
+
+def encode_varint(value: int) -> bytes:
+    """Encodes an int as a minecraft protocol varint, negative values as their 32 bit two's complement"""
+    value &= 0xFFFFFFFF
+    encoded = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            encoded.append(byte | 0x80)
+        else:
+            encoded.append(byte)
+            return bytes(encoded)
+
+
+async def read_varint(reader: asyncio.StreamReader) -> int:
+    """Reads one varint from the stream"""
+    value = 0
+    for shift in range(0, 35, 7):
+        byte = (await reader.readexactly(1))[0]
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value - (1 << 32) if value & 0x80000000 else value
+    raise ValueError("Varint longer than 5 bytes")
+
+
+def decode_varint(data: bytes, offset: int = 0) -> tuple[int, int]:
+    """Decodes one varint from data, returning (value, offset after it)"""
+    value = 0
+    for shift in range(0, 35, 7):
+        if offset >= len(data):
+            raise ValueError("Truncated varint")
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value - (1 << 32) if value & 0x80000000 else value, offset
+    raise ValueError("Varint longer than 5 bytes")
+
+
+def encode_string(value: str) -> bytes:
+    encoded = value.encode("utf-8")
+    return encode_varint(len(encoded)) + encoded
+
+
+def encode_frame(packet_id: int, payload: bytes = b"") -> bytes:
+    """Builds an uncompressed packet: varint length, varint packet id, payload"""
+    body = encode_varint(packet_id) + payload
+    return encode_varint(len(body)) + body
+
+
+async def read_frame(reader: asyncio.StreamReader, max_length: int = MAX_STATUS_LENGTH) -> tuple[int, bytes]:
+    """Reads one uncompressed packet returning (packet id, payload)"""
+    length = await read_varint(reader)
+    if not 0 < length <= max_length:
+        raise ValueError(f"Bad packet length {length}")
+    data = await reader.readexactly(length)
+    packet_id, offset = decode_varint(data)
+    return packet_id, data[offset:]
+
+
+def description_text(description: Union[str, dict, list, None]) -> str:
+    """Flattens a status description (a string or a chat component with extras) into plain text"""
+    if description is None:
+        return ""
+    if isinstance(description, str):
+        return COLOUR_RE.sub("", description)
+    if isinstance(description, list):
+        return "".join(description_text(part) for part in description)
+    return description_text(description.get("text", "")) + description_text(description.get("extra", []))
+
+
+class ServerStatus:
+    def __init__(self, host: str, port: int, online: bool, version: str = None, protocol: int = None,
+                 players_online: int = None, players_max: int = None, motd: str = None, latency_ms: float = None,
+                 error: str = None):
+        """The answer of one server list ping, offline servers carry the error instead"""
+        self.host = host
+        self.port = port
+        self.online = online
+        self.version = version
+        self.protocol = protocol
+        self.players_online = players_online
+        self.players_max = players_max
+        self.motd = motd
+        self.latency_ms = latency_ms
+        self.error = error
+        self.timestamp = time.time()
+        self._checked = time.monotonic()
+
+    @property
+    def age(self) -> float:
+        """Seconds since the ping answered"""
+        return time.monotonic() - self._checked
+
+    @classmethod
+    def from_response(cls, host: str, port: int, response: dict, latency_ms: float) -> "ServerStatus":
+        version = response.get("version") or {}
+        players = response.get("players") or {}
+        return cls(host, port, True, version.get("name"), version.get("protocol"), players.get("online"),
+                   players.get("max"), description_text(response.get("description")), latency_ms)
+
+    def to_dict(self) -> dict:
+        return {"host": self.host, "port": self.port, "online": self.online, "version": self.version,
+                "protocol": self.protocol, "players_online": self.players_online, "players_max": self.players_max,
+                "motd": self.motd, "latency_ms": self.latency_ms, "error": self.error, "timestamp": self.timestamp}
+
+    def __repr__(self):
+        if not self.online:
+            return f"ServerStatus({self.host}:{self.port} offline {self.error})"
+        return (f"ServerStatus({self.host}:{self.port} {self.version} {self.players_online}/{self.players_max} "
+                f"{self.latency_ms:.1f}ms)")
+
+
+async def status_ping(host: str, port: int = 25565, timeout: float = 2.0) -> ServerStatus:
+    """
+    Asks a server for its status with the server list ping, the same request the multiplayer screen sends
+    Needs no server.properties setting, any 1.7+ server answers on its game port
+    The latency is the round trip of the ping packet sent after the status, or of the status request itself for
+    servers that close the connection without answering the ping
+    :param timeout: Seconds the whole exchange may take
+    :raises OSError: If the server cant be reached or closes the connection early
+    :raises asyncio.TimeoutError: If the server doesnt answer within timeout
+    :raises ValueError: If the answer isnt a status response
+    """
+    return await asyncio.wait_for(_status_ping(host, port), timeout=timeout)
+
+
+async def _status_ping(host: str, port: int) -> ServerStatus:
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        handshake = (encode_varint(STATUS_PROTOCOL_VERSION) + encode_string(host) + struct.pack(">H", port)
+                     + encode_varint(STATE_STATUS))
+        # both packets go out in one write, the server reads them in order
+        writer.write(encode_frame(PACKET_HANDSHAKE, handshake) + encode_frame(PACKET_STATUS_REQUEST))
+        sent = time.perf_counter()
+        await writer.drain()
+        packet_id, payload = await read_frame(reader)
+        latency_ms = (time.perf_counter() - sent) * 1000
+        if packet_id != PACKET_STATUS_REQUEST:
+            raise ValueError(f"Expected a status response, got packet {packet_id:#x}")
+        length, offset = decode_varint(payload)
+        response = json.loads(payload[offset:offset + length].decode("utf-8"))
+        if not isinstance(response, dict):
+            raise ValueError("Status response is not a json object")
+
+        token = int(time.monotonic_ns() & 0x7FFFFFFFFFFFFFFF)
+        writer.write(encode_frame(PACKET_PING, struct.pack(">q", token)))
+        sent = time.perf_counter()
+        try:
+            await writer.drain()
+            packet_id, payload = await read_frame(reader, max_length=16)
+            if packet_id == PACKET_PING and payload == struct.pack(">q", token):
+                latency_ms = (time.perf_counter() - sent) * 1000
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            # some proxies and old servers close after the status, its round trip is kept as the latency
+            pass
+        return ServerStatus.from_response(host, port, response, latency_ms)
+    finally:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+
+
+class StatusScanner:
+    def __init__(self, ttl: float = 5.0, timeout: float = 2.0, concurrency: int = 256):
+        """
+        Polls many servers with the server list ping at once, caching each answer for ttl seconds so dashboards and
+        liveness checks reuse recent answers instead of connecting again
+        Concurrent requests for the same server share one ping
+        :param ttl: Seconds an answer is served from the cache, offline answers included
+        :param timeout: Seconds each ping may take, a server that takes longer is reported offline
+        :param concurrency: How many pings are open at once, bounds the sockets a large scan uses
+        """
+        self.ttl = ttl
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self._cache = {}
+        # pings running per event loop, keyed by (loop, host, port)
+        self._in_flight = {}
+        self._semaphores = {}
+
+    def cached(self, host: str, port: int = 25565, max_age: float = None) -> Optional[ServerStatus]:
+        """Returns the cached answer of a server if it is younger than max_age (defaults to the ttl)"""
+        status = self._cache.get((host, port))
+        if status is None or status.age > (self.ttl if max_age is None else max_age):
+            return None
+        return status
+
+    async def status(self, host: str, port: int = 25565, max_age: float = None) -> ServerStatus:
+        """
+        Returns the status of a server, from the cache if fresh enough, never raises for an unreachable server
+        :param max_age: Seconds a cached answer may be old, defaults to the ttl, 0 always pings
+        """
+        status = self.cached(host, port, max_age)
+        if status is not None:
+            return status
+        loop = asyncio.get_running_loop()
+        in_flight_key = (loop, host, port)
+        ping = self._in_flight.get(in_flight_key)
+        if ping is None:
+            ping = asyncio.ensure_future(self._ping(host, port))
+            self._in_flight[in_flight_key] = ping
+            ping.add_done_callback(lambda _: self._in_flight.pop(in_flight_key, None))
+        # shielded so one caller being cancelled doesnt cancel the ping for the others
+        return await asyncio.shield(ping)
+
+    async def scan(self, targets: Iterable[tuple[str, int]], max_age: float = None) -> dict:
+        """
+        Gets the status of many servers concurrently
+        :param targets: (host, port) of every server
+        :return: A dict of (host, port): ServerStatus
+        """
+        targets = list(dict.fromkeys(targets))
+        started = time.perf_counter()
+        results = await asyncio.gather(*[self.status(host, port, max_age) for host, port in targets])
+        logger.debug(f"Scanned {len(targets)} servers in {time.perf_counter() - started:.2f}s, "
+                     f"{sum(status.online for status in results)} online")
+        return dict(zip(targets, results))
+
+    def invalidate(self, host: str = None, port: int = None):
+        """Drops the cached answer of a server, or of every server when no host is given"""
+        if host is None:
+            self._cache.clear()
+        else:
+            self._cache.pop((host, port or 25565), None)
+
+    async def _ping(self, host: str, port: int) -> ServerStatus:
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.concurrency)
+        async with semaphore:
+            try:
+                status = await status_ping(host, port, self.timeout)
+            except asyncio.TimeoutError:
+                status = ServerStatus(host, port, False, error=f"no answer in {self.timeout}s")
+            except (OSError, ValueError, asyncio.IncompleteReadError) as error:
+                status = ServerStatus(host, port, False, error=repr(error))
+        self._cache[(host, port)] = status
+        return status
+
+
+_default_scanner: Optional[StatusScanner] = None
+
+
+def get_status_scanner() -> StatusScanner:
+    """Returns the process wide status scanner"""
+    global _default_scanner
+    if _default_scanner is None:
+        _default_scanner = StatusScanner()
+    return _default_scanner
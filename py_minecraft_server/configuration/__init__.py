@@ -1,2 +1,5 @@
-from .properties_manager import PropertiesManager
+from .property_schema import (PropertyRule, BooleanRule, StringRule, EnumRule, IntegerRule, get_property_schema,
+                              refresh_property_schema)
+from .properties_document import PropertiesDocument
+from .properties_manager import PropertiesManager, PropertiesTransaction
 from .default_prop_scraper import scrape_property_config
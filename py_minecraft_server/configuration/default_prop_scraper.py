@@ -1,20 +1,23 @@
 from py_minecraft_server import logger
+from py_minecraft_server.configuration.property_schema import BooleanRule, StringRule, IntegerRule
 from py_minecraft_server.utils import soupify_url
 import math
 import re
 
 
 def scrape_property_config(is_java_edition: bool = True):
-    """Retrieve property's, their types defaults and descriptions from the minecraft wiki"""
+    """
+    Retrieve property's, their types defaults and descriptions from the minecraft wiki
+    Only used to refresh the property schema, see refresh_property_schema, everything else reads get_property_schema
+    """
     def get_value_config(type_str: str, default_str: str) -> dict:
         """Retrieves the value configuration only works on java"""
         type_str = type_str.lower().strip()
         default_str = default_str.strip()
         if type_str in ["boolean", "bool"]:
-            return {"type": bool, "default": default_str in ["true"],
-                    "validator": lambda boolean: isinstance(boolean, bool)}
+            return {"type": bool, "default": default_str in ["true"], "validator": BooleanRule()}
         elif type_str in ["string", "str"]:
-            return {"type": str, "default": default_str, "validator": lambda string: isinstance(string, str)}
+            return {"type": str, "default": default_str, "validator": StringRule()}
         elif type_str.split()[0] == "integer":
             int_search = re.search(
                 r"\((?P<min>\d+)\W((?P<simple_max>\d+)|\((?P<base>\d+)\^(?P<exponent>\d+)\s*-\s*(?P<subtract>\d+))",
@@ -27,13 +30,13 @@ def scrape_property_config(is_java_edition: bool = True):
                 int_subtract = int_search.group("subtract")
                 if int_exponent:
                     return {"type": int, "default": int(default_str),
-                            "validator": lambda num: int(int_min) <= num <= int(
-                                math.pow(int(int_base), int(int_exponent)) - int(int_subtract))}
+                            "validator": IntegerRule(int(int_min), int(
+                                math.pow(int(int_base), int(int_exponent)) - int(int_subtract)))}
                 return {"type": int, "default": int(default_str),
-                        "validator": lambda num: int(int_min) <= num <= int(int_simple_max)}
-            return {"type": int, "default": int(default_str), "validator": lambda num: isinstance(num, int)}
+                        "validator": IntegerRule(int(int_min), int(int_simple_max))}
+            return {"type": int, "default": int(default_str), "validator": IntegerRule()}
         elif type_str == "[more information needed]":
-            return {"type": str, "default": None, "validator": None}
+            return {"type": str, "default": None, "validator": StringRule()}
         raise ValueError(f"{type_str} not found to be of any type")
 
     wiki_soup = soupify_url(r"https://minecraft.fandom.com/wiki/Server.properties").find_all(
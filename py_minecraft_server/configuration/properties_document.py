@@ -0,0 +1,90 @@
+import re
+from typing import Optional
+
+ESCAPES = {"t": "\t", "n": "\n", "r": "\r", "f": "\f"}
+ESCAPE_RE = re.compile(r"\\(u[0-9a-fA-F]{4}|.)")
+
+
+def unescape_value(raw: str) -> str:
+    """Undoes java .properties escaping, minecraft writes level-type=minecraft\\:normal"""
+    if "\\" not in raw:
+        return raw
+
+    def replace(match: re.Match) -> str:
+        escaped = match.group(1)
+        if escaped[0] == "u" and len(escaped) == 5:
+            return chr(int(escaped[1:], 16))
+        return ESCAPES.get(escaped, escaped)
+    return ESCAPE_RE.sub(replace, raw)
+
+
+def escape_value(value: str) -> str:
+    """Escapes a value the way minecraft writes server.properties"""
+    value = value.replace("\\", "\\\\").replace("\n", "\\n").replace("\r", "\\r").replace("\t", "\\t")
+    return value.replace(":", "\\:").replace("=", "\\=")
+
+
+def format_value(value) -> str:
+    """Converts a python value into the text minecraft expects"""
+    if isinstance(value, bool):
+        return str(value).lower()
+    return "" if value is None else str(value)
+
+
+class PropertiesDocument:
+    def __init__(self, lines: list = None):
+        """
+        An ordered, parsed server.properties file which keeps comments, blank lines and line positions
+        Each line is stored as [key, value, raw line], key and value are None for comments and blank lines
+        """
+        self.lines = lines or []
+        self.positions = {line[0]: position for position, line in enumerate(self.lines) if line[0] is not None}
+
+    @classmethod
+    def parse(cls, text: str) -> "PropertiesDocument":
+        lines = []
+        for raw_line in text.splitlines():
+            stripped = raw_line.strip()
+            if not stripped or stripped[0] in "#!" or "=" not in stripped:
+                lines.append([None, None, raw_line])
+                continue
+            key, _, raw_value = stripped.partition("=")
+            lines.append([key.strip(), unescape_value(raw_value.strip()), raw_line])
+        return cls(lines)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.positions
+
+    def __iter__(self):
+        return iter(self.positions)
+
+    def __len__(self):
+        return len(self.positions)
+
+    def get(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        position = self.positions.get(key)
+        return default if position is None else self.lines[position][1]
+
+    def set(self, key: str, value: str) -> bool:
+        """Sets a value, appending the key if its new, returns True if the document changed"""
+        position = self.positions.get(key)
+        if position is None:
+            self.positions[key] = len(self.lines)
+            self.lines.append([key, value, None])
+            return True
+        if self.lines[position][1] == value:
+            return False
+        # the raw line is dropped so render rebuilds it
+        self.lines[position] = [key, value, None]
+        return True
+
+    def as_dict(self) -> dict:
+        return {key: self.lines[position][1] for key, position in self.positions.items()}
+
+    def copy(self) -> "PropertiesDocument":
+        return PropertiesDocument([list(line) for line in self.lines])
+
+    def render(self) -> str:
+        """Renders the document, untouched lines are written back exactly as they were read"""
+        return "".join(f"{line[2] if line[2] is not None else f'{line[0]}={escape_value(line[1])}'}\n"
+                       for line in self.lines)
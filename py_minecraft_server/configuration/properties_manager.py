@@ -1,12 +1,79 @@
 from py_minecraft_server import logger
-import py_minecraft_server.configuration
+from py_minecraft_server.logging import profiled
+from py_minecraft_server.configuration.properties_document import PropertiesDocument, format_value
+from py_minecraft_server.configuration.property_schema import get_property_schema
+import contextlib
 import os
+import shutil
+import tempfile
+import threading
+
+
+def validate_document(document: PropertiesDocument, keys: set, location: str):
+    """Checks values against the property schema, raising one ValueError listing all failures"""
+    schema = get_property_schema()
+    invalid = [f"{key}={document.get(key)!r}" for key in sorted(keys)
+               if key in schema and not schema[key]["validator"](document.get(key))]
+    if invalid:
+        raise ValueError(f"Invalid properties for {location}: {', '.join(invalid)}")
+
+
+class PropertiesTransaction:
+    def __init__(self, document: PropertiesDocument, add_properties: bool, ignore_errors: bool):
+        """A batch of edits applied to a copy of the parsed document, see PropertiesManager.transaction"""
+        self.document = document
+        self.add_properties = add_properties
+        self.ignore_errors = ignore_errors
+        self.changed = set()
+
+    def __getitem__(self, key: str) -> str:
+        value = self.document.get(self.resolve_key(key))
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: str, value):
+        self.set(key, value)
+
+    def __contains__(self, key: str) -> bool:
+        return self.resolve_key(key) in self.document
+
+    def get(self, key: str, default: str = None) -> str:
+        return self.document.get(self.resolve_key(key), default)
+
+    def set(self, key: str, value):
+        """Stages a change, keys can be given as property tags (rcon.port) or dict keys (rcon_port)"""
+        property_tag = self.resolve_key(key)
+        if property_tag not in self.document:
+            if not self.add_properties:
+                if not self.ignore_errors:
+                    raise ValueError(f"Property {key} not in server.properties")
+                logger.warning(f"Ignoring value {key} as it does not appear in server.properties")
+                return
+        if self.document.set(property_tag, format_value(value)):
+            logger.debug(f"Changing property {property_tag} to {value}")
+            self.changed.add(property_tag)
+
+    def update(self, **new_properties):
+        for key, value in new_properties.items():
+            self.set(key, value)
+
+    def resolve_key(self, key: str) -> str:
+        """Converts the dict key of word_word to the property tag of word-word or word.word used in the file"""
+        if key in self.document or "_" not in key:
+            return key
+        for property_tag in (key.replace("_", "-"), key.replace("_", ".")):
+            if property_tag in self.document:
+                return property_tag
+        return key.replace("_", "-")
 
 
 class PropertiesManager:
     def __init__(self, server_location: str, backup_filename: str = "backup.properties"):
         """
         A manager of the server.properties file
+        The file is parsed once and only re-parsed when its mtime or size changes, edits are batched into a single
+        validated write
         :param server_location: The location of the server dir
         :param backup_filename: The name of the backup file, defaults to backup.properties
         """
@@ -18,15 +85,111 @@ class PropertiesManager:
             raise ValueError(f"{self.properties_file_location} does not point to a file")
         if not os.path.basename(self.properties_file_location) == "server.properties":
             raise ValueError(f"{self.properties_file_location} does not appear to point to a server.properties file")
+        self._document = None
+        self._text = None
+        self._stat_key = None
+        self._lock = threading.RLock()
+
+    @property
+    def default_property_config(self) -> dict:
+        """The property schema of key: {type, default, validator, description}, loaded once per process"""
+        return get_property_schema()
 
-        # saves a dict of the properties retrieved from the internet
-        self.default_property_config = py_minecraft_server.configuration.scrape_property_config()
+    def _load(self) -> PropertiesDocument:
+        """Returns the parsed document, re-parsing only if the file changed since it was last read"""
+        with self._lock:
+            stat = os.stat(self.properties_file_location)
+            stat_key = (stat.st_mtime_ns, stat.st_size)
+            if self._document is None or stat_key != self._stat_key:
+                with open(self.properties_file_location) as reader:
+                    self._text = reader.read()
+                self._document = PropertiesDocument.parse(self._text)
+                self._stat_key = stat_key
+                logger.debug(f"Parsed {len(self._document)} properties from {self.properties_file_location}")
+            return self._document
 
     def get_properties(self) -> dict:
         """Returns a dict of the properties in the server.properties file"""
-        return {line.split("=")[0]: line.split("=")[1].strip() for line in
-                open(self.properties_file_location).readlines() if "=" in line}
+        return self._load().as_dict()
+
+    def get_property(self, key: str, typed: bool = True):
+        """
+        Returns a single property
+        :param key: The property tag or its dict key
+        :param typed: Convert the value to the type in the property schema, unknown properties stay strings
+        """
+        document = self._load()
+        property_tag = PropertiesTransaction(document, False, False).resolve_key(key)
+        if property_tag not in document:
+            raise KeyError(key)
+        if typed:
+            return self._typed_value(property_tag, document.get(property_tag))
+        return document.get(property_tag)
+
+    def get_typed_properties(self) -> dict:
+        """Returns a dict of the properties with values converted to the types in the property schema"""
+        return {key: self._typed_value(key, value) for key, value in self._load().as_dict().items()}
+
+    def _typed_value(self, property_tag: str, value: str):
+        config = self.default_property_config.get(property_tag)
+        if config is not None:
+            try:
+                return config["validator"].coerce(value)
+            except (TypeError, ValueError):
+                logger.warning(f"Property {property_tag}={value} does not match the schema, returning it as text")
+        return value
 
+    @contextlib.contextmanager
+    def transaction(self, add_properties: bool = False, ignore_errors: bool = False, validate: bool = True):
+        """
+        Batches edits into one validation pass and one atomic write, the file is untouched if nothing changed
+            with manager.transaction() as properties:
+                properties["enable-rcon"] = True
+                properties["rcon_port"] = 25576
+        :param add_properties: If true will allow keywords that arent already in the server.properties file to be set
+        :param ignore_errors: If true will ignore any keys that arent in the server.properties file
+        :param validate: Check changed values against the property schema before writing
+        """
+        with self._lock:
+            document = self._load()
+            original_text = self._text
+            transaction = PropertiesTransaction(document.copy(), add_properties, ignore_errors)
+            yield transaction
+            if not transaction.changed:
+                logger.debug(f"No changes to {self.properties_file_location}, not rewriting it")
+                return
+            if validate:
+                self._validate(transaction.document, transaction.changed)
+            self._write(transaction.document, original_text)
+            logger.info(f"Properties file {self.properties_file_location} updated {sorted(transaction.changed)} "
+                        f"backup saved to {self.backup_location}")
+
+    @classmethod
+    def create(cls, server_location: str, properties: dict = None, validate: bool = True,
+               backup_filename: str = "backup.properties") -> "PropertiesManager":
+        """
+        Writes a new server.properties of every schema default with properties applied over them, what the server
+        writes on its first boot, so a server can be configured before it has ever run
+        :param properties: Values to use instead of the defaults, keyed by property tag or dict key
+        :param validate: Check the values against the property schema before writing
+        """
+        properties_file_location = os.path.join(server_location, "server.properties")
+        if os.path.exists(properties_file_location):
+            raise ValueError(f"{properties_file_location} already exists")
+        schema = get_property_schema()
+        document = PropertiesDocument([[None, None, "#Minecraft server properties"]]
+                                      + [[key, format_value(config["default"]), None]
+                                         for key, config in sorted(schema.items())])
+        transaction = PropertiesTransaction(document, add_properties=True, ignore_errors=False)
+        transaction.update(**(properties or {}))
+        if validate:
+            validate_document(document, set(document), properties_file_location)
+        cls._atomic_write(properties_file_location, document.render())
+        logger.debug(f"Templated {properties_file_location} with {len(document)} properties, "
+                     f"{len(transaction.changed)} changed from the defaults")
+        return cls(server_location, backup_filename)
+
+    @profiled("set_properties")
     def set_properties(self, add_properties: bool = False, ignore_errors: bool = False, **new_properties):
         """
         Accepts keyword input of properties to change can be done as kwargs or as a **{dict}
@@ -34,46 +197,39 @@ class PropertiesManager:
         :param ignore_errors: If true will ignore any keys that arent in the server.properties file BUT will not
             write them to the server.properties file unless add_properties is True"""
         logger.debug(f"Changing properties in {self.properties_file_location} to {new_properties}")
-        properties = self.get_properties()
-
-        # backup server.properties file
-        old_lines = open(self.properties_file_location).readlines()
-        open(self.backup_location, "w").writelines(old_lines)
-
-        for prop_key, prop_val in new_properties.items():
-            # TODO: Check to ensure this method of value replacing works
-            if self.__dict_to_property_tag(prop_key) not in properties:
-                if not add_properties:
-                    if not ignore_errors:
-                        raise ValueError(f"Property {prop_key} not in server.properties")
-                    logger.warning(f"Ignoring value {prop_key} as it does not appear in server.properties")
-            else:
-                logger.debug(f"Changing property {prop_key} to {prop_val} in {self.properties_file_location}")
-                properties[prop_key] = prop_val
-        # TODO: Apply validation afterwords
-        # TODO: Get default values from internet? from something
-
-        # save changes
-        new_lines = [f"{line.split('=')[0]}={properties[line.split('=')[0]]}\n" if '=' in line else f"{line.strip()}\n"
-                     for line in old_lines]
-        open(self.properties_file_location, "w").writelines(new_lines)
-        logger.info(f"Properties file {self.properties_file_location} updated backup saved to {self.backup_location}")
+        with self.transaction(add_properties, ignore_errors) as transaction:
+            transaction.update(**new_properties)
 
     def revert_to_backup(self):
         """Reverts the server.properties file to its most recent backup"""
-        backup_lines = open(self.backup_location).readlines()
-        open(self.properties_file_location, "w").writelines(backup_lines)
-        logger.debug(f"Reverted to backup properties file from {self.backup_location}")
-        os.remove(self.backup_location)
+        with self._lock:
+            with open(self.backup_location) as reader:
+                self._atomic_write(self.properties_file_location, reader.read())
+            self._document = None
+            logger.debug(f"Reverted to backup properties file from {self.backup_location}")
+            os.remove(self.backup_location)
 
-    @staticmethod
-    def __dict_to_property_tag(dict_key: str) -> tuple[str, str]:
-        """Converts the dict key of word_word to a property key of word-word or word.word"""
-        return dict_key.replace("_", "-"), dict_key.replace("_", ".")
+    def _validate(self, document: PropertiesDocument, keys: set):
+        validate_document(document, keys, self.properties_file_location)
+
+    def _write(self, document: PropertiesDocument, original_text: str):
+        text = document.render()
+        self._atomic_write(self.backup_location, original_text)
+        self._atomic_write(self.properties_file_location, text)
+        stat = os.stat(self.properties_file_location)
+        self._document, self._text, self._stat_key = document, text, (stat.st_mtime_ns, stat.st_size)
 
     @staticmethod
-    def __property_tag_to_dict_key(property_tag: str) -> str:
-        """Convert the property tag of word.word or word-word to a dict key of word_word"""
-        if "." in property_tag:
-            return property_tag.replace(".", "_")
-        return property_tag.replace("-", "_")
+    def _atomic_write(location: str, text: str):
+        """Writes to a temp file in the same dir and renames it over location"""
+        handle, temp_location = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(os.path.abspath(location)))
+        try:
+            with os.fdopen(handle, "w") as writer:
+                writer.write(text)
+            if os.path.exists(location):
+                shutil.copymode(location, temp_location)
+            os.replace(temp_location, location)
+        except BaseException:
+            if os.path.exists(temp_location):
+                os.remove(temp_location)
+            raise
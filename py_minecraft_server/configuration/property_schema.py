@@ -0,0 +1,173 @@
+from py_minecraft_server import logger
+from py_minecraft_server.utils import get_cache_dir
+import functools
+import json
+import os
+import tempfile
+
+SCHEMA_VERSION = 1
+BUNDLED_SCHEMA_LOCATION = os.path.join(os.path.dirname(__file__), "server_properties_java.json")
+
+
+class PropertyRule:
+    """A data driven, picklable validator for a single server.properties value"""
+    kind = None
+    type = str
+
+    def coerce(self, value):
+        """Converts a value as written in server.properties to this rule's python type"""
+        return value
+
+    def validate(self, value) -> bool:
+        return True
+
+    def __call__(self, value) -> bool:
+        try:
+            return self.validate(self.coerce(value))
+        except (TypeError, ValueError):
+            return False
+
+    def to_dict(self) -> dict:
+        return {"kind": self.kind, **{key: value for key, value in vars(self).items()}}
+
+    def __eq__(self, other):
+        return isinstance(other, PropertyRule) and self.to_dict() == other.to_dict()
+
+    def __hash__(self):
+        return hash(json.dumps(self.to_dict(), sort_keys=True))
+
+    def __repr__(self):
+        arguments = ", ".join(f"{key}={value!r}" for key, value in vars(self).items())
+        return f"{self.__class__.__name__}({arguments})"
+
+
+class BooleanRule(PropertyRule):
+    kind = "boolean"
+    type = bool
+
+    def coerce(self, value):
+        if isinstance(value, bool):
+            return value
+        if isinstance(value, str) and value.strip().lower() in ("true", "false"):
+            return value.strip().lower() == "true"
+        raise ValueError(f"{value!r} is not a boolean")
+
+    def validate(self, value) -> bool:
+        return isinstance(value, bool)
+
+
+class StringRule(PropertyRule):
+    kind = "string"
+
+    def coerce(self, value):
+        if isinstance(value, bool):
+            return str(value).lower()
+        return value if isinstance(value, str) else str(value)
+
+    def validate(self, value) -> bool:
+        return isinstance(value, str)
+
+
+class EnumRule(StringRule):
+    kind = "enum"
+
+    def __init__(self, choices: list):
+        self.choices = list(choices)
+
+    def validate(self, value) -> bool:
+        return value.strip().lower() in self.choices
+
+
+class IntegerRule(PropertyRule):
+    kind = "integer"
+    type = int
+
+    def __init__(self, minimum: int = None, maximum: int = None):
+        self.minimum = minimum
+        self.maximum = maximum
+
+    def coerce(self, value):
+        if isinstance(value, bool):
+            raise ValueError(f"{value!r} is not an integer")
+        return int(value.strip()) if isinstance(value, str) else int(value)
+
+    def validate(self, value) -> bool:
+        return (self.minimum is None or value >= self.minimum) and (self.maximum is None or value <= self.maximum)
+
+
+RULE_KINDS = {rule.kind: rule for rule in (BooleanRule, StringRule, EnumRule, IntegerRule)}
+
+
+def rule_from_dict(rule_dict: dict) -> PropertyRule:
+    """Builds a rule from its to_dict form"""
+    arguments = dict(rule_dict)
+    try:
+        return RULE_KINDS[arguments.pop("kind")](**arguments)
+    except KeyError:
+        raise ValueError(f"Unknown property rule {rule_dict}") from None
+
+
+def schema_to_json(property_config: dict, minecraft_version: str = None, is_java_edition: bool = True) -> dict:
+    """Serializes a property config (as returned by get_property_schema) to its json form"""
+    return {"schema_version": SCHEMA_VERSION, "minecraft_version": minecraft_version,
+            "edition": "java" if is_java_edition else "bedrock",
+            "properties": {key: {"default": config["default"], "rule": config["validator"].to_dict(),
+                                 "description": config["description"]}
+                           for key, config in property_config.items()}}
+
+
+def schema_from_json(schema_json: dict) -> dict:
+    """Builds a property config of key: {type, default, validator, description} from its json form"""
+    if schema_json.get("schema_version") != SCHEMA_VERSION:
+        raise ValueError(f"Unsupported property schema version {schema_json.get('schema_version')}")
+    property_config = {}
+    for key, config in schema_json["properties"].items():
+        rule = rule_from_dict(config["rule"])
+        property_config[key] = {"type": rule.type, "default": config["default"], "validator": rule,
+                                "description": config["description"]}
+    return property_config
+
+
+def get_refreshed_schema_location(is_java_edition: bool = True) -> str:
+    """The location a refreshed schema is saved to, it takes priority over the bundled schema when present"""
+    return os.path.join(get_cache_dir("schema"), f"server_properties_{'java' if is_java_edition else 'bedrock'}.json")
+
+
+@functools.lru_cache(maxsize=None)
+def get_property_schema(is_java_edition: bool = True) -> dict:
+    """
+    Returns the server.properties schema of key: {type, default, validator, description}
+    Loaded once per process from a refreshed copy if one exists, otherwise from the schema bundled with the library
+    """
+    if not is_java_edition:
+        raise ValueError("Only the java edition property schema is available")
+    for location in (get_refreshed_schema_location(is_java_edition), BUNDLED_SCHEMA_LOCATION):
+        try:
+            with open(location) as reader:
+                schema = schema_from_json(json.load(reader))
+        except (OSError, ValueError) as error:
+            if location == BUNDLED_SCHEMA_LOCATION:
+                raise
+            if os.path.exists(location):
+                logger.warning(f"Ignoring unreadable property schema @{location} ({error})")
+            continue
+        logger.debug(f"Loaded {len(schema)} property definitions from {location}")
+        return schema
+
+
+def refresh_property_schema(location: str = None, is_java_edition: bool = True) -> str:
+    """
+    Scrapes the minecraft wiki for the current property table and saves it as the refreshed schema
+    :param location: Where to save the schema, defaults to the refreshed schema location
+    :return: The location the schema was saved to
+    """
+    from py_minecraft_server.configuration.default_prop_scraper import scrape_property_config
+    location = location or get_refreshed_schema_location(is_java_edition)
+    schema_json = schema_to_json(scrape_property_config(is_java_edition), is_java_edition=is_java_edition)
+    handle, temp_location = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(os.path.abspath(location)))
+    with os.fdopen(handle, "w") as writer:
+        json.dump(schema_json, writer, indent=2)
+    os.replace(temp_location, location)
+    get_property_schema.cache_clear()
+    logger.info(f"Saved {len(schema_json['properties'])} property definitions to {location}")
+    return location
@@ -1 +1,4 @@
-from .download import download_jar, copy_file, thread_download
+from .jar_cache import JarCache, get_jar_cache, set_jar_cache, link_file
+from .downloader import download_file, BandwidthLimiter
+from .download import download_jar, fetch_jar, copy_file
+from .create_server import create_server, create_servers, write_eula
@@ -1,22 +1,156 @@
 from py_minecraft_server import logger
-from py_minecraft_server.utils import validate_version
+from py_minecraft_server.logging import profiled
+from py_minecraft_server.configuration import PropertiesManager
+from py_minecraft_server.utils import get_version_index, select_java, validate_version
 import py_minecraft_server.creation
 import asyncio
+import contextlib
 import os
+import random
+import string
+import time
+from typing import Iterable
 
+EULA_FILENAME = "eula.txt"
 
+
+@contextlib.contextmanager
+def _timed(timings: dict, stage: str):
+    """Records the seconds a stage took into timings"""
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        timings[stage] = time.monotonic() - started
+
+
+def write_eula(server_location: str, accept: bool = True):
+    """Writes the eula.txt the server otherwise writes and stops on during its first boot"""
+    with open(os.path.join(server_location, EULA_FILENAME), "w") as writer:
+        writer.write("#By changing the setting below to TRUE you are indicating your agreement to our EULA "
+                     f"(https://aka.ms/MinecraftEULA).\neula={str(accept).lower()}\n")
+    if accept:
+        logger.info(f"Accepted the Minecraft EULA (https://aka.ms/MinecraftEULA) for {server_location}")
+
+
+def resolve_java(server_version: str, is_forge: bool = False) -> str:
+    """Returns the location of an installed java that runs server_version, falling back to "java" on the PATH"""
+    required_major = get_version_index().java_version(server_version)
+    try:
+        # forge before 1.17 patches java 8 internals and breaks on newer javas
+        runtime = select_java(required_major, exact=is_forge and required_major == 8)
+    except ValueError as error:
+        logger.warning(f"{error}, falling back to java on the PATH")
+        return "java"
+    logger.info(f"Version {server_version} needs java {required_major}, using {runtime}")
+    return runtime.location
+
+
+@profiled("create_server")
 async def create_server(server_location: str, server_version: str, jar_save_location: str = None,
-                        is_forge: bool = False, java_ref: str = "java"):
-    server_version = validate_version(server_version, is_forge)
+                        is_forge: bool = False, java_ref: str = None, properties: dict = None,
+                        accept_eula: bool = True, first_boot: bool = False, ram_allocation: int = 2,
+                        boot_timeout: float = 300.0, pregen_radius: int = None,
+                        boot_semaphore: asyncio.Semaphore = None) -> dict:
+    """
+    Creates a server ready to start, running independent stages concurrently:
+    the version is resolved, then the java is found, the jar is fetched through the jar cache and eula.txt and
+    server.properties are written all at once, then optionally the server boots once to generate its world
+    :param server_location: The server dir to create, must not exist
+    :param server_version: The minecraft version
+    :param jar_save_location: Also place the server jar here
+    :param is_forge: Create a forge server, the jar is the forge installer
+    :param java_ref: The java to run the server with, None picks an installed java the version supports
+    :param properties: server.properties values to use instead of the schema defaults
+    :param accept_eula: Agree to the Minecraft EULA (https://aka.ms/MinecraftEULA) in eula.txt
+    :param first_boot: Start the server once and stop it when ready, generating the world and remaining files
+    :param ram_allocation: GB of heap for the first boot
+    :param boot_timeout: Seconds the first boot may take to become ready
+    :param pregen_radius: Pregenerate chunks within this many blocks of spawn during the first boot
+    :param boot_semaphore: Held during the first boot, to limit how many servers boot at once
+    :return: A dict of the server_location, version, java_ref and per stage timings in seconds
+    """
+    timings = {}
+    started = time.monotonic()
+    loop = asyncio.get_running_loop()
     if os.path.isdir(server_location):
         raise ValueError(f"{server_location} already exists")
+    if first_boot and is_forge:
+        raise ValueError("First boot is not supported for forge servers, run the forge installer first")
+    if pregen_radius is not None and not first_boot:
+        raise ValueError("Pregeneration needs first_boot")
+    with _timed(timings, "resolve_version"):
+        # the version index may hit the network so it runs off the loop
+        server_version = await loop.run_in_executor(None, validate_version, server_version, is_forge)
     os.makedirs(server_location)
     logger.debug(f"Created server dir @{server_location}")
-    if jar_save_location:
-        await py_minecraft_server.creation.download_jar(server_version, jar_save_location, is_forge,
-                                                        False, False, "java", *[server_location])
-    else:
-        await py_minecraft_server.creation.download_jar(server_version, server_location, is_forge)
 
-    # Call the server and preform inits
+    async def java_stage():
+        with _timed(timings, "resolve_java"):
+            # probing javas runs subprocesses
+            return java_ref or await loop.run_in_executor(None, resolve_java, server_version, is_forge)
+
+    async def jar_stage():
+        with _timed(timings, "fetch_jar"):
+            server_jar_location = os.path.join(server_location, "server.jar")
+            copy_locations = [jar_save_location] if jar_save_location else []
+            await py_minecraft_server.creation.download_jar(server_version, server_jar_location, is_forge, False,
+                                                            False, *copy_locations)
+
+    async def config_stage():
+        with _timed(timings, "write_config"):
+            write_eula(server_location, accept_eula)
+            server_properties = dict(properties or {})
+            if first_boot:
+                # the first boot is stopped over rcon
+                server_properties.setdefault("enable-rcon", True)
+                server_properties.setdefault("rcon.password", "".join(random.choice(string.ascii_letters)
+                                                                      for _ in range(16)))
+            await loop.run_in_executor(None, PropertiesManager.create, server_location, server_properties)
+
+    try:
+        java_ref, _, _ = await asyncio.gather(java_stage(), jar_stage(), config_stage())
+        if first_boot:
+            async with boot_semaphore or contextlib.AsyncExitStack():
+                with _timed(timings, "first_boot"):
+                    await _first_boot(server_location, ram_allocation, java_ref, boot_timeout, pregen_radius,
+                                      timings)
+    except BaseException:
+        logger.error(f"Creating server @{server_location} failed, partial files are left for inspection")
+        raise
+    timings["total"] = time.monotonic() - started
+    stage_timings = ", ".join(f"{stage}={seconds:.2f}s" for stage, seconds in timings.items())
+    logger.info(f"Created {'forge' if is_forge else 'vanilla'} {server_version} server @{server_location} in "
+                f"{timings['total']:.2f}s ({stage_timings})")
+    return {"server_location": server_location, "version": server_version, "is_forge": is_forge,
+            "java_ref": java_ref, "timings": timings}
+
+
+async def _first_boot(server_location: str, ram_allocation: int, java_ref: str, boot_timeout: float,
+                      pregen_radius: int, timings: dict):
+    # hosting imports creation (for the jar cache's link_file) so it is imported on use
+    from py_minecraft_server.hosting.host_server import ServerHost
+    host = ServerHost(server_location, ram_allocation, "server.jar", java_ref)
+    await host.start_server(ready_timeout=boot_timeout)
+    timings["first_boot_ready"] = host.time_to_ready
+    try:
+        if pregen_radius is not None:
+            with _timed(timings, "pregenerate"):
+                await host.pregenerate(pregen_radius)
+    finally:
+        await host.stop_server()
+
 
+async def create_servers(specs: Iterable[dict], max_concurrent_boots: int = 2) -> list:
+    """
+    Creates servers concurrently, each spec holds the keyword arguments of create_server
+    Servers of the same version share one jar download, first boots are limited to max_concurrent_boots at once
+    :return: The result of each create_server, or the exception it raised
+    """
+    boot_semaphore = asyncio.Semaphore(max_concurrent_boots)
+    started = time.monotonic()
+    results = await asyncio.gather(*[create_server(**spec, boot_semaphore=boot_semaphore) for spec in specs],
+                                   return_exceptions=True)
+    logger.info(f"Created {sum(not isinstance(result, BaseException) for result in results)}/{len(results)} "
+                f"servers in {time.monotonic() - started:.2f}s")
+    return results
@@ -1,26 +1,34 @@
-from py_minecraft_server.utils import validate_version, soupify_url, get_vanilla_url, get_forge_url
+from py_minecraft_server.utils import validate_version, get_version_index
 from py_minecraft_server import logger
+from py_minecraft_server.logging import profiled
+from py_minecraft_server.creation.downloader import download_file
+from py_minecraft_server.creation.jar_cache import JarCache, get_jar_cache, link_file
 import asyncio
-import threading
-import time
-import urllib.request
+import functools
 import os
 import shutil
 
+# downloads running per event loop, keyed by jar cache key, so concurrent requests for one jar share a download
+_in_flight = {}
 
+
+@profiled("download_jar")
 async def download_jar(version: str, save_location: str, is_forge: bool, create_dirs: bool = False,
-                       overwrite: bool = False, *copy_locations):
+                       overwrite: bool = False, *copy_locations, jar_cache: JarCache = None):
     """
-    Downloads a jar to the desired location
+    Downloads a jar to the desired location, jars are fetched once into the shared jar cache and linked from there
     :param version: The version of minecraft to get a server jar for
     :param save_location: The location to save the jar too
     :param is_forge: True if the jar is meant to be a forge jar
     :param create_dirs: Weather or not to make the directory if it doesnt exist
     :param overwrite: Delete a file in save_location if present
     :param copy_locations: Additional locations to copy the downloaded file to, create_dirs will apply to copy_locations
+    :param jar_cache: The cache to fetch through, defaults to the process wide cache
     """
-    # validate version and save location
-    version = validate_version(version)
+    # validate version and save location, the version index may hit the network so it runs off the loop
+    loop = asyncio.get_running_loop()
+    version = await loop.run_in_executor(None, validate_version, version, is_forge)
+    jar_cache = jar_cache or get_jar_cache()
     if not save_location.endswith(".jar"):
         raise ValueError(f"Illegal save location, must be a .jar file: {save_location}")
     if os.path.exists(save_location):
@@ -31,37 +39,57 @@ async def download_jar(version: str, save_location: str, is_forge: bool, create_
     if create_dirs:
         os.makedirs(os.path.dirname(save_location), exist_ok=True)
 
-    if is_forge:
-        try:
-            download_url = soupify_url(get_forge_url(version)).find(
-                "div", {"class": "link-boosted"}).find("a").get("href").split("url=")[1]
-        except AttributeError:
-            raise ValueError(f"Illegal forge version, no forge download for version {version}")
+    cached_location = await fetch_jar(version, is_forge, jar_cache)
+    link_file(cached_location, save_location)
+    for location in copy_locations:
+        link_file(cached_location, location, create_dirs)
+
+
+async def fetch_jar(version: str, is_forge: bool, jar_cache: JarCache = None) -> str:
+    """
+    Returns the cached location of a jar, downloading it into the cache if needed
+    Concurrent calls for the same jar wait on a single download
+    :param version: A validated version
+    """
+    jar_cache = jar_cache or get_jar_cache()
+    cached_location = jar_cache.lookup(version, is_forge)
+    if cached_location is not None:
+        logger.debug(f"Jar cache hit for {jar_cache.key(version, is_forge)}")
+        return cached_location
+    loop = asyncio.get_running_loop()
+    in_flight_key = (loop, jar_cache.cache_dir, jar_cache.key(version, is_forge))
+    download = _in_flight.get(in_flight_key)
+    if download is None:
+        download = asyncio.ensure_future(_fetch_into_cache(version, is_forge, jar_cache))
+        _in_flight[in_flight_key] = download
+        download.add_done_callback(lambda _: _in_flight.pop(in_flight_key, None))
     else:
-        download_url = soupify_url(get_vanilla_url(version)).find(
-            "a", {"download": f"minecraft_server-{version}.jar"}).get("href")
-    logger.debug(f"Async download started from {download_url} to {save_location}")
-    await thread_download(download_url, save_location)
-    if copy_locations:
-        logger.debug(f"Copying downloaded jar file to a server")
-        for location in copy_locations:
-            copy_file(save_location, location)
+        logger.debug(f"Joining the download of {jar_cache.key(version, is_forge)} already in flight")
+    # shielded so one caller being cancelled doesnt cancel the download for the others
+    return await asyncio.shield(download)
 
 
-async def thread_download(url: str, save_location: str):
-    """Threads a download from urllib.request.urlretreive"""
-    t = threading.Thread(target=urllib.request.urlretrieve, args=(url, save_location), daemon=True)
-    t.start()
-    start_time = time.time()
-    while t.is_alive():
-        await asyncio.sleep(1)
-    logger.debug(f"Download from {url} to {save_location} completed in {(time.time() - start_time):.2f}s")
+async def _fetch_into_cache(version: str, is_forge: bool, jar_cache: JarCache) -> str:
+    """Downloads a jar into the cache and returns its cached location"""
+    version_index = get_version_index()
+    loop = asyncio.get_running_loop()
+    if is_forge:
+        download_url, sha1 = await loop.run_in_executor(None, version_index.forge_installer_url, version), None
+    else:
+        download_url = await loop.run_in_executor(None, version_index.jar_url, version)
+        sha1 = version_index.jar_sha1(version)
+    staging_location = jar_cache.staging_path(version, is_forge)
+    logger.debug(f"Async download started from {download_url} to {staging_location}")
+    await download_file(download_url, staging_location, sha1=sha1)
+    # download_file has checked the sha1 when there is one, adding still hashes forge jars and writes the index
+    return await loop.run_in_executor(None, functools.partial(jar_cache.add, version, is_forge, staging_location,
+                                                              sha1=sha1, verified_sha1=sha1))
 
 
 def copy_file(src: str, dst: str, create_dirs: bool = False):
     """Copy a file from src to dst allowing for dirs to be created"""
     if create_dirs:
-        os.makedirs(os.path.basename(dst), exist_ok=True)
+        os.makedirs(os.path.dirname(os.path.abspath(dst)), exist_ok=True)
     if os.path.exists(dst):
         raise ValueError(f"Destination not empty {dst}")
     if not os.path.isfile(src):
@@ -0,0 +1,188 @@
+from py_minecraft_server import logger
+from py_minecraft_server.creation.jar_cache import file_sha1
+from py_minecraft_server.utils import AsyncHttpClient, get_async_http_client
+from py_minecraft_server.utils.http import backoff_delay
+import aiofiles
+import aiohttp
+import asyncio
+import json
+import os
+import time
+from typing import Callable, Optional
+
+BLOCK_SIZE = 64 * 1024
+STATE_SAVE_INTERVAL = 1024 * 1024
+
+
+class BandwidthLimiter:
+    def __init__(self, max_bytes_per_second: int):
+        """A token bucket shared by every chunk of a download, holds at most one second of burst"""
+        self.rate = max_bytes_per_second
+        self.tokens = float(max_bytes_per_second)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, amount: int):
+        """Waits until amount bytes may be transferred"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount or self.tokens >= self.rate:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((min(amount, self.rate) - self.tokens) / self.rate)
+
+
+class _Download:
+    """The shared state of one in progress download"""
+    def __init__(self, url: str, part_location: str, total: int, progress: Optional[Callable[[int, int], None]],
+                 limiter: Optional[BandwidthLimiter]):
+        self.url = url
+        self.part_location = part_location
+        self.state_location = f"{part_location}.json"
+        self.total = total
+        self.progress = progress
+        self.limiter = limiter
+        self.chunks = []
+        self.downloaded = 0
+
+    def plan(self, chunk_count: int, min_chunk_size: int):
+        """Loads resumable chunk positions from a previous attempt or splits the file into fresh chunks"""
+        try:
+            with open(self.state_location) as reader:
+                state = json.load(reader)
+            if state["url"] == self.url and state["total"] == self.total and \
+                    os.path.getsize(self.part_location) == self.total:
+                self.chunks = state["chunks"]
+                self.downloaded = sum(position - start for start, position, _ in self.chunks)
+                logger.debug(f"Resuming download of {self.url} at {self.downloaded}/{self.total} bytes")
+                return
+        except (OSError, ValueError, KeyError):
+            pass
+        chunk_count = max(1, min(chunk_count, self.total // max(min_chunk_size, 1)))
+        chunk_size = -(-self.total // chunk_count)
+        self.chunks = [[start, start, min(start + chunk_size, self.total)]
+                       for start in range(0, self.total, chunk_size)]
+        with open(self.part_location, "wb") as writer:
+            writer.truncate(self.total)
+        self.save_state()
+
+    def save_state(self):
+        with open(self.state_location, "w") as writer:
+            json.dump({"url": self.url, "total": self.total, "chunks": self.chunks}, writer)
+
+    async def transfer(self, response: aiohttp.ClientResponse, writer, chunk: Optional[list] = None):
+        """Streams a response body into writer, advancing chunk positions and reporting progress"""
+        unsaved = 0
+        async for block in response.content.iter_chunked(BLOCK_SIZE):
+            if chunk is not None:
+                block = block[:chunk[2] - chunk[1]]
+            if self.limiter:
+                await self.limiter.acquire(len(block))
+            await writer.write(block)
+            self.downloaded += len(block)
+            if chunk is not None:
+                chunk[1] += len(block)
+                unsaved += len(block)
+                if unsaved >= STATE_SAVE_INTERVAL:
+                    await writer.flush()
+                    self.save_state()
+                    unsaved = 0
+            if self.progress:
+                self.progress(self.downloaded, self.total or None)
+            if chunk is not None and chunk[1] >= chunk[2]:
+                break
+
+
+async def download_file(url: str, save_location: str, sha1: str = None, chunks: int = 4,
+                        min_chunk_size: int = 1024 * 1024, progress: Callable[[int, Optional[int]], None] = None,
+                        max_bytes_per_second: int = None, retries: int = 3, session: aiohttp.ClientSession = None,
+                        headers: dict = None) -> str:
+    """
+    Downloads url to save_location through save_location.part, resuming an earlier partial download if present
+    Servers that accept Range requests are downloaded in parallel chunks
+    :param url: The url to download
+    :param save_location: The final location of the file, only written once the download is complete and verified
+    :param sha1: The expected sha1 of the file, raises ValueError on a mismatch
+    :param chunks: The max number of parallel range requests
+    :param min_chunk_size: Files are never split into chunks smaller than this
+    :param progress: Called with (bytes downloaded, total bytes or None) as data arrives
+    :param max_bytes_per_second: A cap on the combined bandwidth of all chunks
+    :param retries: How many times a failed request is retried and a failed chunk resumed before giving up
+    :param session: The aiohttp session to use, defaults to the shared pooled session
+    :param headers: Extra headers sent with every request
+    """
+    part_location = f"{save_location}.part"
+    limiter = BandwidthLimiter(max_bytes_per_second) if max_bytes_per_second else None
+    # requests go through the shared client for its retries with backoff, over session if one is given
+    client = get_async_http_client()
+    start_time = time.perf_counter()
+    async with await client.request("HEAD", url, retries=retries, session=session, headers=headers,
+                                    allow_redirects=True) as response:
+        total = int(response.headers.get("Content-Length", 0)) if response.status == 200 else 0
+        supports_ranges = response.headers.get("Accept-Ranges", "").lower() == "bytes"
+    download = _Download(url, part_location, total, progress, limiter)
+    if total and supports_ranges:
+        download.plan(chunks, min_chunk_size)
+        await asyncio.gather(*[_fetch_chunk(client, session, download, chunk, headers, retries)
+                               for chunk in download.chunks if chunk[1] < chunk[2]])
+    else:
+        await _fetch_whole(client, session, download, headers, retries)
+    if total and download.downloaded != total:
+        raise ValueError(f"Download of {url} incomplete, got {download.downloaded}/{total} bytes")
+
+    if sha1:
+        actual_sha1 = await asyncio.get_running_loop().run_in_executor(None, file_sha1, part_location)
+        if actual_sha1 != sha1.lower():
+            _remove_partial(part_location)
+            raise ValueError(f"Download of {url} failed integrity check, expected sha1 {sha1} got {actual_sha1}")
+    os.replace(part_location, save_location)
+    _remove_partial(part_location, keep_part=True)
+    logger.debug(f"Download from {url} to {save_location} completed in {(time.perf_counter() - start_time):.2f}s")
+    return save_location
+
+
+async def _fetch_chunk(client: AsyncHttpClient, session: Optional[aiohttp.ClientSession], download: _Download,
+                       chunk: list, headers: Optional[dict], retries: int):
+    """Downloads one byte range of the file, resuming the range on errors"""
+    for attempt in range(retries + 1):
+        try:
+            range_headers = {**(headers or {}), "Range": f"bytes={chunk[1]}-{chunk[2] - 1}"}
+            async with await client.request("GET", download.url, retries=retries, session=session,
+                                            headers=range_headers) as response:
+                if response.status != 206:
+                    raise ValueError(f"Expected partial content for {download.url} got status {response.status}")
+                async with aiofiles.open(download.part_location, "r+b") as writer:
+                    await writer.seek(chunk[1])
+                    await download.transfer(response, writer, chunk)
+            download.save_state()
+            if chunk[1] >= chunk[2]:
+                return
+        except (aiohttp.ClientError, asyncio.TimeoutError) as error:
+            download.save_state()
+            if attempt == retries:
+                raise
+            delay = backoff_delay(attempt, client.backoff)
+            logger.warning(f"Chunk {chunk[0]}-{chunk[2]} of {download.url} failed ({error}), resuming in {delay:.2f}s")
+            await asyncio.sleep(delay)
+    raise ValueError(f"Chunk {chunk[0]}-{chunk[2]} of {download.url} ended early")
+
+
+async def _fetch_whole(client: AsyncHttpClient, session: Optional[aiohttp.ClientSession], download: _Download,
+                       headers: Optional[dict], retries: int):
+    """Downloads the file in one stream, for servers that dont support ranges"""
+    async with await client.request("GET", download.url, retries=retries, session=session,
+                                    headers=headers) as response:
+        if response.status != 200:
+            raise ValueError(f"Response status code not 200 for {download.url}")
+        async with aiofiles.open(download.part_location, "wb") as writer:
+            await download.transfer(response, writer)
+
+
+def _remove_partial(part_location: str, keep_part: bool = False):
+    """Removes the resume state and, unless keep_part, the partial file"""
+    for location in [f"{part_location}.json"] + ([] if keep_part else [part_location]):
+        if os.path.exists(location):
+            os.remove(location)
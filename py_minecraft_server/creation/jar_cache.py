@@ -0,0 +1,217 @@
+from py_minecraft_server import logger
+from py_minecraft_server.utils import get_cache_dir
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from typing import Optional
+
+# linux ioctl to share extents between two files on btrfs/xfs (cp --reflink)
+FICLONE = 0x40049409
+
+
+def file_sha1(path: str, block_size: int = 1 << 20) -> str:
+    """Returns the hex sha1 of a file, read in blocks"""
+    digest = hashlib.sha1()
+    with open(path, "rb") as reader:
+        for block in iter(lambda: reader.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def link_file(src: str, dst: str, create_dirs: bool = False, allow_hardlink: bool = True) -> str:
+    """
+    Places src at dst without duplicating data where the filesystem allows it
+    Tries a hardlink, then a reflink, then falls back to a full copy
+    :param allow_hardlink: False when dst must not change with src, for snapshots of files still being written
+    :return: The method used, one of hardlink, reflink or copy
+    """
+    if create_dirs:
+        os.makedirs(os.path.dirname(os.path.abspath(dst)), exist_ok=True)
+    if os.path.exists(dst):
+        raise ValueError(f"Destination not empty {dst}")
+    if not os.path.isfile(src):
+        raise ValueError(f"Source is not a file {src}")
+    if allow_hardlink:
+        try:
+            os.link(src, dst)
+            return "hardlink"
+        except OSError:
+            pass
+    if sys.platform.startswith("linux"):
+        import fcntl
+        try:
+            with open(src, "rb") as reader, open(dst, "wb") as writer:
+                fcntl.ioctl(writer.fileno(), FICLONE, reader.fileno())
+            shutil.copystat(src, dst)
+            return "reflink"
+        except OSError:
+            os.remove(dst)
+    shutil.copy2(src, dst)
+    return "copy"
+
+
+class JarCache:
+    def __init__(self, cache_dir: str = None, max_bytes: int = 2 * 1024 ** 3):
+        """
+        A content addressed store of server jars shared by every server on the machine
+        Jars are keyed by edition + version and stored once by sha1, least recently used jars are evicted once the
+        store grows past max_bytes
+        :param cache_dir: Where to keep the jars, defaults to the library cache dir
+        :param max_bytes: The size the store is pruned back to after every add
+        """
+        self.cache_dir = cache_dir or get_cache_dir("jars")
+        self.blob_dir = os.path.join(self.cache_dir, "blobs")
+        self.index_location = os.path.join(self.cache_dir, "index.json")
+        self.max_bytes = max_bytes
+        self._lock = threading.RLock()
+        os.makedirs(self.blob_dir, exist_ok=True)
+
+    @staticmethod
+    def key(version: str, is_forge: bool) -> str:
+        return f"{'forge' if is_forge else 'vanilla'}:{version}"
+
+    def blob_path(self, sha1: str) -> str:
+        return os.path.join(self.blob_dir, f"{sha1}.jar")
+
+    def staging_path(self, version: str, is_forge: bool = False) -> str:
+        """Returns a stable download path inside the cache, so interrupted downloads resume and finish with a rename"""
+        return os.path.join(self.cache_dir, f"{self.key(version, is_forge).replace(':', '-')}.download.jar")
+
+    def lookup(self, version: str, is_forge: bool = False, verify: bool = False) -> Optional[str]:
+        """
+        Returns the path of the cached jar or None on a miss
+        :param verify: Re-hash the jar rather than only checking its size
+        """
+        with self._lock:
+            index = self._read_index()
+            entry = index.get(self.key(version, is_forge))
+            if entry is None:
+                return None
+            path = self.blob_path(entry["sha1"])
+            try:
+                intact = os.path.getsize(path) == entry["size"] and (not verify or file_sha1(path) == entry["sha1"])
+            except OSError:
+                intact = False
+            if not intact:
+                logger.warning(f"Dropping corrupt cached jar {self.key(version, is_forge)} @{path}")
+                del index[self.key(version, is_forge)]
+                self._remove_unreferenced(index, entry["sha1"])
+                self._write_index(index)
+                return None
+            entry["last_used"] = time.time()
+            self._write_index(index)
+            return path
+
+    def add(self, version: str, is_forge: bool, src: str, sha1: str = None, move: bool = True,
+            verified_sha1: str = None) -> str:
+        """
+        Stores a jar in the cache and returns its cached path, hashes the jar and writes the index so blocks
+        :param src: The jar to store
+        :param sha1: The expected sha1, raises ValueError on a mismatch
+        :param move: Move src into the cache rather than copying it
+        :param verified_sha1: The sha1 of src the caller already computed, skips hashing it again
+        """
+        actual_sha1 = verified_sha1.lower() if verified_sha1 else file_sha1(src)
+        if sha1 and actual_sha1 != sha1.lower():
+            raise ValueError(f"Jar {src} failed integrity check, expected sha1 {sha1} got {actual_sha1}")
+        with self._lock:
+            path = self.blob_path(actual_sha1)
+            if os.path.isfile(path):
+                if move:
+                    os.remove(src)
+            elif move:
+                os.replace(src, path)
+            else:
+                shutil.copy2(src, path)
+            index = self._read_index()
+            index[self.key(version, is_forge)] = {"sha1": actual_sha1, "size": os.path.getsize(path),
+                                                  "last_used": time.time()}
+            self._write_index(index)
+            logger.debug(f"Cached jar {self.key(version, is_forge)} sha1={actual_sha1}")
+            self.evict(keep=actual_sha1)
+        return path
+
+    def link_into(self, version: str, is_forge: bool, dst: str, create_dirs: bool = False) -> str:
+        """Links a cached jar into dst, raises ValueError if the jar isnt cached"""
+        path = self.lookup(version, is_forge)
+        if path is None:
+            raise ValueError(f"Jar {self.key(version, is_forge)} not cached")
+        method = link_file(path, dst, create_dirs)
+        logger.debug(f"Placed cached jar {self.key(version, is_forge)} @{dst} via {method}")
+        return dst
+
+    def total_size(self) -> int:
+        """Returns the bytes used by cached jars"""
+        return sum(entry.stat().st_size for entry in os.scandir(self.blob_dir) if entry.is_file())
+
+    def evict(self, max_bytes: int = None, keep: str = None):
+        """
+        Removes least recently used jars until the cache fits in max_bytes
+        :param max_bytes: Overrides the cache size limit
+        :param keep: A sha1 to never evict, used to protect a jar that was just added
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        with self._lock:
+            index = self._read_index()
+            total = self.total_size()
+            for key, entry in sorted(index.items(), key=lambda item: item[1]["last_used"]):
+                if total <= max_bytes:
+                    break
+                if entry["sha1"] == keep:
+                    continue
+                del index[key]
+                total -= self._remove_unreferenced(index, entry["sha1"])
+                logger.debug(f"Evicted cached jar {key}")
+            self._write_index(index)
+
+    def clear(self):
+        """Empties the cache"""
+        self.evict(max_bytes=0)
+
+    def _remove_unreferenced(self, index: dict, sha1: str) -> int:
+        """Deletes a blob if no index entry points at it, returns the bytes freed"""
+        if any(entry["sha1"] == sha1 for entry in index.values()):
+            return 0
+        path = self.blob_path(sha1)
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            return 0
+        return size
+
+    def _read_index(self) -> dict:
+        try:
+            with open(self.index_location) as reader:
+                return json.load(reader)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_index(self, index: dict):
+        handle, temp_location = tempfile.mkstemp(suffix=".json.tmp", dir=self.cache_dir)
+        with os.fdopen(handle, "w") as writer:
+            json.dump(index, writer)
+        os.replace(temp_location, self.index_location)
+
+
+_default_cache = None
+
+
+def get_jar_cache() -> JarCache:
+    """Returns the process wide jar cache"""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = JarCache()
+    return _default_cache
+
+
+def set_jar_cache(jar_cache: Optional[JarCache]) -> Optional[JarCache]:
+    """Replaces the process wide jar cache, None resets it to the default, returns the previous cache"""
+    global _default_cache
+    previous, _default_cache = _default_cache, jar_cache
+    return previous
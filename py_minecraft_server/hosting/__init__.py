@@ -0,0 +1,6 @@
+from .readiness import ReadinessProbe, ServerNotReadyError
+from .supervisor import ProcessSupervisor, LogEvent, parse_log_line
+from .telemetry import TelemetrySampler, RingBuffer, render_prometheus, write_csv_snapshot
+from .launch_profile import LaunchProfile, spread_cpus, COLLECTOR_AUTO, COLLECTOR_G1, COLLECTOR_ZGC
+from .profile_benchmark import benchmark_profile, benchmark_profiles
+from .backup import WorldBackup, RetentionPolicy
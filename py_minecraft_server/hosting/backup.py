@@ -0,0 +1,352 @@
+from py_minecraft_server import logger
+from py_minecraft_server.configuration import PropertiesManager
+from py_minecraft_server.creation.jar_cache import link_file
+from py_minecraft_server.world.region import REGION_HEADER_SIZE, REGION_SECTOR_SIZE, parse_header
+import asyncio
+import concurrent.futures
+import datetime
+import hashlib
+import json
+import lzma
+import os
+import shutil
+import struct
+import tempfile
+import time
+import zlib
+from typing import Iterable, Optional
+
+CODEC_NONE = b"N"
+CODEC_ZLIB = b"Z"
+CODEC_LZMA = b"X"
+CODECS = {"none": CODEC_NONE, "zlib": CODEC_ZLIB, "lzma": CODEC_LZMA}
+
+REGION_EXTENSION = ".mca"
+# chunk compression types 1 gzip, 2 zlib, 4 lz4 are already compressed, compressing them again wastes cpu
+COMPRESSED_CHUNK_TYPES = (1, 2, 4)
+# other files are split into pieces so appends and small edits of big files only store the changed pieces
+FILE_PIECE_SIZE = 1 << 20
+SNAPSHOT_DIR = "snapshots"
+BLOB_DIR = "blobs"
+
+
+def _blob_location(store_location: str, digest: str) -> str:
+    return os.path.join(store_location, BLOB_DIR, digest[:2], digest)
+
+
+def _put_blob(store_location: str, data: bytes, codec: bytes, level: int) -> tuple[str, int]:
+    """Stores data under its sha256 unless already stored, returns (digest, bytes written)"""
+    digest = hashlib.sha256(data).hexdigest()
+    location = _blob_location(store_location, digest)
+    if os.path.exists(location):
+        return digest, 0
+    if codec == CODEC_ZLIB:
+        packed = zlib.compress(data, level)
+    elif codec == CODEC_LZMA:
+        packed = lzma.compress(data, preset=level)
+    else:
+        packed = data
+    if len(packed) >= len(data):
+        codec, packed = CODEC_NONE, data
+    os.makedirs(os.path.dirname(location), exist_ok=True)
+    handle, temp_location = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(location))
+    with os.fdopen(handle, "wb") as writer:
+        writer.write(codec)
+        writer.write(packed)
+    # concurrent workers storing the same blob write identical bytes, the last replace wins harmlessly
+    os.replace(temp_location, location)
+    return digest, len(packed) + 1
+
+
+def _get_blob(store_location: str, digest: str) -> bytes:
+    with open(_blob_location(store_location, digest), "rb") as reader:
+        codec = reader.read(1)
+        packed = reader.read()
+    if codec == CODEC_ZLIB:
+        return zlib.decompress(packed)
+    if codec == CODEC_LZMA:
+        return lzma.decompress(packed)
+    return packed
+
+
+def _region_segments(data: bytes) -> Optional[list[tuple[int, bytes, bool]]]:
+    """
+    Splits an anvil region file into its header and chunks as (offset, bytes, compressible)
+    Each chunk keeps its length prefix and compression type but not the padding to the next sector
+    :return: None if the file is not a well formed region file
+    """
+    if len(data) < REGION_HEADER_SIZE:
+        return None
+    segments = [(0, data[:REGION_HEADER_SIZE], True)]
+    offsets = parse_header(data)[0]
+    for offset in (offsets[offsets != 0].astype("int64") * REGION_SECTOR_SIZE).tolist():
+        if offset < REGION_HEADER_SIZE or offset + 5 > len(data):
+            return None
+        length = struct.unpack_from(">I", data, offset)[0]
+        if offset + 4 + length > len(data):
+            return None
+        segments.append((offset, data[offset:offset + 4 + length], data[offset + 4] not in COMPRESSED_CHUNK_TYPES))
+    return segments
+
+
+def _store_file(staged_location: str, store_location: str, codec: bytes, level: int) -> dict:
+    """Process pool worker: splits a staged file into blobs and returns its manifest entry"""
+    with open(staged_location, "rb") as reader:
+        data = reader.read()
+    entry = {"size": len(data), "new_bytes": 0}
+    segments = _region_segments(data) if staged_location.endswith(REGION_EXTENSION) else None
+    if segments is not None:
+        entry["kind"] = "region"
+    else:
+        entry["kind"] = "file"
+        segments = [(offset, data[offset:offset + FILE_PIECE_SIZE], True)
+                    for offset in range(0, len(data), FILE_PIECE_SIZE)]
+    entry["blobs"] = []
+    for offset, segment, compressible in segments:
+        digest, written = _put_blob(store_location, segment, codec if compressible else CODEC_NONE, level)
+        entry["blobs"].append([offset, digest])
+        entry["new_bytes"] += written
+    os.remove(staged_location)
+    return entry
+
+
+def _restore_file(store_location: str, entry: dict, location: str):
+    """Process pool worker: rebuilds a file from its manifest entry, the gaps between region chunks are zeroed"""
+    data = bytearray(entry["size"])
+    for offset, digest in entry["blobs"]:
+        segment = _get_blob(store_location, digest)
+        data[offset:offset + len(segment)] = segment
+    os.makedirs(os.path.dirname(location), exist_ok=True)
+    handle, temp_location = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(location))
+    with os.fdopen(handle, "wb") as writer:
+        writer.write(data)
+    os.utime(temp_location, ns=(entry["mtime_ns"], entry["mtime_ns"]))
+    os.replace(temp_location, location)
+
+
+class RetentionPolicy:
+    def __init__(self, keep_last: int = 24, keep_daily: int = 7, keep_weekly: int = 4):
+        """
+        Which snapshots prune keeps: the newest keep_last, plus the newest of each of the last keep_daily days and
+        keep_weekly weeks that have snapshots
+        """
+        self.keep_last = keep_last
+        self.keep_daily = keep_daily
+        self.keep_weekly = keep_weekly
+
+    def select(self, snapshots: list[dict]) -> set[str]:
+        """Returns the ids of the snapshots to keep"""
+        newest_first = sorted(snapshots, key=lambda snapshot: snapshot["created"], reverse=True)
+        keep = {snapshot["id"] for snapshot in newest_first[:self.keep_last]}
+        for count, period in ((self.keep_daily, "%Y-%m-%d"), (self.keep_weekly, "%G-%V")):
+            periods = set()
+            for snapshot in newest_first:
+                snapshot_period = datetime.datetime.fromtimestamp(snapshot["created"]).strftime(period)
+                if snapshot_period not in periods and len(periods) < count:
+                    periods.add(snapshot_period)
+                    keep.add(snapshot["id"])
+        return keep
+
+
+class WorldBackup:
+    def __init__(self, server_location: str, backup_location: str = None, codec: str = "zlib", level: int = 6,
+                 max_workers: int = None, retention: RetentionPolicy = None):
+        """
+        Incremental, deduplicated backups of a server's worlds
+        Only files whose mtime or size changed since the last snapshot are read, region files are split into chunks
+        and every chunk and file piece is stored once by sha256 in a compressed blob store
+        :param server_location: The server dir, worlds are found from level-name in its server.properties
+        :param backup_location: Where snapshots and blobs are kept, defaults to server_location/backups
+        :param codec: Blob compression, one of none, zlib or lzma
+        :param level: The compression level
+        :param max_workers: Processes used to hash and compress, defaults to the cpu count
+        :param retention: The policy prune applies after every backup, None to keep every snapshot
+        """
+        if codec not in CODECS:
+            raise ValueError(f"Unknown backup codec {codec}, expected one of {list(CODECS)}")
+        self.server_location = server_location
+        self.backup_location = backup_location or os.path.join(server_location, "backups")
+        self.snapshot_location = os.path.join(self.backup_location, SNAPSHOT_DIR)
+        self.codec = CODECS[codec]
+        self.level = level
+        self.max_workers = max_workers
+        self.retention = retention
+        self._lock = None
+
+    def world_dirs(self) -> list[str]:
+        """Returns the world dirs relative to the server dir, bukkit keeps the nether and end in their own dirs"""
+        level_name = str(PropertiesManager(self.server_location).get_property("level-name") or "world").strip()
+        return [world_dir for world_dir in (level_name, f"{level_name}_nether", f"{level_name}_the_end")
+                if os.path.isdir(os.path.join(self.server_location, world_dir))]
+
+    def _scan(self, world_dirs: Iterable[str]) -> dict:
+        files = {}
+        for world_dir in world_dirs:
+            for root, _, filenames in os.walk(os.path.join(self.server_location, world_dir)):
+                for filename in filenames:
+                    # the lock is held open by the server and never needs restoring
+                    if filename == "session.lock":
+                        continue
+                    location = os.path.join(root, filename)
+                    try:
+                        file_stat = os.stat(location)
+                    except FileNotFoundError:
+                        continue
+                    files[os.path.relpath(location, self.server_location).replace(os.sep, "/")] = \
+                        (file_stat.st_mtime_ns, file_stat.st_size)
+        return files
+
+    async def backup(self, rcon=None, label: str = None) -> dict:
+        """
+        Takes a snapshot of the worlds, with rcon the server's saving is paused only while changed files are copied
+        :param rcon: The AsyncRCON of the running server, None if the server is stopped
+        :param label: A note stored with the snapshot
+        :return: The snapshot manifest
+        """
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            started = time.monotonic()
+            previous = self.latest_snapshot()
+            previous_files = previous["files"] if previous else {}
+            staging_location = tempfile.mkdtemp(prefix="staging-", dir=self._ensure_dirs())
+            try:
+                if rcon is not None:
+                    await rcon.command("save-off")
+                try:
+                    if rcon is not None:
+                        # flush blocks until every chunk is written
+                        await rcon.command("save-all flush")
+                    world_dirs = self.world_dirs()
+                    files = self._scan(world_dirs)
+                    changed = [path for path, (mtime_ns, size) in files.items()
+                               if path not in previous_files or previous_files[path]["mtime_ns"] != mtime_ns
+                               or previous_files[path]["size"] != size]
+                    # copy the changed files aside, reflinks make this near instant where supported
+                    await asyncio.get_running_loop().run_in_executor(None, self._stage, changed, staging_location)
+                finally:
+                    if rcon is not None:
+                        await rcon.command("save-on")
+                saving_paused = time.monotonic() - started
+                entries = await self._store(changed, staging_location)
+            finally:
+                shutil.rmtree(staging_location, ignore_errors=True)
+
+            new_bytes = sum(entry.pop("new_bytes") for entry in entries.values())
+            manifest_files = {}
+            for path, (mtime_ns, size) in files.items():
+                # keep the stat from before the copy so a write during the copy is picked up next time
+                manifest_files[path] = {**entries[path], "mtime_ns": mtime_ns} if path in entries \
+                    else previous_files[path]
+            created = time.time()
+            manifest = {"id": datetime.datetime.fromtimestamp(created).strftime("%Y%m%d-%H%M%S-%f"),
+                        "created": created, "label": label, "world_dirs": world_dirs, "files": manifest_files,
+                        "changed_files": len(changed), "new_bytes": new_bytes,
+                        "total_bytes": sum(size for _, size in files.values())}
+            self._write_manifest(manifest)
+            logger.info(f"Backed up {self.server_location} as {manifest['id']}: {len(changed)}/{len(files)} files "
+                        f"changed, {new_bytes} new bytes stored, saving paused {saving_paused:.2f}s, "
+                        f"took {time.monotonic() - started:.2f}s")
+            if self.retention is not None:
+                # under the lock so garbage collection cant race a backup reusing a blob
+                self.prune()
+        return manifest
+
+    def _stage(self, changed: list[str], staging_location: str):
+        for index, path in enumerate(changed):
+            # flat staging names keep the extension so workers can tell region files apart
+            link_file(os.path.join(self.server_location, path),
+                      os.path.join(staging_location, f"{index}-{os.path.basename(path)}"), allow_hardlink=False)
+
+    async def _store(self, changed: list[str], staging_location: str) -> dict:
+        if not changed:
+            return {}
+        loop = asyncio.get_running_loop()
+        with concurrent.futures.ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+            results = await asyncio.gather(*[
+                loop.run_in_executor(executor, _store_file,
+                                     os.path.join(staging_location, f"{index}-{os.path.basename(path)}"),
+                                     self.backup_location, self.codec, self.level)
+                for index, path in enumerate(changed)])
+        return dict(zip(changed, results))
+
+    def _ensure_dirs(self) -> str:
+        os.makedirs(self.snapshot_location, exist_ok=True)
+        os.makedirs(os.path.join(self.backup_location, BLOB_DIR), exist_ok=True)
+        return self.backup_location
+
+    def _write_manifest(self, manifest: dict):
+        handle, temp_location = tempfile.mkstemp(suffix=".tmp", dir=self.snapshot_location)
+        with os.fdopen(handle, "w") as writer:
+            json.dump(manifest, writer)
+        os.replace(temp_location, os.path.join(self.snapshot_location, f"{manifest['id']}.json"))
+
+    def snapshots(self) -> list[dict]:
+        """Returns every snapshot manifest oldest first"""
+        if not os.path.isdir(self.snapshot_location):
+            return []
+        manifests = []
+        for filename in os.listdir(self.snapshot_location):
+            if filename.endswith(".json"):
+                with open(os.path.join(self.snapshot_location, filename)) as reader:
+                    manifests.append(json.load(reader))
+        return sorted(manifests, key=lambda manifest: manifest["created"])
+
+    def latest_snapshot(self, at: float = None) -> Optional[dict]:
+        """Returns the newest snapshot, or the newest taken at or before the timestamp at"""
+        snapshots = [snapshot for snapshot in self.snapshots() if at is None or snapshot["created"] <= at]
+        return snapshots[-1] if snapshots else None
+
+    def restore(self, snapshot_id: str = None, at: float = None, target_location: str = None) -> dict:
+        """
+        Restores the worlds to a snapshot, files created after it are removed, the server must be stopped
+        :param snapshot_id: The snapshot to restore
+        :param at: Restore the newest snapshot taken at or before this timestamp, used if snapshot_id is None
+        :param target_location: Restore into this dir instead of the server dir
+        :return: The restored snapshot manifest
+        """
+        if snapshot_id is not None:
+            manifest = next((snapshot for snapshot in self.snapshots() if snapshot["id"] == snapshot_id), None)
+        else:
+            manifest = self.latest_snapshot(at)
+        if manifest is None:
+            raise ValueError(f"No snapshot {snapshot_id or at} in {self.backup_location}")
+        target_location = target_location or self.server_location
+        current = self._scan([world_dir for world_dir in manifest["world_dirs"]
+                              if os.path.isdir(os.path.join(target_location, world_dir))]) \
+            if target_location == self.server_location else {}
+        to_restore = [path for path, entry in manifest["files"].items()
+                      if current.get(path) != (entry["mtime_ns"], entry["size"])]
+        with concurrent.futures.ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+            for future in [executor.submit(_restore_file, self.backup_location, manifest["files"][path],
+                                           os.path.join(target_location, *path.split("/"))) for path in to_restore]:
+                future.result()
+        for path in set(current) - set(manifest["files"]):
+            os.remove(os.path.join(target_location, *path.split("/")))
+        logger.info(f"Restored snapshot {manifest['id']} into {target_location}, {len(to_restore)} files rewritten")
+        return manifest
+
+    def prune(self, retention: RetentionPolicy = None) -> list[str]:
+        """
+        Deletes the snapshots the retention policy doesnt keep, then every blob no snapshot references
+        :return: The ids of the deleted snapshots
+        """
+        retention = retention or self.retention or RetentionPolicy()
+        snapshots = self.snapshots()
+        keep = retention.select(snapshots)
+        removed = [snapshot["id"] for snapshot in snapshots if snapshot["id"] not in keep]
+        for snapshot_id in removed:
+            os.remove(os.path.join(self.snapshot_location, f"{snapshot_id}.json"))
+        if removed:
+            referenced = {digest for snapshot in snapshots if snapshot["id"] in keep
+                          for entry in snapshot["files"].values() for _, digest in entry["blobs"]}
+            freed = 0
+            blob_root = os.path.join(self.backup_location, BLOB_DIR)
+            for prefix in os.listdir(blob_root):
+                for digest in os.listdir(os.path.join(blob_root, prefix)):
+                    if digest not in referenced:
+                        location = os.path.join(blob_root, prefix, digest)
+                        freed += os.path.getsize(location)
+                        os.remove(location)
+            logger.info(f"Pruned {len(removed)} snapshots of {self.server_location}, freed {freed} bytes")
+        return removed
@@ -1,79 +1,187 @@
 import string
 
 from py_minecraft_server import logger
-from py_minecraft_server.commands import ServerRCON, ServerQuery
+from py_minecraft_server.logging import profiled
+from py_minecraft_server.commands import AsyncRCON, ServerQuery, ServerStatus, get_status_scanner
 from py_minecraft_server.configuration import PropertiesManager
+from py_minecraft_server.hosting.backup import WorldBackup
+from py_minecraft_server.hosting.launch_profile import LaunchProfile
+from py_minecraft_server.hosting.readiness import ReadinessProbe
+from py_minecraft_server.hosting.supervisor import ProcessSupervisor
 from py_minecraft_server.utils import get_external_ip, get_local_ip
+from py_minecraft_server.world import pregenerate
 import asyncio
 import os
 import random
-import subprocess
+import shlex
+from typing import Iterable
 
 
 class ServerHost:
-    def __init__(self, server_location: str, ram_allocation: int, server_jar_name: str, java_ref: str = "java"):
+    def __init__(self, server_location: str, ram_allocation: int, server_jar_name: str, java_ref: str = "java",
+                 launch_profile: LaunchProfile = None):
+        """
+        :param ram_allocation: GB of heap for the server, ignored when launch_profile is given
+        :param launch_profile: How the jvm is launched, defaults to aikar's flags with a ram_allocation GB heap
+        """
         self.server_location = server_location
         self.ram_allocation = ram_allocation
         self.server_jar_name = server_jar_name
         self.java_ref = java_ref
-        self.server_process = None
+        self.launch_profile = launch_profile or LaunchProfile(heap_mb=ram_allocation * 1024)
+        self.supervisor = None
         self.server_rcon = None
         self.server_query = None
+        self.server_port = None
         self.server_command = None
+        self.server_argv = None
+        self.time_to_ready = None
+        self.world_backup = WorldBackup(server_location)
         if not os.path.isdir(server_location):
             raise ValueError(f"Server location {server_location} not a directory")
-        logger.info(f"Instantiated ServerHost @{server_location} ram{ram_allocation}GB java={java_ref}")
-
-    def write_start_batch(self, gui: bool = False):
-        gui_str = "nogui"
-        if gui_str:
-            gui_str = ""
-        self.server_command = (f"\"{self.java_ref}\" -Xms{self.ram_allocation}G -Xmx{self.ram_allocation}G "
-                               f"-jar {self.server_jar_name} {gui_str}")
+        logger.info(f"Instantiated ServerHost @{server_location} {self.launch_profile} java={java_ref}")
+
+    def write_start_script(self):
+        """Builds the server argv from the launch profile and writes it to start.sh for starting the server by hand"""
+        self.server_argv = self.launch_profile.argv(self.java_ref, self.server_jar_name)
+        self.server_command = shlex.join(self.server_argv)
         logger.info(
             f"Server command for ServerHost {os.path.basename(self.server_location)} set to {self.server_command}")
-        with open(os.path.join(self.server_location, "start.bat"), "w") as writer:
-            writer.write(f"{self.server_command}\npause")
-
-    async def start_server(self, stdout: bool = False):
-        self.write_start_batch()
-        if not stdout:
-            stdout = subprocess.DEVNULL
-        else:
-            stdout = None
-
-        properties = PropertiesManager(os.path.join(self.server_location, "server.properties"))
-        if properties.get_properties()["enable-rcon"].strip() in ["false"]:
-            properties.set_properties(**{"enable-rcon": "true"})
-        if properties.get_properties()["enable-query"].strip() in ["false"]:
-            properties.set_properties(**{"enable-query": "true"})
-        if properties.get_properties()["rcon.password"].strip() == "":
-            properties.set_properties(
-                **{"rcon.password": "".join(random.choice(string.ascii_letters) for _ in range(10))})
+        self.launch_profile.write_start_script(self.server_location, self.java_ref, self.server_jar_name)
+
+    @property
+    def server_process(self):
+        """The asyncio subprocess of the running server, None if it was never started"""
+        return self.supervisor.process if self.supervisor else None
+
+    @profiled("start_server")
+    async def start_server(self, stdout: bool = False, ready_timeout: float = 120.0, auto_restart: bool = False,
+                           log_capacity: int = 1000):
+        """
+        Starts the server and waits until it reports done, its rcon port answers and it answers a server list ping
+        :param stdout: If true the server output is echoed to this process' stdout
+        :param ready_timeout: Seconds to wait for the server to become ready before raising ServerNotReadyError
+        :param auto_restart: Restart the server with backoff if it crashes
+        :param log_capacity: How many recent lines of server output are kept, see recent_lines
+        """
+        if self.is_server_alive():
+            raise ValueError(f"Server @{self.server_location} already running")
+        self.write_start_script()
+
+        properties = PropertiesManager(self.server_location)
+        with properties.transaction() as batch:
+            batch["enable-rcon"] = True
+            if not batch["rcon.password"].strip():
+                batch["rcon.password"] = "".join(random.choice(string.ascii_letters) for _ in range(10))
         properties = properties.get_properties()
 
-        logger.debug(f'rcon={properties["enable-rcon"]} query={properties["enable-query"]} '
+        logger.debug(f'rcon={properties["enable-rcon"]} query={properties.get("enable-query")} '
                      f'rcon pass={properties["rcon.password"]} rcon port={properties["rcon.port"]}')
         logger.info(f"Starting server {os.path.basename(self.server_location)} on separate process")
 
-        self.server_process = subprocess.Popen(self.server_command, cwd=self.server_location, shell=True,
-                                               stdout=stdout)
-        # TODO: Find less arbitrary way to ensure server is hosted
-        await asyncio.sleep(10)
-        self.server_rcon = ServerRCON(host="localhost", password=properties["rcon.password"].strip())
-        self.server_query = ServerQuery(host="localhost")
-        logger.info(f"Server hosted on local:{get_local_ip()} external:{get_external_ip()}")
+        self.supervisor = ProcessSupervisor(self.server_argv, self.server_location, log_capacity=log_capacity,
+                                            echo=stdout, auto_restart=auto_restart,
+                                            name=f"server {os.path.basename(self.server_location)}")
+        self.supervisor.preexec_fn = self.launch_profile.preexec_fn()
+        rcon_port = int(properties["rcon.port"].strip())
+        self.server_port = int(properties.get("server-port", "25565").strip())
+        query_enabled = properties.get("enable-query", "false").strip().lower() == "true"
+        query_port = int(properties["query.port"].strip()) if query_enabled else None
+        probe = ReadinessProbe(host="localhost", rcon_port=rcon_port, server_port=self.server_port,
+                               deadline=ready_timeout)
+        self.supervisor.add_line_callback(probe.feed_line)
+        await self.supervisor.start()
+        if self.supervisor.preexec_fn is None and (self.launch_profile.nice is not None
+                                                   or self.launch_profile.cpu_affinity is not None):
+            self.launch_profile.apply_to_process(self.supervisor.pid)
+        try:
+            self.time_to_ready = await probe.wait(is_alive=lambda: self.supervisor.running)
+            logger.info(f"Server {os.path.basename(self.server_location)} ready in {self.time_to_ready:.2f}s "
+                        f"(server reported {probe.reported_startup}s) jar={self.server_jar_name}")
+            self.server_rcon = AsyncRCON(host="localhost", password=properties["rcon.password"].strip(),
+                                         port=rcon_port)
+            await self.server_rcon.connect()
+        except BaseException as error:
+            logger.error(f"Server {os.path.basename(self.server_location)} failed to start ({error!r}), stopping it")
+            await self._abort_start()
+            raise
+        finally:
+            self.supervisor.remove_line_callback(probe.feed_line)
+        # query is only used when the server has it enabled, status comes from the server list ping
+        self.server_query = ServerQuery(host="localhost", port=query_port) if query_enabled else None
+        # both lookups block, the external one on the network, so keep them off the event loop
+        loop = asyncio.get_running_loop()
+        local_ip, external_ip = await asyncio.gather(loop.run_in_executor(None, get_local_ip),
+                                                     loop.run_in_executor(None, get_external_ip))
+        logger.info(f"Server hosted on local:{local_ip} external:{external_ip}")
         return self.server_process
 
-    async def stop_server(self):
+    @profiled("stop_server")
+    async def stop_server(self, timeout: float = 60.0, kill_timeout: float = 10.0) -> int:
+        """
+        Stops the server with the stop command, terminating then killing it if it hasnt exited in time
+        :param timeout: Seconds to wait for the server to save and exit
+        :param kill_timeout: Seconds to wait after terminating before killing
+        :return: The exit code of the server
+        """
         logger.info(f"Sending stop command to server @{os.path.basename(self.server_location)}")
-        self.server_rcon.command("stop")
-        while self.server_process.poll is None:
-            await asyncio.sleep(0.25)
-        self.server_process = None
+        exit_code = await self.supervisor.stop(self._send_stop if self.server_rcon else None, timeout, kill_timeout)
+        if self.server_rcon is not None:
+            await self.server_rcon.close()
         self.server_rcon = None
         self.server_query = None
-        logger.info(f"Server stopped @{os.path.basename(self.server_location)}")
+        get_status_scanner().invalidate("localhost", self.server_port)
+        logger.info(f"Server stopped @{os.path.basename(self.server_location)} exit code {exit_code}")
+        return exit_code
+
+    async def _abort_start(self, timeout: float = 5.0, kill_timeout: float = 10.0):
+        """Stops a server that never became ready, a booting server ignores its console so it is terminated soon"""
+        if self.server_rcon is not None:
+            await self.server_rcon.close()
+        self.server_rcon = None
+        self.time_to_ready = None
+        # the supervisor is kept so recent_lines still shows why the start failed
+        exit_code = await self.supervisor.stop(None, timeout, kill_timeout)
+        logger.info(f"Server @{os.path.basename(self.server_location)} stopped after a failed start, "
+                    f"exit code {exit_code}")
+
+    async def _send_stop(self):
+        try:
+            await self.server_rcon.command("stop")
+        except (ConnectionError, asyncio.TimeoutError):
+            # the server may close the connection before it finishes answering
+            pass
+
+    async def backup_world(self, label: str = None) -> dict:
+        """Takes an incremental snapshot of the worlds, pausing saving over rcon if the server is running"""
+        return await self.world_backup.backup(self.server_rcon if self.is_server_alive() else None, label)
+
+    def restore_world(self, snapshot_id: str = None, at: float = None) -> dict:
+        """Restores the worlds to a snapshot, or the newest one taken at or before the timestamp at"""
+        if self.is_server_alive():
+            raise ValueError(f"Stop server @{self.server_location} before restoring its worlds")
+        return self.world_backup.restore(snapshot_id, at)
+
+    async def pregenerate(self, radius: int, center_x: int = 0, center_z: int = 0,
+                          dimension: str = "minecraft:overworld", **kwargs) -> dict:
+        """Generates every chunk within radius blocks of a block in the running server, see Pregenerator"""
+        if self.server_rcon is None:
+            raise ValueError(f"Server @{self.server_location} must be running to pregenerate")
+        level_name = str(PropertiesManager(self.server_location).get_property("level-name") or "world").strip()
+        return await pregenerate(self.server_rcon, os.path.join(self.server_location, level_name), radius,
+                                 center_x, center_z, dimension, **kwargs)
+
+    async def wait_for_exit(self) -> int:
+        """Waits for the server to exit for good and returns its exit code"""
+        return await self.supervisor.wait()
+
+    def events(self, kinds: Iterable[str] = None):
+        """Async iterator of parsed LogEvents from the server output, see ProcessSupervisor.events"""
+        return self.supervisor.events(kinds)
+
+    def recent_lines(self) -> list[str]:
+        """Returns the most recent lines of server output"""
+        return list(self.supervisor.recent_lines) if self.supervisor else []
 
     def get_rcon(self):
         return self.server_rcon
@@ -82,7 +190,21 @@ class ServerHost:
         return self.server_query
 
     def is_server_alive(self):
-        return self.server_process.poll is None
+        return self.supervisor is not None and self.supervisor.running
+
+    async def server_status(self, max_age: float = None) -> ServerStatus:
+        """
+        Returns the version, player counts, motd and latency of the running server from a server list ping
+        Answers are shared through the process wide StatusScanner, so frequent callers reuse a recent ping
+        :param max_age: Seconds a cached answer may be old, defaults to the scanner's ttl
+        """
+        if self.server_port is None:
+            self.server_port = int(PropertiesManager(self.server_location).get_property("server-port"))
+        return await get_status_scanner().status("localhost", self.server_port, max_age)
+
+    async def is_server_responding(self, max_age: float = None) -> bool:
+        """Returns True if the server answers a server list ping, whether or not this host started it"""
+        return (await self.server_status(max_age)).online
 
     def get_server_rcon(self):
         return self.server_rcon
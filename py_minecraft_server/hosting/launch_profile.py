@@ -0,0 +1,214 @@
+from py_minecraft_server import logger
+import os
+import shlex
+import stat
+import sys
+from typing import Callable, Iterable, Optional
+
+import psutil
+
+COLLECTOR_AUTO = "auto"
+COLLECTOR_G1 = "g1"
+COLLECTOR_ZGC = "zgc"
+
+# memory the host os and other programs keep for themselves when sizing heaps automatically
+DEFAULT_HOST_RESERVE_MB = 2048
+# share of a server's memory given to the heap, the jvm needs the rest for metaspace, threads and direct buffers
+HEAP_FRACTION = 0.8
+MIN_HEAP_MB = 1024
+# aikar's flags switch to bigger young generations and regions from 12G, ZGC pays off for very large heaps
+LARGE_HEAP_MB = 12 * 1024
+ZGC_MIN_HEAP_MB = 32 * 1024
+ZGC_MIN_JAVA = 17
+
+# https://docs.papermc.io/paper/aikars-flags
+AIKAR_G1_FLAGS = ["-XX:+UseG1GC", "-XX:+ParallelRefProcEnabled", "-XX:MaxGCPauseMillis=200",
+                  "-XX:+UnlockExperimentalVMOptions", "-XX:+DisableExplicitGC", "-XX:+AlwaysPreTouch",
+                  "-XX:G1HeapWastePercent=5", "-XX:G1MixedGCCountTarget=4", "-XX:G1MixedGCLiveThresholdPercent=90",
+                  "-XX:G1RSetUpdatingPauseTimePercent=5", "-XX:SurvivorRatio=32", "-XX:+PerfDisableSharedMem",
+                  "-XX:MaxTenuringThreshold=1", "-Dusing.aikars.flags=https://mcflags.emc.gs",
+                  "-Daikars.new.flags=true"]
+# (new size, max new size, region size, reserve, initiating heap occupancy) below and above LARGE_HEAP_MB
+AIKAR_G1_SIZING = {False: ("30", "40", "8M", "20", "15"), True: ("40", "50", "16M", "15", "20")}
+ZGC_FLAGS = ["-XX:+UseZGC", "-XX:+DisableExplicitGC", "-XX:+AlwaysPreTouch", "-XX:+PerfDisableSharedMem"]
+
+
+def host_memory_mb() -> int:
+    return psutil.virtual_memory().total // (1024 * 1024)
+
+
+def usable_cpus() -> list[int]:
+    """Returns the cpus this process may run on"""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(psutil.cpu_count() or 1))
+
+
+def spread_cpus(index: int, count: int, cpus: Iterable[int] = None) -> list[int]:
+    """
+    Splits the cpus into count contiguous groups and returns group index, so a fleet of servers is spread evenly
+    If there are more servers than cpus the servers share cpus round robin
+    """
+    cpus = list(cpus) if cpus is not None else usable_cpus()
+    if count >= len(cpus):
+        return [cpus[index % len(cpus)]]
+    group_size = len(cpus) // count
+    return cpus[index * group_size:(index + 1) * group_size]
+
+
+class LaunchProfile:
+    def __init__(self, heap_mb: Optional[int] = None, collector: str = COLLECTOR_AUTO, java_major: Optional[int] = None,
+                 gc_log: bool = False, gui: bool = False, nice: Optional[int] = None,
+                 cpu_affinity: Optional[Iterable[int]] = None, extra_jvm_args: Iterable[str] = (),
+                 name: str = "default"):
+        """
+        How a server's jvm is launched: heap, garbage collector, scheduling priority and cpus
+        :param heap_mb: The heap size, -Xms and -Xmx are both set to it, None sizes it from host memory, see auto
+        :param collector: COLLECTOR_G1 for aikar's G1 flags, COLLECTOR_ZGC or COLLECTOR_AUTO to pick by heap size
+        :param java_major: The major version of the java running the server, None if unknown
+        :param gc_log: Log every gc pause to stdout, the telemetry sampler and profile benchmarks read these
+        :param gui: Show the server gui
+        :param nice: The niceness of the server process, higher runs at a lower priority
+        :param cpu_affinity: The cpus the server process may run on, None for all
+        :param extra_jvm_args: Flags added after the generated ones
+        :param name: A name for logs and benchmarks
+        """
+        self.heap_mb = heap_mb if heap_mb is not None else self.auto_heap_mb()
+        self.java_major = java_major
+        self.collector = collector if collector != COLLECTOR_AUTO else self._pick_collector()
+        self.gc_log = gc_log
+        self.gui = gui
+        self.nice = nice
+        self.cpu_affinity = list(cpu_affinity) if cpu_affinity is not None else None
+        self.extra_jvm_args = list(extra_jvm_args)
+        self.name = name
+        if self.collector not in (COLLECTOR_G1, COLLECTOR_ZGC):
+            raise ValueError(f"Unknown garbage collector {collector}")
+        if self.collector == COLLECTOR_ZGC and java_major is not None and java_major < ZGC_MIN_JAVA:
+            raise ValueError(f"ZGC needs java {ZGC_MIN_JAVA}+ not java {java_major}")
+
+    @staticmethod
+    def auto_heap_mb(servers: int = 1, budget_mb: Optional[int] = None,
+                     host_reserve_mb: int = DEFAULT_HOST_RESERVE_MB) -> int:
+        """
+        Sizes a heap from the host memory shared between servers, capped by a per server budget
+        :param servers: How many servers share the host
+        :param budget_mb: The most memory a single server may have
+        :param host_reserve_mb: Memory left to the host os
+        """
+        per_server_mb = (host_memory_mb() - host_reserve_mb) / max(servers, 1)
+        if budget_mb is not None:
+            per_server_mb = min(per_server_mb, budget_mb)
+        # round down to 256M so -Xmx stays readable
+        heap_mb = int(per_server_mb * HEAP_FRACTION) // 256 * 256
+        if heap_mb < MIN_HEAP_MB:
+            logger.warning(f"Only {per_server_mb:.0f}MB available per server, using the minimum {MIN_HEAP_MB}MB heap")
+            heap_mb = MIN_HEAP_MB
+        return heap_mb
+
+    @classmethod
+    def for_fleet(cls, index: int, count: int, budget_mb: Optional[int] = None, pin_cpus: bool = True,
+                  nice: Optional[int] = None, **kwargs) -> "LaunchProfile":
+        """
+        A profile for one of count servers sharing this host, the heap is sized from the host memory split between
+        the servers and each server is pinned to its own group of cpus
+        :param index: The server's position in the fleet
+        :param count: How many servers the fleet runs
+        :param budget_mb: The most memory a single server may have
+        :param pin_cpus: Pin the server to its share of the cpus
+        :param nice: The niceness of the server process
+        """
+        heap_mb = kwargs.pop("heap_mb", None) or cls.auto_heap_mb(count, budget_mb)
+        cpu_affinity = spread_cpus(index, count) if pin_cpus and count > 1 else None
+        return cls(heap_mb=heap_mb, nice=nice, cpu_affinity=cpu_affinity, **kwargs)
+
+    def _pick_collector(self) -> str:
+        if self.heap_mb >= ZGC_MIN_HEAP_MB and self.java_major is not None and self.java_major >= ZGC_MIN_JAVA:
+            return COLLECTOR_ZGC
+        return COLLECTOR_G1
+
+    def jvm_flags(self) -> list[str]:
+        """The jvm flags of the profile, heap and collector first then any extra flags"""
+        flags = [f"-Xms{self.heap_mb}M", f"-Xmx{self.heap_mb}M"]
+        if self.collector == COLLECTOR_ZGC:
+            flags += ZGC_FLAGS
+            if self.java_major is not None and self.java_major >= 21:
+                flags.append("-XX:+ZGenerational")
+        else:
+            new_size, max_new_size, region_size, reserve, occupancy = AIKAR_G1_SIZING[self.heap_mb >= LARGE_HEAP_MB]
+            flags += AIKAR_G1_FLAGS + [f"-XX:G1NewSizePercent={new_size}", f"-XX:G1MaxNewSizePercent={max_new_size}",
+                                       f"-XX:G1HeapRegionSize={region_size}", f"-XX:G1ReservePercent={reserve}",
+                                       f"-XX:InitiatingHeapOccupancyPercent={occupancy}"]
+        if self.gc_log:
+            # java 8 has no unified logging, its gc output differs and is not parsed
+            flags.append("-Xlog:gc:stdout" if self.java_major is None or self.java_major >= 9 else "-verbose:gc")
+        return flags + self.extra_jvm_args
+
+    def argv(self, java_ref: str, server_jar_name: str) -> list[str]:
+        """The exec argv of the server, run it without a shell"""
+        return [java_ref] + self.jvm_flags() + ["-jar", server_jar_name] + ([] if self.gui else ["nogui"])
+
+    def write_start_script(self, server_location: str, java_ref: str, server_jar_name: str,
+                           filename: str = "start.sh") -> str:
+        """
+        Writes an executable posix script that starts the server the same way ServerHost does, for running it by hand
+        :return: The location of the script
+        """
+        argv = self.argv(java_ref, server_jar_name)
+        if self.cpu_affinity is not None:
+            argv = ["taskset", "-c", ",".join(str(cpu) for cpu in self.cpu_affinity)] + argv
+        if self.nice is not None:
+            argv = ["nice", "-n", str(self.nice)] + argv
+        script_location = os.path.join(server_location, filename)
+        with open(script_location, "w", newline="\n") as writer:
+            # exec replaces the shell so signals reach the jvm directly
+            writer.write(f"#!/bin/sh\ncd \"$(dirname \"$0\")\"\nexec {shlex.join(argv)}\n")
+        os.chmod(script_location, os.stat(script_location).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+        return script_location
+
+    def preexec_fn(self) -> Optional[Callable[[], None]]:
+        """Returns a function applying nice and cpu affinity in the forked child before exec, None if not posix"""
+        if os.name != "posix" or (self.nice is None and self.cpu_affinity is None):
+            return None
+        nice, cpu_affinity = self.nice, self.cpu_affinity
+
+        def apply():
+            if nice is not None:
+                os.nice(nice)
+            if cpu_affinity is not None and hasattr(os, "sched_setaffinity"):
+                os.sched_setaffinity(0, cpu_affinity)
+        return apply
+
+    def apply_to_process(self, pid: int):
+        """Applies nice and cpu affinity to a running process with psutil, for platforms without preexec_fn"""
+        process = psutil.Process(pid)
+        try:
+            if self.nice is not None:
+                process.nice(self.nice if os.name == "posix" else _windows_priority(self.nice))
+            if self.cpu_affinity is not None and hasattr(process, "cpu_affinity"):
+                process.cpu_affinity(self.cpu_affinity)
+        except psutil.Error as error:
+            logger.warning(f"Failed to apply launch profile {self.name} to pid {pid} ({error!r})")
+
+    def to_dict(self) -> dict:
+        return {"heap_mb": self.heap_mb, "collector": self.collector, "java_major": self.java_major,
+                "gc_log": self.gc_log, "gui": self.gui, "nice": self.nice, "cpu_affinity": self.cpu_affinity,
+                "extra_jvm_args": self.extra_jvm_args, "name": self.name}
+
+    @classmethod
+    def from_dict(cls, profile_dict: dict) -> "LaunchProfile":
+        return cls(**profile_dict)
+
+    def __repr__(self):
+        return (f"LaunchProfile({self.name!r}, heap={self.heap_mb}M, collector={self.collector}, nice={self.nice}, "
+                f"cpus={self.cpu_affinity})")
+
+
+def _windows_priority(nice: int) -> int:
+    if sys.platform != "win32":
+        return nice
+    if nice >= 10:
+        return psutil.IDLE_PRIORITY_CLASS
+    if nice > 0:
+        return psutil.BELOW_NORMAL_PRIORITY_CLASS
+    return psutil.NORMAL_PRIORITY_CLASS if nice == 0 else psutil.ABOVE_NORMAL_PRIORITY_CLASS
@@ -0,0 +1,99 @@
+from py_minecraft_server import logger
+from py_minecraft_server.hosting.host_server import ServerHost
+from py_minecraft_server.hosting.launch_profile import LaunchProfile
+from py_minecraft_server.hosting.telemetry import GC_PAUSE_RE, TelemetrySampler
+import asyncio
+import math
+from typing import Awaitable, Callable, Iterable, Optional
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    """Nearest rank percentile, nan for no values"""
+    if not values:
+        return math.nan
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(fraction * len(ordered)) - 1))]
+
+
+def _present(values: Iterable[float]) -> list[float]:
+    return [value for value in values if not math.isnan(value)]
+
+
+async def benchmark_profile(server_location: str, profile: LaunchProfile, server_jar_name: str = "server.jar",
+                            java_ref: str = "java", warmup: float = 30.0, duration: float = 120.0,
+                            interval: float = 1.0, workload: Callable[[ServerHost], Awaitable] = None,
+                            ready_timeout: float = 300.0) -> dict:
+    """
+    Boots a server with a launch profile, lets it warm up, then measures tps, mspt, memory and gc pauses
+    :param server_location: The server to boot, it must not be running
+    :param profile: The launch profile to measure, gc logging is turned on for the run
+    :param warmup: Seconds after the server is ready before measuring
+    :param duration: Seconds to measure for
+    :param interval: Seconds between telemetry samples
+    :param workload: Coroutine function run against the host while measuring, for example to load chunks
+    :return: A dict of the measurements
+    """
+    profile = LaunchProfile.from_dict({**profile.to_dict(), "gc_log": True})
+    host = ServerHost(server_location, profile.heap_mb // 1024, server_jar_name, java_ref, profile)
+    pauses = []
+
+    def feed_line(line: str):
+        if "Pause" in line:
+            gc_search = GC_PAUSE_RE.search(line)
+            if gc_search:
+                pauses.append(float(gc_search.group("ms")))
+
+    await host.start_server(ready_timeout=ready_timeout)
+    host.supervisor.add_line_callback(feed_line)
+    sampler = TelemetrySampler(host, interval=interval, capacity=int(duration / interval) + 1, name=profile.name)
+    workload_task = None
+    try:
+        await asyncio.sleep(warmup)
+        pauses.clear()
+        await sampler.start()
+        if workload is not None:
+            workload_task = asyncio.ensure_future(workload(host))
+        await asyncio.sleep(duration)
+    finally:
+        if workload_task is not None:
+            workload_task.cancel()
+            await asyncio.gather(workload_task, return_exceptions=True)
+        await sampler.stop()
+        await host.stop_server()
+
+    tps = _present(sampler.buffers["tps"].values())
+    mspt = _present(sampler.buffers["mspt"].values())
+    rss = _present(sampler.buffers["rss_bytes"].values())
+    cpu = _present(sampler.buffers["cpu_percent"].values())
+    result = {"profile": profile.name, "flags": profile.jvm_flags(), "time_to_ready": host.time_to_ready,
+              "samples": len(sampler.timestamps),
+              "tps_mean": sum(tps) / len(tps) if tps else math.nan, "tps_min": min(tps) if tps else math.nan,
+              "mspt_mean": sum(mspt) / len(mspt) if mspt else math.nan, "mspt_p95": percentile(mspt, 0.95),
+              "cpu_percent_mean": sum(cpu) / len(cpu) if cpu else math.nan, "rss_bytes_max": max(rss, default=math.nan),
+              "gc_pauses": len(pauses), "gc_pause_ms_total": sum(pauses), "gc_pause_ms_p50": percentile(pauses, 0.5),
+              "gc_pause_ms_p99": percentile(pauses, 0.99), "gc_pause_ms_max": max(pauses, default=math.nan)}
+    logger.info(f"Profile {profile.name}: tps={result['tps_mean']:.2f} mspt={result['mspt_mean']:.2f} "
+                f"gc pauses={len(pauses)} p99={result['gc_pause_ms_p99']:.1f}ms")
+    return result
+
+
+async def benchmark_profiles(server_location: str, profiles: Iterable[LaunchProfile],
+                             workload: Optional[Callable[[ServerHost], Awaitable]] = None, **kwargs) -> list[dict]:
+    """
+    Benchmarks launch profiles one after another on the same server so they dont compete for the host, see
+    benchmark_profile for the keyword arguments
+    :return: The results ranked best first, by mean tps then by p99 gc pause
+    """
+    results = []
+    for profile in profiles:
+        results.append(await benchmark_profile(server_location, profile, workload=workload, **kwargs))
+    return rank_results(results)
+
+
+def rank_results(results: list[dict]) -> list[dict]:
+    def rank_key(result: dict):
+        tps = result["tps_mean"]
+        p99 = result["gc_pause_ms_p99"]
+        # tps is capped at 20 so round it, among servers keeping up the shortest gc pauses win
+        return (-(round(tps, 1) if not math.isnan(tps) else -1), p99 if not math.isnan(p99) else 0.0)
+    return sorted(results, key=rank_key)
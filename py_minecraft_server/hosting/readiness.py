@@ -0,0 +1,161 @@
+from py_minecraft_server import logger
+from py_minecraft_server.commands.status_ping import status_ping
+import asyncio
+import os
+import re
+import socket
+import struct
+import time
+from typing import Callable, Optional
+
+# matches the vanilla/forge/paper line "Done (4.123s)! For help, type "help""
+DONE_RE = re.compile(r"Done \((?P<seconds>[\d.,]+)s\)!")
+
+
+class ServerNotReadyError(TimeoutError):
+    """Raised when a server does not become ready before its deadline"""
+
+
+class ReadinessProbe:
+    def __init__(self, host: str = "localhost", rcon_port: Optional[int] = None, query_port: Optional[int] = None,
+                 deadline: float = 120.0, poll_interval: float = 0.25, max_poll_interval: float = 5.0,
+                 require_done_line: bool = True, server_port: Optional[int] = None):
+        """
+        Detects when a freshly started server is ready to accept connections
+        :param host: The host the server is bound to
+        :param rcon_port: The RCON (tcp) port to poll, None to skip
+        :param query_port: The query (udp) port to poll, None to skip
+        :param deadline: Seconds to wait for readiness before giving up
+        :param poll_interval: Initial seconds between port polls, doubles on every miss
+        :param max_poll_interval: The cap for the poll backoff
+        :param require_done_line: If true the "Done (" log line must be fed before ports are polled
+        :param server_port: The game (tcp) port to poll with a server list ping, None to skip
+        """
+        self.host = host
+        self.rcon_port = rcon_port
+        self.query_port = query_port
+        self.server_port = server_port
+        self.deadline = deadline
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.require_done_line = require_done_line
+        self.reported_startup = None
+        self.time_to_ready = None
+        self._done = asyncio.Event()
+        self._started = time.perf_counter()
+
+    @property
+    def done(self) -> bool:
+        """True once the startup line has been seen"""
+        return self._done.is_set()
+
+    def feed_line(self, line: str):
+        """Feed a line of server output, sets the done flag when the startup line is seen"""
+        if self._done.is_set():
+            return
+        done_search = DONE_RE.search(line)
+        if done_search:
+            self.reported_startup = float(done_search.group("seconds").replace(",", "."))
+            self._done.set()
+
+    def mark_done(self):
+        """Manually flag the startup line as seen, for servers with no readable output"""
+        self._done.set()
+
+    async def wait(self, is_alive: Callable[[], bool] = None) -> float:
+        """
+        Waits until the server is ready and returns the seconds it took
+        :param is_alive: Optional callable, if it returns False the wait is aborted early
+        """
+        try:
+            await asyncio.wait_for(self._wait(is_alive), timeout=self._remaining())
+        except asyncio.TimeoutError:
+            raise ServerNotReadyError(f"Server on {self.host} not ready after {self.deadline}s") from None
+        self.time_to_ready = time.perf_counter() - self._started
+        return self.time_to_ready
+
+    async def _wait(self, is_alive: Optional[Callable[[], bool]]):
+        if self.require_done_line:
+            while not self._done.is_set():
+                self._check_alive(is_alive)
+                try:
+                    await asyncio.wait_for(self._done.wait(), timeout=self.max_poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+            logger.debug(f"Server on {self.host} reported done after {self.reported_startup}s")
+
+        interval = self.poll_interval
+        while True:
+            self._check_alive(is_alive)
+            if await self._ports_open():
+                return
+            await asyncio.sleep(min(interval, max(self._remaining(), 0)))
+            interval = min(interval * 2, self.max_poll_interval)
+
+    def _remaining(self) -> float:
+        return self.deadline - (time.perf_counter() - self._started)
+
+    def _check_alive(self, is_alive: Optional[Callable[[], bool]]):
+        if is_alive is not None and not is_alive():
+            raise ServerNotReadyError(f"Server on {self.host} exited before it was ready")
+
+    async def _ports_open(self) -> bool:
+        checks = []
+        if self.rcon_port:
+            checks.append(tcp_port_open(self.host, self.rcon_port))
+        if self.query_port:
+            checks.append(query_port_open(self.host, self.query_port))
+        if self.server_port:
+            checks.append(status_port_open(self.host, self.server_port))
+        return all(await asyncio.gather(*checks))
+
+
+async def tcp_port_open(host: str, port: int, timeout: float = 1.0) -> bool:
+    """Returns True if a tcp connection can be opened on host:port"""
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout=timeout)
+    except (OSError, asyncio.TimeoutError):
+        return False
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except OSError:
+        pass
+    return True
+
+
+async def status_port_open(host: str, port: int, timeout: float = 1.0) -> bool:
+    """Returns True if the game port answers a server list ping"""
+    try:
+        await status_ping(host, port, timeout)
+    except (OSError, ValueError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+        return False
+    return True
+
+
+async def query_port_open(host: str, port: int, timeout: float = 1.0) -> bool:
+    """Returns True if the query port answers a handshake packet"""
+    loop = asyncio.get_running_loop()
+    answered = loop.create_future()
+
+    class _HandshakeProtocol(asyncio.DatagramProtocol):
+        def datagram_received(self, data, addr):
+            if not answered.done():
+                answered.set_result(data[:1] == b"\x09")
+
+        def error_received(self, exc):
+            if not answered.done():
+                answered.set_result(False)
+
+    try:
+        transport, _ = await loop.create_datagram_endpoint(_HandshakeProtocol, remote_addr=(host, port),
+                                                           family=socket.AF_INET)
+    except OSError:
+        return False
+    try:
+        transport.sendto(b"\xfe\xfd\x09" + struct.pack(">i", os.getpid() & 0x0F0F0F0F))
+        return await asyncio.wait_for(answered, timeout=timeout)
+    except asyncio.TimeoutError:
+        return False
+    finally:
+        transport.close()
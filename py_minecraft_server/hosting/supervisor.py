@@ -0,0 +1,307 @@
+from py_minecraft_server import logger
+import asyncio
+import collections
+import re
+import sys
+import time
+from typing import Awaitable, Callable, Iterable, Optional
+
+# [12:00:00] [Server thread/INFO]: message, forge adds a [logger] before the colon
+LOG_LINE_RE = re.compile(r"\[(?P<time>[^\]]*)\] \[(?P<thread>[^\]]*)/(?P<level>[A-Z]+)\](?: \[[^\]]*\])?: ")
+EVENT_RE = re.compile(r"(?P<done>Done \((?P<seconds>[\d.,]+)s\)!)"
+                      r"|(?P<lag>Can't keep up! Is the server overloaded\? Running (?P<lag_ms>\d+)ms or "
+                      r"(?P<lag_ticks>\d+) ticks behind)"
+                      r"|(?P<join>(?P<join_player>\w+) joined the game)"
+                      r"|(?P<leave>(?P<leave_player>\w+) left the game)"
+                      r"|(?P<chat><(?P<chat_player>\w+)> )")
+ERROR_LEVELS = ("ERROR", "FATAL")
+# longest output line kept, longer ones (mod lists, stack traces of huge nbt) are truncated, asyncio defaults to 64KiB
+OUTPUT_LINE_LIMIT = 1024 ** 2
+
+EVENT_LOG = "log"
+EVENT_DONE = "done"
+EVENT_LAG = "lag"
+EVENT_JOIN = "join"
+EVENT_LEAVE = "leave"
+EVENT_CHAT = "chat"
+EVENT_ERROR = "error"
+EVENT_EXIT = "exit"
+
+
+class LogEvent:
+    """
+    A parsed line of server output, the line is the only copy of the text and every field is sliced from it on
+    access using the regex match positions
+    """
+    __slots__ = ("kind", "line", "received", "_header", "_event")
+
+    def __init__(self, kind: str, line: str, header: Optional[re.Match] = None, event: Optional[re.Match] = None):
+        self.kind = kind
+        self.line = line
+        self.received = time.time()
+        self._header = header
+        self._event = event
+
+    @property
+    def time(self) -> Optional[str]:
+        return self._header.group("time") if self._header else None
+
+    @property
+    def thread(self) -> Optional[str]:
+        return self._header.group("thread") if self._header else None
+
+    @property
+    def level(self) -> Optional[str]:
+        return self._header.group("level") if self._header else None
+
+    @property
+    def message(self) -> str:
+        return self.line[self._header.end():] if self._header else self.line
+
+    @property
+    def player(self) -> Optional[str]:
+        if self._event is None or self.kind not in (EVENT_JOIN, EVENT_LEAVE, EVENT_CHAT):
+            return None
+        return self._event.group(f"{self.kind}_player")
+
+    @property
+    def lag_ms(self) -> Optional[int]:
+        return int(self._event.group("lag_ms")) if self.kind == EVENT_LAG else None
+
+    @property
+    def lag_ticks(self) -> Optional[int]:
+        return int(self._event.group("lag_ticks")) if self.kind == EVENT_LAG else None
+
+    @property
+    def startup_seconds(self) -> Optional[float]:
+        return float(self._event.group("seconds").replace(",", ".")) if self.kind == EVENT_DONE else None
+
+    def __repr__(self):
+        return f"LogEvent({self.kind!r}, {self.line!r})"
+
+
+def parse_log_line(line: str) -> LogEvent:
+    """Classifies a line of server output, matching the event regex in place after the header without slicing"""
+    header = LOG_LINE_RE.match(line)
+    start = header.end() if header else 0
+    event = EVENT_RE.match(line, start)
+    if event is not None:
+        # the outer group of each alternative closes last so it is always the lastgroup
+        return LogEvent(event.lastgroup, line, header, event)
+    if header is not None and header.group("level") in ERROR_LEVELS:
+        return LogEvent(EVENT_ERROR, line, header)
+    return LogEvent(EVENT_LOG, line, header)
+
+
+class ProcessSupervisor:
+    def __init__(self, argv: list[str], cwd: str, log_capacity: int = 1000, echo: bool = False,
+                 auto_restart: bool = False, restart_backoff: float = 5.0, max_restart_backoff: float = 300.0,
+                 max_restarts: int = 10, stable_after: float = 300.0, env: dict = None, name: str = None):
+        """
+        Runs a process with asyncio.create_subprocess_exec, streams and parses its output and restarts it on crashes
+        :param argv: The program and its arguments, run without a shell
+        :param cwd: The working dir of the process
+        :param log_capacity: How many recent output lines are kept in memory
+        :param echo: Write the process output to this process' stdout
+        :param auto_restart: Restart the process when it exits with a non zero code without being asked to stop
+        :param restart_backoff: Seconds before the first restart, doubling on every consecutive crash
+        :param max_restart_backoff: The cap for the restart backoff
+        :param max_restarts: Consecutive crashes allowed before giving up
+        :param stable_after: Seconds of uptime after which the crash counter resets
+        :param env: The environment of the process, defaults to this process' environment
+        :param name: A name for log messages
+        """
+        self.argv = list(argv)
+        self.cwd = cwd
+        self.echo = echo
+        self.auto_restart = auto_restart
+        self.restart_backoff = restart_backoff
+        self.max_restart_backoff = max_restart_backoff
+        self.max_restarts = max_restarts
+        self.stable_after = stable_after
+        self.env = env
+        self.name = name or argv[0]
+        self.recent_lines = collections.deque(maxlen=log_capacity)
+        self.process = None
+        self.returncode = None
+        self.restarts = 0
+        self.preexec_fn = None
+        self._line_callbacks = []
+        self._subscribers = []
+        self._monitor_task = None
+        self._exited = None
+        self._stopping = False
+
+    @property
+    def running(self) -> bool:
+        return self.process is not None and self.process.returncode is None
+
+    @property
+    def pid(self) -> Optional[int]:
+        return self.process.pid if self.process is not None else None
+
+    async def start(self):
+        """Starts the process and its output monitor"""
+        if self.running:
+            raise ValueError(f"{self.name} already running pid={self.pid}")
+        self._stopping = False
+        self._exited = asyncio.Event()
+        await self._spawn()
+        self._monitor_task = asyncio.ensure_future(self._monitor())
+
+    async def wait(self) -> int:
+        """Waits for the process to exit for good (after any automatic restarts) and returns its exit code"""
+        if self._monitor_task is None:
+            raise ValueError(f"{self.name} was never started")
+        await self._exited.wait()
+        return self.returncode
+
+    async def stop(self, graceful: Callable[[], Awaitable] = None, timeout: float = 60.0,
+                   kill_timeout: float = 10.0) -> Optional[int]:
+        """
+        Stops the process, first gracefully, then with SIGTERM and finally SIGKILL
+        :param graceful: Coroutine function asking the process to exit, defaults to writing "stop" to its stdin
+        :param timeout: Seconds to wait for a graceful exit
+        :param kill_timeout: Seconds to wait after SIGTERM before SIGKILL
+        :return: The exit code
+        """
+        self._stopping = True
+        if not self.running:
+            return self.returncode
+        try:
+            await (graceful() if graceful else self.send_input("stop"))
+        except (ConnectionError, OSError, asyncio.TimeoutError) as error:
+            logger.warning(f"Graceful stop of {self.name} failed ({error!r})")
+        for signal_process, wait_timeout in ((None, timeout), (self.process.terminate, kill_timeout),
+                                             (self.process.kill, None)):
+            if signal_process is not None:
+                logger.warning(f"{self.name} did not exit, sending {signal_process.__name__}")
+                try:
+                    signal_process()
+                except ProcessLookupError:
+                    pass
+            try:
+                await asyncio.wait_for(asyncio.shield(self._exited.wait()), timeout=wait_timeout)
+                break
+            except asyncio.TimeoutError:
+                continue
+        return self.returncode
+
+    async def send_input(self, text: str):
+        """Writes a line to the process' stdin, the server console"""
+        if not self.running:
+            raise ConnectionError(f"{self.name} not running")
+        self.process.stdin.write(f"{text}\n".encode("utf-8"))
+        await self.process.stdin.drain()
+
+    def add_line_callback(self, callback: Callable[[str], None]):
+        """Calls callback with every line of output, callbacks run on the event loop and must not block"""
+        self._line_callbacks.append(callback)
+
+    def remove_line_callback(self, callback: Callable[[str], None]):
+        if callback in self._line_callbacks:
+            self._line_callbacks.remove(callback)
+
+    async def events(self, kinds: Iterable[str] = None, max_queue: int = 1000):
+        """
+        Async iterator of parsed LogEvents, ends when the process exits for good
+        If the consumer falls more than max_queue events behind the oldest events are dropped
+        :param kinds: Only yield these event kinds, see the EVENT_ constants
+        """
+        queue = asyncio.Queue(maxsize=max_queue)
+        subscriber = (frozenset(kinds) if kinds is not None else None, queue)
+        self._subscribers.append(subscriber)
+        try:
+            while True:
+                event = await queue.get()
+                if event is None:
+                    return
+                yield event
+        finally:
+            self._subscribers.remove(subscriber)
+
+    async def _spawn(self):
+        self.process = await asyncio.create_subprocess_exec(
+            *self.argv, cwd=self.cwd, env=self.env, stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT, preexec_fn=self.preexec_fn, limit=OUTPUT_LINE_LIMIT)
+        self.returncode = None
+        logger.info(f"Started {self.name} pid={self.process.pid}")
+
+    async def _monitor(self):
+        try:
+            while True:
+                started = time.monotonic()
+                await self._pump_output()
+                self.returncode = await self.process.wait()
+                logger.info(f"{self.name} exited with code {self.returncode}")
+                self._publish(LogEvent(EVENT_EXIT, str(self.returncode)))
+                if self._stopping or not self.auto_restart or self.returncode == 0:
+                    return
+                if time.monotonic() - started >= self.stable_after:
+                    self.restarts = 0
+                if self.restarts >= self.max_restarts:
+                    logger.error(f"{self.name} crashed {self.restarts} times in a row, giving up")
+                    return
+                delay = min(self.restart_backoff * 2 ** self.restarts, self.max_restart_backoff)
+                self.restarts += 1
+                logger.warning(f"{self.name} crashed, restart {self.restarts}/{self.max_restarts} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                if self._stopping:
+                    return
+                await self._spawn()
+        finally:
+            self._exited.set()
+            for _, queue in self._subscribers:
+                self._offer(queue, None)
+
+    async def _pump_output(self):
+        stdout = self.process.stdout
+        while True:
+            raw_line = await self._read_line(stdout)
+            if not raw_line:
+                return
+            # decode straight from a zero copy view with the line ending trimmed, the only copy of the text
+            end = len(raw_line) - (2 if raw_line.endswith(b"\r\n") else 1 if raw_line.endswith(b"\n") else 0)
+            line = str(memoryview(raw_line)[:end], "utf-8", "replace")
+            self.recent_lines.append(line)
+            if self.echo:
+                sys.stdout.write(line)
+                sys.stdout.write("\n")
+            for callback in self._line_callbacks:
+                callback(line)
+            if self._subscribers:
+                self._publish(parse_log_line(line))
+
+    async def _read_line(self, stdout: asyncio.StreamReader) -> bytes:
+        """Reads a line like readline, a line past the stream limit is truncated to it instead of raising"""
+        try:
+            return await stdout.readuntil(b"\n")
+        except asyncio.IncompleteReadError as error:
+            return error.partial
+        except asyncio.LimitOverrunError as error:
+            # the overlong data is left buffered, keep its start and drain the rest of the line in chunks
+            start = await stdout.read(error.consumed)
+        line = start[:OUTPUT_LINE_LIMIT]
+        skipped = len(start) - len(line)
+        while True:
+            try:
+                skipped += len(await stdout.readuntil(b"\n"))
+                break
+            except asyncio.IncompleteReadError as error:
+                skipped += len(error.partial)
+                break
+            except asyncio.LimitOverrunError as error:
+                skipped += len(await stdout.read(error.consumed))
+        logger.warning(f"{self.name} printed a line over {OUTPUT_LINE_LIMIT} bytes, dropped its last {skipped} bytes")
+        return line
+
+    def _publish(self, event: LogEvent):
+        for kinds, queue in self._subscribers:
+            if kinds is None or event.kind in kinds:
+                self._offer(queue, event)
+
+    @staticmethod
+    def _offer(queue: asyncio.Queue, event: Optional[LogEvent]):
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait(event)
@@ -0,0 +1,255 @@
+from py_minecraft_server import logger
+import array
+import asyncio
+import csv
+import math
+import os
+import re
+import time
+from typing import Iterable, Optional, TextIO
+
+import psutil
+
+METRICS = ("cpu_percent", "rss_bytes", "threads", "open_fds", "tps", "mspt", "players_online", "players_max",
+           "ping_ms", "gc_pauses", "gc_pause_ms")
+METRIC_HELP = {
+    "cpu_percent": "JVM process cpu usage, 100 is one full core",
+    "rss_bytes": "JVM process resident memory",
+    "threads": "JVM process thread count",
+    "open_fds": "JVM process open file descriptors (handles on windows)",
+    "tps": "Ticks per second",
+    "mspt": "Average milliseconds per tick",
+    "players_online": "Players online",
+    "players_max": "Player slots",
+    "ping_ms": "Server list ping round trip in milliseconds",
+    "gc_pauses": "GC pauses logged since the previous sample, needs -Xlog:gc on stdout",
+    "gc_pause_ms": "Milliseconds spent in GC pauses since the previous sample, needs -Xlog:gc on stdout",
+}
+# vanilla 1.20.3+ "/tick query": "... Average time per tick: 1.2ms (Target: 50.0ms)"
+TICK_QUERY_RE = re.compile(r"Average time per tick: (?P<mspt>[\d.]+)\s*ms.*?Target: (?P<target>[\d.]+)\s*ms", re.S)
+# paper/spigot "/tps": "TPS from last 1m, 5m, 15m: 20.0, 20.0, 20.0", values may be colour coded or starred
+PAPER_TPS_RE = re.compile(r"TPS from last 1m, 5m, 15m: (?:§.)?\*?(?P<tps>[\d.]+)")
+PAPER_MSPT_RE = re.compile(r"(?P<mspt>[\d.]+)/[\d.]+/[\d.]+")
+COLOUR_RE = re.compile(r"§.")
+# unified jvm logging: "[1.234s][info][gc] GC(12) Pause Young (Normal) (G1 Evacuation Pause) 24M->4M(256M) 3.456ms"
+GC_PAUSE_RE = re.compile(r"\[gc\s*\].*GC\(\d+\) Pause.* (?P<ms>[\d.]+)ms$")
+
+
+class RingBuffer:
+    def __init__(self, capacity: int):
+        """A fixed size ring of doubles backed by one array, missing samples are stored as nan"""
+        self.capacity = capacity
+        self.data = array.array("d", [math.nan]) * capacity
+        self.count = 0
+
+    def append(self, value: Optional[float]):
+        self.data[self.count % self.capacity] = math.nan if value is None else value
+        self.count += 1
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def values(self) -> list[float]:
+        """Returns the stored samples oldest first"""
+        if self.count <= self.capacity:
+            return self.data[:self.count].tolist()
+        start = self.count % self.capacity
+        return (self.data[start:] + self.data[:start]).tolist()
+
+    def latest(self) -> float:
+        return self.data[(self.count - 1) % self.capacity] if self.count else math.nan
+
+    def mean(self) -> float:
+        present = [value for value in self.values() if not math.isnan(value)]
+        return sum(present) / len(present) if present else math.nan
+
+
+def parse_tick_stats(response: str) -> tuple[Optional[float], Optional[float]]:
+    """Returns (tps, mspt) from the output of vanilla's "tick query" or paper's "tps"/"mspt" commands"""
+    response = COLOUR_RE.sub("", response)
+    tick_search = TICK_QUERY_RE.search(response)
+    if tick_search:
+        mspt = float(tick_search.group("mspt"))
+        target = float(tick_search.group("target"))
+        return min(1000 / target, 1000 / mspt) if mspt else 1000 / target, mspt
+    tps_search = PAPER_TPS_RE.search(response)
+    if tps_search:
+        return float(tps_search.group("tps")), None
+    mspt_search = PAPER_MSPT_RE.search(response)
+    if mspt_search:
+        return None, float(mspt_search.group("mspt"))
+    return None, None
+
+
+class TelemetrySampler:
+    def __init__(self, host, interval: float = 1.0, capacity: int = 3600, name: str = None):
+        """
+        Samples a hosted server on an interval into fixed size ring buffers, memory use is bounded by capacity
+        Process stats come from psutil, tps/mspt from rcon and player counts from the server list ping
+        :param host: The ServerHost to sample
+        :param interval: Seconds between samples
+        :param capacity: Samples kept per metric
+        :param name: The server label used in exports, defaults to the server dir name
+        """
+        self.host = host
+        self.interval = interval
+        self.capacity = capacity
+        self.name = name or os.path.basename(os.path.abspath(host.server_location))
+        self.timestamps = RingBuffer(capacity)
+        self.buffers = {metric: RingBuffer(capacity) for metric in METRICS}
+        self._process = None
+        self._tick_commands = ["tick query", "tps", "mspt"]
+        self._gc_pauses = 0
+        self._gc_pause_ms = 0.0
+        self._supervisor = None
+        self._task = None
+
+    async def start(self):
+        if self._task is None or self._task.done():
+            self._supervisor = self.host.supervisor
+            if self._supervisor is not None:
+                self._supervisor.add_line_callback(self._feed_line)
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._supervisor is not None:
+            self._supervisor.remove_line_callback(self._feed_line)
+            self._supervisor = None
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        next_sample = loop.time()
+        while True:
+            try:
+                await self.sample()
+            except Exception as error:
+                logger.warning(f"Telemetry sample of {self.name} failed ({error!r})")
+            # schedule against a fixed clock so slow samples dont drift the interval
+            next_sample += self.interval
+            await asyncio.sleep(max(0.0, next_sample - loop.time()))
+
+    async def sample(self) -> dict:
+        """Takes one sample of every metric, storing and returning it"""
+        sample = dict.fromkeys(METRICS)
+        sample.update(self._process_stats())
+        (sample["tps"], sample["mspt"]), status = await asyncio.gather(self._tick_stats(), self._status())
+        sample.update(status)
+        if self._supervisor is not None:
+            sample["gc_pauses"], sample["gc_pause_ms"] = self._gc_pauses, self._gc_pause_ms
+            self._gc_pauses, self._gc_pause_ms = 0, 0.0
+        self.timestamps.append(time.time())
+        for metric in METRICS:
+            self.buffers[metric].append(sample[metric])
+        return sample
+
+    def _feed_line(self, line: str):
+        if "Pause" in line:
+            gc_search = GC_PAUSE_RE.search(line)
+            if gc_search:
+                self._gc_pauses += 1
+                self._gc_pause_ms += float(gc_search.group("ms"))
+
+    def _process_stats(self) -> dict:
+        pid = self.host.supervisor.pid if self.host.is_server_alive() else None
+        if pid is None:
+            self._process = None
+            return {}
+        try:
+            if self._process is None or self._process.pid != pid:
+                self._process = psutil.Process(pid)
+                # the first cpu_percent call only sets the baseline
+                self._process.cpu_percent(None)
+            with self._process.oneshot():
+                return {"cpu_percent": self._process.cpu_percent(None),
+                        "rss_bytes": self._process.memory_info().rss,
+                        "threads": self._process.num_threads(),
+                        "open_fds": self._process.num_fds() if hasattr(self._process, "num_fds")
+                        else self._process.num_handles()}
+        except psutil.Error:
+            self._process = None
+            return {}
+
+    async def _tick_stats(self) -> tuple[Optional[float], Optional[float]]:
+        rcon = self.host.server_rcon
+        if rcon is None:
+            return None, None
+        tps, mspt = None, None
+        # try each known command until one answers, then stick with the ones that work for this server
+        for command in list(self._tick_commands):
+            try:
+                command_tps, command_mspt = parse_tick_stats(await rcon.command(command))
+            except (ConnectionError, asyncio.TimeoutError):
+                return tps, mspt
+            if command_tps is None and command_mspt is None:
+                if len(self._tick_commands) > 1:
+                    self._tick_commands.remove(command)
+                continue
+            tps = tps if command_tps is None else command_tps
+            mspt = mspt if command_mspt is None else command_mspt
+            if tps is not None and mspt is not None:
+                break
+        return tps, mspt
+
+    async def _status(self) -> dict:
+        if not self.host.is_server_alive():
+            return {}
+        try:
+            # a slow ping keeps running in the scanner and is joined by the next sample rather than stacked up
+            status = await asyncio.wait_for(self.host.server_status(max_age=self.interval / 2), timeout=self.interval)
+        except asyncio.TimeoutError:
+            return {}
+        if not status.online:
+            return {}
+        return {"players_online": status.players_online, "players_max": status.players_max,
+                "ping_ms": status.latency_ms}
+
+    def latest(self) -> dict:
+        return {metric: buffer.latest() for metric, buffer in self.buffers.items()}
+
+    def write_csv(self, writer: TextIO, header: bool = True):
+        """Writes every buffered sample as csv rows of timestamp, server, metrics"""
+        csv_writer = csv.writer(writer)
+        if header:
+            csv_writer.writerow(("timestamp", "server") + METRICS)
+        columns = [self.timestamps.values()] + [self.buffers[metric].values() for metric in METRICS]
+        for row in zip(*columns):
+            csv_writer.writerow((row[0], self.name) + tuple("" if math.isnan(value) else value for value in row[1:]))
+
+
+def render_prometheus(samplers: Iterable[TelemetrySampler], prefix: str = "minecraft_server") -> str:
+    """Renders the latest sample of every sampler in the prometheus text exposition format"""
+    samplers = list(samplers)
+    lines = []
+    for metric in METRICS:
+        lines.append(f"# HELP {prefix}_{metric} {METRIC_HELP[metric]}")
+        lines.append(f"# TYPE {prefix}_{metric} gauge")
+        for sampler in samplers:
+            value = sampler.buffers[metric].latest()
+            if not math.isnan(value):
+                lines.append(f'{prefix}_{metric}{{server="{_escape_label(sampler.name)}"}} {value!r}')
+    lines.append(f"# HELP {prefix}_time_to_ready_seconds Seconds from process start until the server was ready")
+    lines.append(f"# TYPE {prefix}_time_to_ready_seconds gauge")
+    for sampler in samplers:
+        if sampler.host.time_to_ready is not None:
+            lines.append(f'{prefix}_time_to_ready_seconds{{server="{_escape_label(sampler.name)}"}} '
+                         f'{sampler.host.time_to_ready!r}')
+    return "\n".join(lines) + "\n"
+
+
+def write_csv_snapshot(samplers: Iterable[TelemetrySampler], location: str):
+    """Writes the buffered samples of every sampler into one csv file"""
+    with open(location, "w", newline="") as writer:
+        for index, sampler in enumerate(samplers):
+            sampler.write_csv(writer, header=not index)
+    logger.debug(f"Wrote telemetry snapshot to {location}")
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
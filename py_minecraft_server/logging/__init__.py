@@ -3,3 +3,5 @@ import logging
 
 logger = logging.getLogger("py-minecraft-server")
 coloredlogs.install(logging.DEBUG, logger=logger)
+
+from .profiling import profiled, enable_profiling, disable_profiling, profiling_enabled
@@ -0,0 +1,176 @@
+from py_minecraft_server.logging import logger
+import asyncio
+import cProfile
+import functools
+import io
+import itertools
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from typing import Iterable
+
+# opts in to profiling without code changes: "cprofile", "tracemalloc", both comma separated, or "all"
+PROFILE_ENV = "PY_MINECRAFT_SERVER_PROFILE"
+# when set, every profiled section also dumps its .prof/.tracemalloc files here for snakeviz, pstats and friends
+PROFILE_DIR_ENV = "PY_MINECRAFT_SERVER_PROFILE_DIR"
+PROFILE_MODES = ("cprofile", "tracemalloc")
+PROFILE_TOP = 20
+
+_modes = frozenset()
+_output_dir = None
+# sections open across every thread, only the outermost one profiles since cProfile cant nest
+_active = 0
+_active_lock = threading.Lock()
+_dump_counter = itertools.count()
+
+
+def parse_profile_modes(value: str) -> frozenset:
+    """Parses the PY_MINECRAFT_SERVER_PROFILE value into the set of profilers to run"""
+    modes = set()
+    for mode in (value or "").lower().replace(" ", "").split(","):
+        if mode in ("1", "true", "all"):
+            modes.update(PROFILE_MODES)
+        elif mode in PROFILE_MODES:
+            modes.add(mode)
+        elif mode and mode not in ("0", "false"):
+            logger.warning(f"Unknown profile mode {mode} in {PROFILE_ENV}, expected one of {PROFILE_MODES}")
+    return frozenset(modes)
+
+
+def enable_profiling(modes: Iterable[str] = PROFILE_MODES, output_dir: str = None):
+    """
+    Turns on profiling of every profiled section, the same as setting PY_MINECRAFT_SERVER_PROFILE
+    :param modes: The profilers to run, cprofile and or tracemalloc
+    :param output_dir: Also dump the raw profiles here
+    """
+    global _modes, _output_dir
+    _modes = parse_profile_modes(",".join(modes))
+    _output_dir = output_dir
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+
+def disable_profiling():
+    global _modes
+    _modes = frozenset()
+
+
+def profiling_enabled() -> bool:
+    return bool(_modes)
+
+
+class _ProfiledSection:
+    def __init__(self, label: str):
+        self.label = label
+        self._counted = False
+        self._running = False
+        self._profile = None
+        self._started_tracing = False
+        self._snapshot = None
+        self._started = None
+
+    def __enter__(self):
+        global _active
+        if not _modes:
+            return self
+        with _active_lock:
+            _active += 1
+            self._counted = True
+            if _active > 1:
+                return self
+        self._running = True
+        if "tracemalloc" in _modes:
+            self._started_tracing = not tracemalloc.is_tracing()
+            if self._started_tracing:
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            self._snapshot = tracemalloc.take_snapshot()
+        if "cprofile" in _modes:
+            self._profile = cProfile.Profile()
+            try:
+                self._profile.enable()
+            except ValueError:
+                # another profiler (python -m cProfile, a debugger) already owns the hook
+                self._profile = None
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        global _active
+        if self._counted:
+            with _active_lock:
+                _active -= 1
+            self._counted = False
+        if not self._running:
+            return
+        self._running = False
+        elapsed = time.perf_counter() - self._started
+        if self._profile is not None:
+            self._profile.disable()
+        dump_location = None
+        if _output_dir:
+            dump_location = os.path.join(_output_dir, f"{self.label}-{os.getpid()}-{next(_dump_counter)}")
+        logger.info(f"Profiled {self.label} in {elapsed:.3f}s")
+        if self._profile is not None:
+            self._report_cprofile(dump_location)
+        if self._snapshot is not None:
+            self._report_tracemalloc(dump_location)
+
+    def __call__(self, function):
+        label = self.label
+        if asyncio.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def profiled_coroutine(*args, **kwargs):
+                if not _modes:
+                    return await function(*args, **kwargs)
+                with _ProfiledSection(label):
+                    return await function(*args, **kwargs)
+            return profiled_coroutine
+
+        @functools.wraps(function)
+        def profiled_function(*args, **kwargs):
+            if not _modes:
+                return function(*args, **kwargs)
+            with _ProfiledSection(label):
+                return function(*args, **kwargs)
+        return profiled_function
+
+    def _report_cprofile(self, dump_location: str):
+        stream = io.StringIO()
+        pstats.Stats(self._profile, stream=stream).sort_stats(pstats.SortKey.CUMULATIVE).print_stats(PROFILE_TOP)
+        logger.debug(f"cProfile of {self.label}:\n{stream.getvalue()}")
+        if dump_location:
+            self._profile.dump_stats(f"{dump_location}.prof")
+        self._profile = None
+
+    def _report_tracemalloc(self, dump_location: str):
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        if self._started_tracing:
+            tracemalloc.stop()
+        # leave out the allocations of tracemalloc itself
+        trace_filters = [tracemalloc.Filter(False, tracemalloc.__file__)]
+        differences = snapshot.filter_traces(trace_filters).compare_to(
+            self._snapshot.filter_traces(trace_filters), "lineno")[:PROFILE_TOP]
+        lines = "\n".join(str(difference) for difference in differences)
+        logger.debug(f"tracemalloc of {self.label}, peak {peak / 1024 ** 2:.2f}MiB, top allocations:\n{lines}")
+        if dump_location:
+            snapshot.dump(f"{dump_location}.tracemalloc")
+        self._snapshot = None
+
+
+def profiled(label: str) -> _ProfiledSection:
+    """
+    Profiles a block or function with cProfile and or tracemalloc when profiling is on, reporting to the logger
+    Works as a context manager and as a decorator of plain and coroutine functions, costs one check when off
+    Coroutines are profiled across their awaits, other tasks the loop runs meanwhile show up in the profile
+    :param label: Names the section in the logs and the dumped files
+    """
+    return _ProfiledSection(label)
+
+
+_env_modes = parse_profile_modes(os.environ.get(PROFILE_ENV, ""))
+if _env_modes:
+    enable_profiling(_env_modes, os.environ.get(PROFILE_DIR_ENV) or None)
@@ -1,8 +1,379 @@
 from py_minecraft_server import logger
+from py_minecraft_server.commands import AsyncRCON, get_rcon_pool, get_status_scanner
+from py_minecraft_server.configuration import PropertiesManager
+from py_minecraft_server.creation.create_server import create_server
+from py_minecraft_server.hosting.host_server import ServerHost
+from py_minecraft_server.hosting.launch_profile import LaunchProfile
+from py_minecraft_server.hosting.readiness import tcp_port_open
+from py_minecraft_server.utils import get_java_major
 import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import shutil
+import socket
+import string
+import tempfile
+from typing import Iterable, Optional
 
-if __name__ == "__main__":
+FLEET_FILENAME = "fleet.json"
+
+
+class PortAllocator:
+    def __init__(self, start: int = 25565, end: int = 27000, reserved: Iterable[int] = ()):
+        """
+        Hands out ports that are neither reserved by the fleet nor bound by anything else on the machine
+        :param start: The first port to hand out
+        :param end: Ports at or above this are never handed out
+        :param reserved: Ports already in use by the fleet
+        """
+        self.start = start
+        self.end = end
+        self.reserved = set(reserved)
+
+    def allocate(self) -> int:
+        for port in range(self.start, self.end):
+            if port not in self.reserved and self.is_free(port):
+                self.reserved.add(port)
+                return port
+        raise ValueError(f"No free ports left between {self.start} and {self.end}")
+
+    def release(self, *ports: int):
+        self.reserved.difference_update(ports)
+
+    @staticmethod
+    def is_free(port: int) -> bool:
+        """Returns True if port can be bound for both tcp (server/rcon) and udp (query)"""
+        for socket_type in (socket.SOCK_STREAM, socket.SOCK_DGRAM):
+            with socket.socket(socket.AF_INET, socket_type) as probe:
+                try:
+                    probe.bind(("", port))
+                except OSError:
+                    return False
+        return True
+
+
+class ServerManager:
+    def __init__(self, fleet_location: str, max_concurrent_boots: int = 2, stagger: float = 5.0,
+                 port_range: tuple[int, int] = (25565, 27000), pin_cpus: bool = False, nice: Optional[int] = None,
+                 fleet_size: Optional[int] = None):
+        """
+        Creates, starts, stops and restarts a fleet of servers kept in subdirectories of fleet_location
+        The fleet (versions, ram, ports, launch profiles) is recorded in fleet_location/fleet.json
+        :param fleet_location: The dir holding every server of the fleet
+        :param max_concurrent_boots: How many JVMs may be booting at once, a boot ends when the server is ready
+        :param stagger: Minimum seconds between the start of consecutive boots
+        :param port_range: The (start, end) ports are assigned from
+        :param pin_cpus: Pin each server without its own launch profile to an even share of the cpus
+        :param nice: The niceness of servers without their own launch profile
+        :param fleet_size: How many servers the host is split between, sizes the heap and cpu share of each server
+            created without its own launch profile, defaults to the size of the fleet when the server is created
+        """
+        self.fleet_location = fleet_location
+        self.fleet_file_location = os.path.join(fleet_location, FLEET_FILENAME)
+        self.max_concurrent_boots = max_concurrent_boots
+        self.stagger = stagger
+        self.pin_cpus = pin_cpus
+        self.nice = nice
+        self.fleet_size = fleet_size
+        os.makedirs(fleet_location, exist_ok=True)
+        self.fleet = self._read_fleet()
+        self.ports = PortAllocator(*port_range, reserved=[port for config in self.fleet.values()
+                                                          for port in self._ports_of(config)])
+        self.hosts = {}
+        self._boot_semaphore = None
+        self._last_boot = 0
+
+    @property
+    def names(self) -> list[str]:
+        return sorted(self.fleet)
+
+    def server_location(self, name: str) -> str:
+        return os.path.join(self.fleet_location, name)
+
+    def get_host(self, name: str) -> ServerHost:
+        """Returns the ServerHost of a server in the fleet, made on first use"""
+        if name not in self.fleet:
+            raise ValueError(f"No server named {name} in fleet {self.fleet_location}")
+        if name not in self.hosts:
+            config = self.fleet[name]
+            self.hosts[name] = ServerHost(self.server_location(name), config["ram_allocation"], config["jar"],
+                                          config["java_ref"], self.launch_profile(name))
+        return self.hosts[name]
+
+    def launch_profile(self, name: str) -> LaunchProfile:
+        """
+        Returns the launch profile a server was created with, servers recorded without one get a fleet share
+        profile that is recorded then, so adding or removing servers never moves a server's cpus or heap
+        """
+        config = self.fleet[name]
+        if not config.get("launch_profile"):
+            config["launch_profile"] = self._fleet_profile(name).to_dict()
+            self._write_fleet()
+        return LaunchProfile.from_dict(config["launch_profile"])
+
+    def _fleet_profile(self, name: str) -> LaunchProfile:
+        """
+        A profile sharing the host between the fleet with ram_allocation as the per server budget, the server takes
+        the lowest cpu slot no other server holds
+        """
+        config = self.fleet[name]
+        taken = {other.get("slot") for other_name, other in self.fleet.items() if other_name != name}
+        config["slot"] = next(slot for slot in itertools.count() if slot not in taken)
+        count = self.fleet_size or len(self.fleet)
+        return LaunchProfile.for_fleet(config["slot"] % count, count, budget_mb=config["ram_allocation"] * 1024,
+                                       pin_cpus=self.pin_cpus, nice=self.nice,
+                                       java_major=get_java_major(config["java_ref"]), name=name)
+
+    async def create(self, name: str, version: str, is_forge: bool = False, ram_allocation: int = 2,
+                     java_ref: str = None, launch_profile: LaunchProfile = None) -> ServerHost:
+        """
+        Creates a server in the fleet and assigns it free server, rcon and query ports
+        A server that fails to create is removed again, files included, so the name can be retried
+        :param is_forge: Not supported yet, fleet servers boot their jar and a forge jar is the installer
+        :param java_ref: The java to run the server with, None picks an installed java the version supports
+        :param launch_profile: A fixed launch profile for the server, defaults to a share of the host, see fleet_size
+        """
+        if is_forge:
+            raise ValueError("Forge servers are not supported in a fleet, the forge installer must be run with "
+                             "--installServer before the server can start")
+        if name in self.fleet:
+            raise ValueError(f"Server {name} already in fleet {self.fleet_location}")
+        if os.path.exists(self.server_location(name)):
+            raise ValueError(f"{self.server_location(name)} already exists and isnt in the fleet")
+        config = {"version": version, "is_forge": is_forge, "ram_allocation": ram_allocation, "jar": "server.jar",
+                  "java_ref": java_ref, "server_port": self.ports.allocate(), "rcon_port": self.ports.allocate(),
+                  "query_port": self.ports.allocate(),
+                  "launch_profile": launch_profile.to_dict() if launch_profile else None}
+        # reserve the name before awaiting so concurrent creates cant collide
+        self.fleet[name] = config
+        try:
+            created = await create_server(self.server_location(name), version, is_forge=is_forge, java_ref=java_ref,
+                                          properties=self._fleet_properties(config))
+            config["java_ref"] = created["java_ref"]
+            if launch_profile is None:
+                # probing the java runs it
+                profile = await asyncio.get_running_loop().run_in_executor(None, self._fleet_profile, name)
+                config["launch_profile"] = profile.to_dict()
+        except BaseException:
+            del self.fleet[name]
+            self.ports.release(*self._ports_of(config))
+            shutil.rmtree(self.server_location(name), ignore_errors=True)
+            logger.warning(f"Removed fleet server {name} after it failed to create")
+            raise
+        self._write_fleet()
+        logger.info(f"Created fleet server {name} version={version} ports={self._ports_of(config)}")
+        return self.get_host(name)
+
+    async def create_many(self, specs: Iterable[dict]) -> list[ServerHost]:
+        """Creates servers concurrently, each spec holds the keyword arguments of create"""
+        return list(await asyncio.gather(*[self.create(**spec) for spec in specs]))
+
+    async def start(self, names: Iterable[str] = None, stdout: bool = False,
+                    ready_timeout: float = 300.0) -> dict:
+        """
+        Starts servers concurrently, at most max_concurrent_boots boot at once and boots are staggered
+        :param names: The servers to start, defaults to the whole fleet
+        :return: A dict of name: exception for servers that failed to start
+        """
+        return await self._for_each(names, lambda name: self._start_one(name, stdout, ready_timeout))
+
+    async def stop(self, names: Iterable[str] = None, timeout: float = 60.0) -> dict:
+        """
+        Stops servers concurrently, servers started by another process are stopped over rcon
+        :param timeout: Seconds each server has to exit, a server stopped over rcon that outlives it fails
+        """
+        return await self._for_each(names, lambda name: self._stop_one(name, timeout))
+
+    async def restart(self, names: Iterable[str] = None, stdout: bool = False, ready_timeout: float = 300.0,
+                      stop_timeout: float = 60.0) -> dict:
+        """Restarts servers concurrently, each server is started as soon as it has stopped"""
+        async def restart_one(name: str):
+            await self._stop_one(name, stop_timeout)
+            await self._start_one(name, stdout, ready_timeout)
+        return await self._for_each(names, restart_one)
+
+    async def broadcast(self, command: str, names: Iterable[str] = None) -> dict:
+        """
+        Runs an rcon command on servers concurrently, for example save-all across the fleet
+        :return: A dict of name: response, or the exception raised for that server
+        """
+        names = list(names or self.names)
+        targets = [("localhost", str(PropertiesManager(self.server_location(name)).get_property("rcon.password")),
+                    self.fleet[name]["rcon_port"]) for name in names]
+        results = await get_rcon_pool().broadcast(targets, command)
+        return {name: results[("localhost", port)] for name, (_, _, port) in zip(names, targets)}
+
+    async def status(self, names: Iterable[str] = None, max_age: float = None) -> list[dict]:
+        """
+        Returns the config of every server with its server list ping status and whether its rcon port is answering
+        The whole fleet is pinged at once through the process wide StatusScanner
+        :param max_age: Seconds a cached ping may be old, defaults to the scanner's ttl
+        """
+        names = list(names or self.names)
+        pings = await get_status_scanner().scan([("localhost", self.fleet[name]["server_port"]) for name in names],
+                                                max_age)
+
+        async def status_one(name: str) -> dict:
+            config = self.fleet[name]
+            host = self.hosts.get(name)
+            ping = pings[("localhost", config["server_port"])]
+            return {"name": name, **config, "online": ping.online,
+                    "rcon": await tcp_port_open("localhost", config["rcon_port"]),
+                    "players_online": ping.players_online, "players_max": ping.players_max,
+                    "latency_ms": ping.latency_ms, "motd": ping.motd,
+                    "managed": host is not None and host.is_server_alive(),
+                    "time_to_ready": host.time_to_ready if host else None}
+        return list(await asyncio.gather(*[status_one(name) for name in names]))
+
+    async def _for_each(self, names: Optional[Iterable[str]], action) -> dict:
+        names = list(names or self.names)
+        results = await asyncio.gather(*[action(name) for name in names], return_exceptions=True)
+        failures = {name: result for name, result in zip(names, results) if isinstance(result, BaseException)}
+        for name, failure in failures.items():
+            logger.error(f"Fleet server {name} failed: {failure!r}")
+        return failures
+
+    async def _start_one(self, name: str, stdout: bool, ready_timeout: float):
+        host = self.get_host(name)
+        if host.is_server_alive():
+            logger.warning(f"Fleet server {name} already running")
+            return
+        if self._boot_semaphore is None:
+            self._boot_semaphore = asyncio.Semaphore(self.max_concurrent_boots)
+        async with self._boot_semaphore:
+            loop = asyncio.get_running_loop()
+            # reserve the next boot slot before sleeping so concurrent boots queue up stagger seconds apart
+            boot_at = max(loop.time(), self._last_boot + self.stagger)
+            self._last_boot = boot_at
+            await asyncio.sleep(boot_at - loop.time())
+            await host.start_server(stdout=stdout, ready_timeout=ready_timeout)
+
+    async def _stop_one(self, name: str, timeout: float):
+        host = self.get_host(name)
+        if host.server_rcon is not None:
+            await host.stop_server(timeout=timeout)
+            return
+        config = self.fleet[name]
+        if not await tcp_port_open("localhost", config["rcon_port"]):
+            logger.debug(f"Fleet server {name} not running")
+            return
+        password = PropertiesManager(self.server_location(name)).get_property("rcon.password")
+        async with AsyncRCON("localhost", password, config["rcon_port"]) as rcon:
+            try:
+                await rcon.command("stop")
+            except (ConnectionError, asyncio.TimeoutError):
+                pass
+        # not our process, so all we can do is wait for it to close its port
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while await tcp_port_open("localhost", config["server_port"]):
+            if loop.time() >= deadline:
+                raise TimeoutError(f"Fleet server {name} still listening on port {config['server_port']} "
+                                   f"{timeout}s after the stop command")
+            await asyncio.sleep(0.5)
+        logger.info(f"Fleet server {name} stopped over rcon")
+
+    @staticmethod
+    def _fleet_properties(config: dict) -> dict:
+        """
+        The server.properties values a fleet server is created with, its ports and rcon for fleet commands
+        Query stays off, status comes from the server list ping on the server port, its port is reserved regardless
+        """
+        return {"server-port": config["server_port"], "rcon.port": config["rcon_port"],
+                "query.port": config["query_port"], "enable-rcon": True,
+                "rcon.password": "".join(random.choice(string.ascii_letters) for _ in range(16))}
+
+    @staticmethod
+    def _ports_of(config: dict) -> list[int]:
+        return [config["server_port"], config["rcon_port"], config["query_port"]]
+
+    def _read_fleet(self) -> dict:
+        try:
+            with open(self.fleet_file_location) as reader:
+                return json.load(reader)["servers"]
+        except FileNotFoundError:
+            return {}
+
+    def _write_fleet(self):
+        handle, temp_location = tempfile.mkstemp(suffix=".tmp", dir=self.fleet_location)
+        with os.fdopen(handle, "w") as writer:
+            json.dump({"servers": self.fleet}, writer, indent=2)
+        os.replace(temp_location, self.fleet_file_location)
+
+
+async def _run_cli(args: dict):
+    manager = ServerManager(args["fleet"], max_concurrent_boots=args["max_boots"], stagger=args["stagger"],
+                            pin_cpus=args["pin_cpus"], nice=args["nice"], fleet_size=args["fleet_size"])
+    names = None if args.get("all") or not args.get("names") else args["names"]
+    command = args["command"]
+    if command == "create":
+        await manager.create(args["name"], args["version"], ram_allocation=args["ram"], java_ref=args["java"])
+    elif command == "status":
+        for status in await manager.status(names):
+            print(f"{status['name']:<20} {status['version']:<10} port={status['server_port']:<6} "
+                  f"rcon={status['rcon_port']:<6} " + (f"online {status['players_online']}/{status['players_max']} "
+                                                         f"{status['latency_ms']:.1f}ms" if status["online"]
+                                                         else "offline"))
+    elif command == "stop":
+        await manager.stop(names)
+    elif command == "rcon":
+        for name, response in (await manager.broadcast(" ".join(args["rcon_command"]), names)).items():
+            print(f"{name}: {response}")
+    elif command in ("start", "restart"):
+        failures = await (manager.start(names, args["stdout"]) if command == "start"
+                          else manager.restart(names, args["stdout"]))
+        started = [name for name in (names or manager.names) if name not in failures]
+        if not started:
+            return
+        # the servers are children of this process so it stays up until interrupted, then stops them
+        logger.info(f"Fleet running {started}, press ctrl+c to stop")
+        try:
+            while any(manager.get_host(name).is_server_alive() for name in started):
+                await asyncio.sleep(1)
+        finally:
+            await manager.stop(started)
+
+
+def main(argv: list[str] = None):
     parser = argparse.ArgumentParser(description="Manage Minecraft Servers")
-    parser.add_argument("-c", "--create", type=str, help="Name of server to create")
-    args = vars(parser.parse_args())
-    print(args)
+    parser.add_argument("fleet", type=str, help="Dir holding the fleet of servers")
+    parser.add_argument("--max-boots", type=int, default=2, help="Max servers booting at once")
+    parser.add_argument("--stagger", type=float, default=5.0, help="Seconds between consecutive boots")
+    parser.add_argument("--pin-cpus", action="store_true", help="Pin each server to an even share of the cpus")
+    parser.add_argument("--nice", type=int, default=None, help="Niceness of the server processes")
+    parser.add_argument("--fleet-size", type=int, default=None,
+                        help="Servers the host is split between when sizing new servers, defaults to the fleet size")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    create_parser = commands.add_parser("create", help="Create a server in the fleet")
+    create_parser.add_argument("name", type=str, help="Name of server to create")
+    create_parser.add_argument("-v", "--version", type=str, required=True, help="Minecraft version")
+    create_parser.add_argument("--ram", type=int, default=2, help="GB of ram for the server")
+    create_parser.add_argument("--java", type=str, default=None,
+                               help="Java executable to run the server with, defaults to one the version supports")
+
+    for command in ("start", "stop", "restart", "status"):
+        command_parser = commands.add_parser(command, help=f"{command.capitalize()} servers in the fleet")
+        command_parser.add_argument("names", type=str, nargs="*", help="Servers to act on")
+        command_parser.add_argument("-a", "--all", action="store_true", help="Act on every server in the fleet")
+        if command in ("start", "restart"):
+            command_parser.add_argument("--stdout", action="store_true", help="Echo server output")
+
+    rcon_parser = commands.add_parser("rcon", help="Run an rcon command on servers in the fleet")
+    rcon_parser.add_argument("rcon_command", type=str, nargs="+", help="The command to run")
+    rcon_parser.add_argument("-n", "--names", type=str, nargs="*", help="Servers to act on, defaults to all")
+
+    args = vars(parser.parse_args(argv))
+    if args["command"] in ("start", "stop", "restart") and not args["names"] and not args["all"]:
+        parser.error(f"{args['command']} needs server names or --all")
+    try:
+        asyncio.run(_run_cli(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
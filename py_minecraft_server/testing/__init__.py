@@ -0,0 +1,5 @@
+from .fake_rcon import FakeRCONServer
+from .fake_status import FakeStatusServer
+from .fake_query import FakeQueryServer
+from .fake_http import FakeJarHost
+from .stub_java import write_stub_java
@@ -0,0 +1,294 @@
+from py_minecraft_server import logger
+from py_minecraft_server.configuration import PropertiesManager
+from py_minecraft_server.creation import JarCache, create_server, download_jar, set_jar_cache
+from py_minecraft_server.hosting.host_server import ServerHost
+from py_minecraft_server.hosting.profile_benchmark import percentile
+from py_minecraft_server.logging import enable_profiling
+from py_minecraft_server.testing.fake_http import FakeJarHost
+from py_minecraft_server.testing.stub_java import write_stub_java
+from py_minecraft_server.utils import get_async_http_client, set_external_ip_lookup, set_version_index
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import shutil
+import socket
+import statistics
+import sys
+import tempfile
+import time
+from typing import Iterable, Optional
+
+RESULTS_FORMAT = 1
+BENCHMARK_VERSION = "1.20.4"
+BENCHMARK_JAVA_MAJOR = 17
+DEFAULT_JAR_SIZE = 16 * 1024 ** 2
+DEFAULT_STARTUP_SECONDS = 0.2
+# a median this much worse than the baseline's is a regression
+DEFAULT_TOLERANCE = 0.1
+
+
+def summarize(samples: list[float], unit: str = "s", better: str = "lower") -> dict:
+    """Summarises the samples of one metric, better says whether lower or higher values are an improvement"""
+    return {"unit": unit, "better": better, "n": len(samples), "min": min(samples),
+            "median": statistics.median(samples), "mean": statistics.fmean(samples), "p90": percentile(samples, 0.9),
+            "max": max(samples)}
+
+
+def _free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+class BenchmarkEnvironment:
+    def __init__(self, jar_size: int = DEFAULT_JAR_SIZE, startup_seconds: float = DEFAULT_STARTUP_SECONDS,
+                 work_dir: str = None):
+        """
+        Everything the benchmarks run against, with no network and no real java: a FakeJarHost serving the version
+        manifest and jars, a stub java and a scratch dir holding servers and caches
+        The process wide version index and jar cache point at the stand ins while it is open, and the external ip
+        logged by start_server is answered locally so server start timings dont depend on the network
+        :param jar_size: Bytes of the served server jar
+        :param startup_seconds: Seconds the stub server takes to report done
+        :param work_dir: Where to put the scratch dir, defaults to the system temp dir
+        """
+        self.jar_size = jar_size
+        self.startup_seconds = startup_seconds
+        self.work_dir = work_dir
+        self.scratch_dir = None
+        self.jar_host = None
+        self.stub_java = None
+        self._previous_index = None
+        self._previous_cache = None
+        self._previous_ip_lookup = None
+        self._counter = 0
+
+    async def __aenter__(self) -> "BenchmarkEnvironment":
+        self.scratch_dir = tempfile.mkdtemp(prefix="py-minecraft-server-bench-", dir=self.work_dir)
+        self.jar_host = FakeJarHost([(BENCHMARK_VERSION, BENCHMARK_JAVA_MAJOR)], self.jar_size).start()
+        self._previous_index = set_version_index(self.jar_host.version_index(self.path("versions")))
+        self._previous_cache = set_jar_cache(JarCache(self.path("jars")))
+        self._previous_ip_lookup = set_external_ip_lookup(lambda: "127.0.0.1")
+        self.stub_java = write_stub_java(self.path("java"), self.startup_seconds, BENCHMARK_JAVA_MAJOR)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        set_version_index(self._previous_index)
+        set_jar_cache(self._previous_cache)
+        set_external_ip_lookup(self._previous_ip_lookup)
+        await get_async_http_client().close()
+        self.jar_host.close()
+        shutil.rmtree(self.scratch_dir, ignore_errors=True)
+
+    def path(self, *parts: str) -> str:
+        return os.path.join(self.scratch_dir, *parts)
+
+    def fresh_jar_cache(self) -> JarCache:
+        """Swaps in an empty jar cache, so the next jar fetch downloads"""
+        self._counter += 1
+        jar_cache = JarCache(self.path(f"jars-{self._counter}"))
+        set_jar_cache(jar_cache)
+        return jar_cache
+
+    def new_server_location(self) -> str:
+        """Returns a server dir location that doesnt exist yet"""
+        self._counter += 1
+        return self.path("servers", f"server-{self._counter}")
+
+    @staticmethod
+    def server_properties() -> dict:
+        """server.properties values with free ports, so servers dont collide with each other or real servers"""
+        return {"server-port": _free_port(), "rcon.port": _free_port(), "query.port": _free_port()}
+
+
+async def bench_properties(env: BenchmarkEnvironment, iterations: int) -> dict:
+    """Times templating, parsing, cached reads and validated writes of server.properties"""
+    create_samples, read_samples, cached_samples, write_samples = [], [], [], []
+    for _ in range(iterations):
+        location = env.new_server_location()
+        os.makedirs(location)
+        started = time.perf_counter()
+        PropertiesManager.create(location, env.server_properties())
+        create_samples.append(time.perf_counter() - started)
+    manager = PropertiesManager(location)
+    for index in range(iterations):
+        started = time.perf_counter()
+        PropertiesManager(location).get_properties()
+        read_samples.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        manager.get_property("motd")
+        cached_samples.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        manager.set_properties(motd=f"Benchmark {index}")
+        write_samples.append(time.perf_counter() - started)
+    return {"properties_create": summarize(create_samples), "properties_read": summarize(read_samples),
+            "properties_read_cached": summarize(cached_samples), "properties_write": summarize(write_samples)}
+
+
+async def bench_download_jar(env: BenchmarkEnvironment, iterations: int) -> dict:
+    """Times jar downloads into an empty jar cache and jar fetches served from the cache"""
+    cold_samples, throughput_samples, cached_samples = [], [], []
+    for _ in range(iterations):
+        env.fresh_jar_cache()
+        save_location = os.path.join(env.new_server_location(), "server.jar")
+        started = time.perf_counter()
+        await download_jar(BENCHMARK_VERSION, save_location, False, True)
+        elapsed = time.perf_counter() - started
+        cold_samples.append(elapsed)
+        throughput_samples.append(env.jar_size / elapsed)
+        started = time.perf_counter()
+        await download_jar(BENCHMARK_VERSION, os.path.join(env.new_server_location(), "server.jar"), False, True)
+        cached_samples.append(time.perf_counter() - started)
+    return {"download_jar": summarize(cold_samples), "download_jar_cached": summarize(cached_samples),
+            "download_jar_throughput": summarize(throughput_samples, "B/s", "higher")}
+
+
+async def bench_create_server(env: BenchmarkEnvironment, iterations: int) -> dict:
+    """Times create_server with the jar cached, per stage, and with a first boot of the stub server"""
+    stage_samples = {}
+    boot_samples = []
+    # the first creation fills the jar cache
+    await create_server(env.new_server_location(), BENCHMARK_VERSION, java_ref=env.stub_java,
+                        properties=env.server_properties())
+    for _ in range(iterations):
+        created = await create_server(env.new_server_location(), BENCHMARK_VERSION, java_ref=env.stub_java,
+                                      properties=env.server_properties())
+        for stage, seconds in created["timings"].items():
+            stage_samples.setdefault(stage, []).append(seconds)
+        created = await create_server(env.new_server_location(), BENCHMARK_VERSION, java_ref=env.stub_java,
+                                      properties=env.server_properties(), first_boot=True, boot_timeout=60)
+        boot_samples.append(created["timings"]["total"])
+    results = {f"create_server_{stage}": summarize(samples) for stage, samples in stage_samples.items()
+               if stage != "total"}
+    results["create_server"] = summarize(stage_samples["total"])
+    results["create_server_first_boot"] = summarize(boot_samples)
+    return results
+
+
+async def bench_start_stop(env: BenchmarkEnvironment, iterations: int) -> dict:
+    """Times ServerHost.start_server and stop_server of one stub server, and its time to ready"""
+    location = env.new_server_location()
+    await create_server(location, BENCHMARK_VERSION, java_ref=env.stub_java, properties=env.server_properties())
+    host = ServerHost(location, 1, "server.jar", env.stub_java)
+    start_samples, ready_samples, stop_samples = [], [], []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        await host.start_server(ready_timeout=60)
+        start_samples.append(time.perf_counter() - started)
+        ready_samples.append(host.time_to_ready)
+        started = time.perf_counter()
+        await host.stop_server()
+        stop_samples.append(time.perf_counter() - started)
+    return {"start_server": summarize(start_samples), "time_to_ready": summarize(ready_samples),
+            "stop_server": summarize(stop_samples)}
+
+
+BENCHMARKS = {"properties": bench_properties, "download_jar": bench_download_jar,
+              "create_server": bench_create_server, "start_stop": bench_start_stop}
+DEFAULT_ITERATIONS = {"properties": 200, "download_jar": 5, "create_server": 5, "start_stop": 3}
+
+
+async def run_benchmarks(names: Iterable[str] = None, iterations: int = None, jar_size: int = DEFAULT_JAR_SIZE,
+                         startup_seconds: float = DEFAULT_STARTUP_SECONDS, work_dir: str = None) -> dict:
+    """
+    Runs benchmarks of the library's hot paths against local stand ins
+    :param names: The benchmarks to run, defaults to every one in BENCHMARKS
+    :param iterations: Samples per metric, defaults to DEFAULT_ITERATIONS of each benchmark
+    :param jar_size: Bytes of the served server jar
+    :param startup_seconds: Seconds the stub server takes to report done
+    :return: The results document, {"results": {metric: summary}} plus the environment they were measured in
+    """
+    names = list(names or BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        raise ValueError(f"Unknown benchmarks {unknown}, expected some of {list(BENCHMARKS)}")
+    results = {"format": RESULTS_FORMAT, "created": time.time(),
+               "environment": {"python": platform.python_version(), "platform": platform.platform(),
+                               "cpus": os.cpu_count()},
+               "config": {"benchmarks": names, "iterations": iterations, "jar_size": jar_size,
+                          "startup_seconds": startup_seconds},
+               "results": {}}
+    async with BenchmarkEnvironment(jar_size, startup_seconds, work_dir) as env:
+        for name in names:
+            started = time.perf_counter()
+            results["results"].update(await BENCHMARKS[name](env, iterations or DEFAULT_ITERATIONS[name]))
+            logger.info(f"Benchmark {name} took {time.perf_counter() - started:.2f}s")
+    return results
+
+
+def write_results(results: dict, location: str):
+    handle, temp_location = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(os.path.abspath(location)))
+    with os.fdopen(handle, "w") as writer:
+        json.dump(results, writer, indent=2)
+    os.replace(temp_location, location)
+
+
+def load_results(location: str) -> dict:
+    with open(location) as reader:
+        results = json.load(reader)
+    if results.get("format") != RESULTS_FORMAT:
+        raise ValueError(f"{location} is not a benchmark results file of format {RESULTS_FORMAT}")
+    return results
+
+
+def compare_results(baseline: dict, current: dict, tolerance: float = DEFAULT_TOLERANCE) -> list[dict]:
+    """
+    Compares the medians of the metrics both results have
+    :param tolerance: The fraction a median may get worse by before it counts as a regression
+    :return: A dict per metric of the baseline and current medians, the relative change and whether it regressed
+    """
+    comparisons = []
+    for metric, summary in current["results"].items():
+        baseline_summary = baseline["results"].get(metric)
+        if baseline_summary is None or baseline_summary["unit"] != summary["unit"] or not baseline_summary["median"]:
+            continue
+        change = (summary["median"] - baseline_summary["median"]) / baseline_summary["median"]
+        worse = change if summary["better"] == "lower" else -change
+        comparisons.append({"metric": metric, "baseline": baseline_summary["median"], "current": summary["median"],
+                            "change": change, "regression": worse > tolerance})
+    return comparisons
+
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the library against local stand ins")
+    parser.add_argument("benchmarks", nargs="*", help=f"The benchmarks to run, some of {list(BENCHMARKS)}, default all")
+    parser.add_argument("--iterations", type=int, help="Samples per metric")
+    parser.add_argument("--jar-size-mb", type=float, default=DEFAULT_JAR_SIZE / 1024 ** 2)
+    parser.add_argument("--startup-seconds", type=float, default=DEFAULT_STARTUP_SECONDS,
+                        help="Seconds the stub server takes to start")
+    parser.add_argument("--output", help="Write the results json here")
+    parser.add_argument("--baseline", help="A results json to compare against, regressions exit with code 1")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="The fraction a median may get worse by before it is a regression")
+    parser.add_argument("--profile", help="Profile the library while benchmarking: cprofile, tracemalloc or all")
+    parser.add_argument("--profile-dir", help="Dump the raw profiles here")
+    parser.add_argument("--log-level", default="WARNING", help="The library log level while benchmarking")
+    args = parser.parse_args(argv)
+    logger.setLevel(args.log_level.upper())
+    if args.profile:
+        # profile reports are logged so they have to get through the level
+        logger.setLevel(min(logger.level, logging.DEBUG))
+        enable_profiling(args.profile.split(","), args.profile_dir)
+
+    results = asyncio.run(run_benchmarks(args.benchmarks, args.iterations, int(args.jar_size_mb * 1024 ** 2),
+                                         args.startup_seconds))
+    for metric, summary in results["results"].items():
+        print(f"{metric:<36} median={summary['median']:.6g}{summary['unit']} p90={summary['p90']:.6g}"
+              f"{summary['unit']} n={summary['n']}")
+    if args.output:
+        write_results(results, args.output)
+    if args.baseline:
+        comparisons = compare_results(load_results(args.baseline), results, args.tolerance)
+        for comparison in comparisons:
+            print(f"{comparison['metric']:<36} {comparison['change']:+.1%}"
+                  f"{' REGRESSION' if comparison['regression'] else ''}")
+        if any(comparison["regression"] for comparison in comparisons):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,194 @@
+from py_minecraft_server import logger
+from py_minecraft_server.utils.version_index import VersionIndex
+import hashlib
+import http.server
+import json
+import random
+import re
+import threading
+import time
+from typing import Iterable
+
+RANGE_RE = re.compile(r"^bytes=(?P<start>\d*)-(?P<end>\d*)$")
+FORGE_BUILD = "47.2.0"
+
+
+class _FakeJarHandler(http.server.BaseHTTPRequestHandler):
+    # keep alive, so pooled clients reuse connections like they do against the real hosts
+    protocol_version = "HTTP/1.1"
+
+    def do_HEAD(self):
+        self._respond(body=False)
+
+    def do_GET(self):
+        self._respond(body=True)
+
+    def _respond(self, body: bool):
+        host = self.server.fake_host
+        host.requests[self.path] = host.requests.get(self.path, 0) + 1
+        if host.latency:
+            time.sleep(host.latency)
+        if host.take_failure():
+            self._send(503, b"", body)
+            return
+        document = host.files.get(self.path.split("?")[0])
+        if document is None:
+            self._send(404, b"", body)
+            return
+        data, content_type, etag = document
+        if self.headers.get("If-None-Match") == etag:
+            self._send(304, b"", body, {"ETag": etag})
+            return
+        headers = {"Content-Type": content_type, "ETag": etag}
+        if host.ranges:
+            headers["Accept-Ranges"] = "bytes"
+        range_match = RANGE_RE.match(self.headers.get("Range", "")) if host.ranges else None
+        if range_match and (range_match.group("start") or range_match.group("end")):
+            if range_match.group("start"):
+                start = int(range_match.group("start"))
+                end = min(int(range_match.group("end") or len(data) - 1), len(data) - 1)
+            else:
+                start, end = max(0, len(data) - int(range_match.group("end"))), len(data) - 1
+            if start > end:
+                self._send(416, b"", body, {"Content-Range": f"bytes */{len(data)}"})
+                return
+            headers["Content-Range"] = f"bytes {start}-{end}/{len(data)}"
+            self._send(206, data[start:end + 1], body, headers)
+            return
+        self._send(200, data, body, headers)
+
+    def _send(self, status: int, data: bytes, body: bool, headers: dict = None):
+        self.send_response(status)
+        for header, value in (headers or {}).items():
+            self.send_header(header, value)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        if body and data:
+            self.wfile.write(data)
+            self.server.fake_host.bytes_sent += len(data)
+
+    def log_message(self, format, *args):
+        logger.debug(f"Fake jar host {self.address_string()} {format % args}")
+
+
+class FakeJarHost:
+    def __init__(self, versions: Iterable[tuple[str, int]] = (("1.20.4", 17),), jar_size: int = 4 * 1024 ** 2,
+                 host: str = "127.0.0.1", port: int = 0, ranges: bool = True, latency: float = 0.0,
+                 failures: int = 0):
+        """
+        A local stand in for Mojang's version manifest, the version jsons, the server jars and forge's promotions
+        and maven, for tests and benchmarks that must not touch the network
+        Serves HEAD, GET, ETag revalidation and byte ranges from memory in a background thread, so blocking clients
+        on the event loop thread cant deadlock it
+        :param versions: (version, java major) of every version, the last one is the latest release
+        :param jar_size: Bytes of each server jar, jars are deterministic random bytes that differ per version
+        :param host: The host to listen on
+        :param port: The port to listen on, 0 picks a free port
+        :param ranges: Advertise and answer Range requests, off forces single stream downloads
+        :param latency: Seconds to wait before answering each request
+        :param failures: Answer this many requests with 503 before serving normally, to exercise retries
+        """
+        self.versions = list(versions)
+        self.jar_size = jar_size
+        self.host = host
+        self.port = port
+        self.ranges = ranges
+        self.latency = latency
+        self.failures = failures
+        self.files = {}
+        self.requests = {}
+        self.bytes_sent = 0
+        self._jar_sha1s = {}
+        self._server = None
+        self._thread = None
+        self._failures_lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    @property
+    def manifest_url(self) -> str:
+        return f"{self.base_url}/mc/game/version_manifest_v2.json"
+
+    @property
+    def forge_promotions_url(self) -> str:
+        return f"{self.base_url}/forge/promotions_slim.json"
+
+    @property
+    def forge_maven_url(self) -> str:
+        return f"{self.base_url}/maven/net/minecraftforge/forge"
+
+    def take_failure(self) -> bool:
+        """Returns True if the current request should fail, using up one of the failures"""
+        with self._failures_lock:
+            if self.failures <= 0:
+                return False
+            self.failures -= 1
+            return True
+
+    def jar(self, version: str) -> bytes:
+        """The server jar served for a version"""
+        return self.files[f"/v1/objects/{self.jar_sha1(version)}/server.jar"][0]
+
+    def jar_sha1(self, version: str) -> str:
+        return self._jar_sha1s[version]
+
+    def version_index(self, cache_dir: str, ttl: float = 3600) -> VersionIndex:
+        """Returns a version index reading from this host, to pass to set_version_index"""
+        return VersionIndex(cache_dir, ttl, self.manifest_url, self.forge_promotions_url, self.forge_maven_url)
+
+    def start(self) -> "FakeJarHost":
+        self._server = http.server.ThreadingHTTPServer((self.host, self.port), _FakeJarHandler)
+        self._server.daemon_threads = True
+        self._server.fake_host = self
+        self.port = self._server.server_address[1]
+        self._build_files()
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-jar-host", daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _build_files(self):
+        self.files = {}
+        self._jar_sha1s = {}
+        manifest_versions = []
+        promotions = {}
+        for version, java_major in self.versions:
+            jar = random.Random(version).randbytes(self.jar_size)
+            jar_sha1 = hashlib.sha1(jar).hexdigest()
+            self._jar_sha1s[version] = jar_sha1
+            self._add_file(f"/v1/objects/{jar_sha1}/server.jar", jar, "application/java-archive", jar_sha1)
+            details = json.dumps({
+                "id": version, "type": "release", "javaVersion": {"majorVersion": java_major},
+                "downloads": {"server": {"sha1": jar_sha1, "size": len(jar),
+                                         "url": f"{self.base_url}/v1/objects/{jar_sha1}/server.jar"}}}).encode()
+            details_sha1 = hashlib.sha1(details).hexdigest()
+            self._add_file(f"/v1/packages/{details_sha1}/{version}.json", details, "application/json", details_sha1)
+            manifest_versions.append({"id": version, "type": "release", "sha1": details_sha1,
+                                      "url": f"{self.base_url}/v1/packages/{details_sha1}/{version}.json"})
+            build = f"{version}-{FORGE_BUILD}"
+            promotions[f"{version}-recommended"] = FORGE_BUILD
+            self._add_file(f"/maven/net/minecraftforge/forge/{build}/forge-{build}-installer.jar", jar,
+                           "application/java-archive", jar_sha1)
+        latest = self.versions[-1][0] if self.versions else None
+        # the real manifest lists the newest version first
+        manifest = {"latest": {"release": latest, "snapshot": latest}, "versions": manifest_versions[::-1]}
+        self._add_file("/mc/game/version_manifest_v2.json", json.dumps(manifest).encode(), "application/json")
+        self._add_file("/forge/promotions_slim.json", json.dumps({"promos": promotions}).encode(), "application/json")
+
+    def _add_file(self, path: str, data: bytes, content_type: str, sha1: str = None):
+        # etags are computed once here rather than hashing the jars on every request
+        self.files[path] = (data, content_type, f'"{sha1 or hashlib.sha1(data).hexdigest()}"')
@@ -0,0 +1,81 @@
+import asyncio
+import random
+import struct
+from typing import Iterable
+
+QUERY_MAGIC = b"\xfe\xfd"
+TYPE_HANDSHAKE = 0x09
+TYPE_STAT = 0x00
+
+
+class FakeQueryServer(asyncio.DatagramProtocol):
+    def __init__(self, motd: str = "A Minecraft Server", players: Iterable[str] = (), max_players: int = 20,
+                 version: str = "1.20.4", map_name: str = "world", host: str = "127.0.0.1", port: int = 0,
+                 server_port: int = 25565):
+        """
+        A local stand in for a minecraft query (GameSpy4) listener, for tests and benchmarks
+        Answers handshakes, basic and full stat requests, stats are only sent for a valid challenge token
+        :param players: The names of the online players
+        :param host: The host to listen on
+        :param port: The port to listen on, 0 picks a free port
+        :param server_port: The game port reported in the stats, like vanilla does
+        """
+        super().__init__()
+        self.motd = motd
+        self.players = list(players)
+        self.max_players = max_players
+        self.version = version
+        self.map_name = map_name
+        self.host = host
+        self.port = port
+        self.server_port = server_port
+        self.requests = 0
+        self._transport = None
+        self._tokens = {}
+
+    async def start(self) -> "FakeQueryServer":
+        self._transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+            lambda: self, local_addr=(self.host, self.port))
+        self.port = self._transport.get_extra_info("sockname")[1]
+        return self
+
+    async def close(self):
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def datagram_received(self, data: bytes, addr):
+        if len(data) < 7 or data[:2] != QUERY_MAGIC:
+            return
+        self.requests += 1
+        packet_type, session = data[2], data[3:7]
+        if packet_type == TYPE_HANDSHAKE:
+            token = random.randint(1, 2 ** 31 - 1)
+            self._tokens[addr] = token
+            self._transport.sendto(bytes([TYPE_HANDSHAKE]) + session + str(token).encode() + b"\x00", addr)
+        elif packet_type == TYPE_STAT and len(data) >= 11:
+            if struct.unpack(">i", data[7:11])[0] != self._tokens.get(addr):
+                return
+            # a full stat request pads the token with four bytes
+            stats = self._full_stat() if len(data) >= 15 else self._basic_stat()
+            self._transport.sendto(bytes([TYPE_STAT]) + session + stats, addr)
+
+    def _basic_stat(self) -> bytes:
+        fields = [self.motd, "SMP", self.map_name, str(len(self.players)), str(self.max_players)]
+        return (b"".join(field.encode("utf-8") + b"\x00" for field in fields) + struct.pack("<H", self.server_port)
+                + self.host.encode() + b"\x00")
+
+    def _full_stat(self) -> bytes:
+        values = {"hostname": self.motd, "gametype": "SMP", "game_id": "MINECRAFT", "version": self.version,
+                  "plugins": "", "map": self.map_name, "numplayers": str(len(self.players)),
+                  "maxplayers": str(self.max_players), "hostport": str(self.server_port), "hostip": self.host}
+        key_values = b"".join(key.encode() + b"\x00" + value.encode("utf-8") + b"\x00"
+                              for key, value in values.items())
+        players = b"".join(player.encode("utf-8") + b"\x00" for player in self.players)
+        return b"splitnum\x00\x80\x00" + key_values + b"\x00\x01player_\x00\x00" + players + b"\x00"
@@ -0,0 +1,82 @@
+from py_minecraft_server.commands.async_rcon import (encode_packet, read_packet, MAX_RESPONSE_PAYLOAD, TYPE_COMMAND,
+                                                     TYPE_LOGIN, TYPE_RESPONSE)
+import asyncio
+from typing import Callable, Union
+
+
+class FakeRCONServer:
+    def __init__(self, password: str = "password", handler: Callable[[str], Union[str, None]] = None,
+                 host: str = "127.0.0.1", port: int = 0, delay: float = 0.0):
+        """
+        A local stand in for a minecraft rcon listener, for tests and benchmarks
+        Answers like a vanilla server: splits long responses into 4096 byte packets, answers unknown packet types
+        with "Unknown request" and rejects bad passwords with request id -1
+        :param password: The password clients must log in with
+        :param handler: Called with each command, returns the response, defaults to echoing the command
+        :param host: The host to listen on
+        :param port: The port to listen on, 0 picks a free port
+        :param delay: Seconds to wait before answering each command
+        """
+        self.password = password
+        self.handler = handler or (lambda command: command)
+        self.host = host
+        self.port = port
+        self.delay = delay
+        self.commands = []
+        self.connections = 0
+        self._server = None
+        self._writers = set()
+
+    async def start(self) -> "FakeRCONServer":
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            for writer in list(self._writers):
+                writer.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    def drop_connections(self):
+        """Closes every client connection, for testing reconnects"""
+        for writer in list(self._writers):
+            writer.close()
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        self._writers.add(writer)
+        authenticated = False
+        try:
+            while True:
+                request_id, packet_type, body = await read_packet(reader)
+                if packet_type == TYPE_LOGIN:
+                    authenticated = body.decode("utf-8") == self.password
+                    writer.write(encode_packet(request_id if authenticated else -1, TYPE_COMMAND, ""))
+                elif not authenticated:
+                    writer.write(encode_packet(-1, TYPE_COMMAND, ""))
+                elif packet_type == TYPE_COMMAND:
+                    command = body.decode("utf-8")
+                    self.commands.append(command)
+                    if self.delay:
+                        await asyncio.sleep(self.delay)
+                    response = (self.handler(command) or "").encode("utf-8")
+                    for start in range(0, max(len(response), 1), MAX_RESPONSE_PAYLOAD):
+                        writer.write(encode_packet(request_id, TYPE_RESPONSE,
+                                                   response[start:start + MAX_RESPONSE_PAYLOAD]))
+                else:
+                    writer.write(encode_packet(request_id, TYPE_RESPONSE, f"Unknown request {packet_type:x}"))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
@@ -0,0 +1,92 @@
+from py_minecraft_server.commands.status_ping import (decode_varint, encode_frame, encode_string, read_frame,
+                                                     PACKET_HANDSHAKE, PACKET_PING, PACKET_STATUS_REQUEST,
+                                                     STATE_STATUS)
+import asyncio
+import json
+
+
+class FakeStatusServer:
+    def __init__(self, version: str = "1.20.4", protocol: int = 765, players_online: int = 0, players_max: int = 20,
+                 motd: str = "A Minecraft Server", host: str = "127.0.0.1", port: int = 0, delay: float = 0.0,
+                 answer_ping: bool = True):
+        """
+        A local stand in for a minecraft server answering the server list ping, for tests and benchmarks
+        The status fields can be changed while it runs, every ping sees the current values
+        :param host: The host to listen on
+        :param port: The port to listen on, 0 picks a free port
+        :param delay: Seconds to wait before answering the status and the ping, to simulate a distant server
+        :param answer_ping: If false the connection is closed after the status, like some proxies do
+        """
+        self.version = version
+        self.protocol = protocol
+        self.players_online = players_online
+        self.players_max = players_max
+        self.motd = motd
+        self.host = host
+        self.port = port
+        self.delay = delay
+        self.answer_ping = answer_ping
+        self.status_requests = 0
+        self.connections = 0
+        self._server = None
+        self._writers = set()
+
+    def status(self) -> dict:
+        """The status json the server answers with"""
+        return {"version": {"name": self.version, "protocol": self.protocol},
+                "players": {"online": self.players_online, "max": self.players_max, "sample": []},
+                "description": {"text": self.motd}, "enforcesSecureChat": True}
+
+    async def start(self) -> "FakeStatusServer":
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            for writer in list(self._writers):
+                writer.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        self._writers.add(writer)
+        try:
+            packet_id, payload = await read_frame(reader)
+            if packet_id != PACKET_HANDSHAKE:
+                return
+            # protocol version, server address and port precede the next state
+            _, offset = decode_varint(payload)
+            address_length, offset = decode_varint(payload, offset)
+            next_state, _ = decode_varint(payload, offset + address_length + 2)
+            if next_state != STATE_STATUS:
+                return
+            packet_id, _ = await read_frame(reader)
+            if packet_id != PACKET_STATUS_REQUEST:
+                return
+            self.status_requests += 1
+            if self.delay:
+                await asyncio.sleep(self.delay)
+            writer.write(encode_frame(PACKET_STATUS_REQUEST, encode_string(json.dumps(self.status()))))
+            await writer.drain()
+            if not self.answer_ping:
+                return
+            packet_id, payload = await read_frame(reader)
+            if packet_id == PACKET_PING:
+                if self.delay:
+                    await asyncio.sleep(self.delay)
+                writer.write(encode_frame(PACKET_PING, payload))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError, asyncio.CancelledError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
@@ -0,0 +1,157 @@
+from py_minecraft_server.configuration.properties_document import PropertiesDocument
+from py_minecraft_server.testing.fake_query import FakeQueryServer
+from py_minecraft_server.testing.fake_rcon import FakeRCONServer
+from py_minecraft_server.testing.fake_status import FakeStatusServer
+import asyncio
+import os
+import stat
+import sys
+import threading
+import time
+from typing import Optional
+
+STUB_VERSION = "1.20.4"
+# rcon answers of the commands the library sends, anything else gets vanilla's unknown command answer
+RCON_RESPONSES = {
+    "save-off": "Automatic saving is now disabled",
+    "save-on": "Automatic saving is now enabled",
+    "save-all": "Saved the game",
+    "save-all flush": "Saved the game",
+    "tick query": "The game is running normally\nTarget tick rate: 20.0 per second.\n"
+                  "Average time per tick: 1.0ms (Target: 50.0ms)",
+}
+
+
+def _log(message: str, thread: str = "Server thread", level: str = "INFO"):
+    print(f"[{time.strftime('%H:%M:%S')}] [{thread}/{level}]: {message}", flush=True)
+
+
+def _read_properties(server_location: str) -> dict:
+    try:
+        with open(os.path.join(server_location, "server.properties")) as reader:
+            return PropertiesDocument.parse(reader.read()).as_dict()
+    except FileNotFoundError:
+        return {}
+
+
+def _eula_accepted(server_location: str) -> bool:
+    try:
+        with open(os.path.join(server_location, "eula.txt")) as reader:
+            return "eula=true" in reader.read().replace(" ", "").lower()
+    except FileNotFoundError:
+        return False
+
+
+class StubServer:
+    def __init__(self, server_location: str, argv: list, startup_seconds: float = 0.5):
+        """The fake minecraft server run by the stub java, see write_stub_java"""
+        self.server_location = server_location
+        self.argv = argv
+        self.startup_seconds = startup_seconds
+        self.properties = _read_properties(server_location)
+        self._stop = None
+
+    def _property(self, key: str, default: str) -> str:
+        return (self.properties.get(key) or default).strip()
+
+    def _enabled(self, key: str) -> bool:
+        return self._property(key, "false").lower() == "true"
+
+    def handle_command(self, command: str) -> str:
+        command = command.strip().lstrip("/")
+        if command == "stop":
+            asyncio.get_running_loop().call_soon(self._stop.set)
+            return "Stopping the server"
+        if command == "list":
+            return f"There are 0 of a max of {self._property('max-players', '20')} players online: "
+        return RCON_RESPONSES.get(command, "Unknown or incomplete command, see below for error")
+
+    async def run(self) -> int:
+        self._stop = asyncio.Event()
+        started = time.perf_counter()
+        _log(f"Starting minecraft server version {STUB_VERSION}")
+        _log("Loading properties")
+        _log("Default game type: SURVIVAL")
+        _log(f"Starting Minecraft server on {self._property('server-ip', '*') or '*'}:"
+             f"{self._property('server-port', '25565')}")
+        status = FakeStatusServer(version=STUB_VERSION, players_max=int(self._property("max-players", "20")),
+                                  motd=self._property("motd", "A Minecraft Server"),
+                                  port=int(self._property("server-port", "25565")))
+        listeners = [await status.start()]
+        level_name = self._property("level-name", "world")
+        _log(f'Preparing level "{level_name}"')
+        os.makedirs(os.path.join(self.server_location, level_name, "region"), exist_ok=True)
+        await asyncio.sleep(self.startup_seconds)
+        _log(f'Done ({time.perf_counter() - started:.3f}s)! For help, type "help"')
+        if any(argument.startswith("-Xlog:gc") for argument in self.argv):
+            print("[0.912s][info][gc] GC(0) Pause Young (Normal) (G1 Evacuation Pause) 24M->4M(256M) 2.345ms",
+                  flush=True)
+        if self._enabled("enable-query"):
+            _log("Starting GS4 status listener")
+            listeners.append(await FakeQueryServer(self._property("motd", "A Minecraft Server"),
+                                                   port=int(self._property("query.port", "25565")),
+                                                   server_port=status.port).start())
+        if self._enabled("enable-rcon"):
+            _log("Starting remote control listener")
+            listeners.append(await FakeRCONServer(self._property("rcon.password", ""), self.handle_command,
+                                                  port=int(self._property("rcon.port", "25575"))).start())
+            _log("Thread RCON Listener started", thread="RCON Listener #1")
+        self._read_console()
+        await self._stop.wait()
+        _log("Stopping server")
+        _log("Saving worlds")
+        for listener in listeners:
+            await listener.close()
+        return 0
+
+    def _read_console(self):
+        loop = asyncio.get_running_loop()
+
+        def read_lines():
+            for line in sys.stdin:
+                loop.call_soon_threadsafe(self.handle_command, line)
+
+        threading.Thread(target=read_lines, name="console", daemon=True).start()
+
+
+def main(argv: list, startup_seconds: float = 0.5, java_major: int = 17,
+         server_location: Optional[str] = None) -> int:
+    """
+    Acts like java running a minecraft server jar: answers -version, refuses to start without the eula, prints
+    vanilla's startup lines and answers server list pings, rcon and query on the ports in server.properties
+    """
+    if "-version" in argv:
+        # java prints its version to stderr
+        print(f'openjdk version "{java_major}.0.2" 2022-01-18', file=sys.stderr, flush=True)
+        return 0
+    server_location = server_location or os.getcwd()
+    if not _eula_accepted(server_location):
+        _log("You need to agree to the EULA in order to run the server. Go to eula.txt for more info.", thread="main")
+        return 1
+    return asyncio.run(StubServer(server_location, argv, startup_seconds).run())
+
+
+def write_stub_java(location: str, startup_seconds: float = 0.5, java_major: int = 17) -> str:
+    """
+    Writes an executable that stands in for java, to pass as java_ref where starting a real server is too slow
+    :param location: The file to write, a .bat is written next to it on windows
+    :param startup_seconds: Seconds the fake server takes to print its done line
+    :param java_major: The java version it reports
+    :return: The location of the executable
+    """
+    package_parent = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    script = (f"import sys\nsys.path.insert(0, {package_parent!r})\n"
+              f"from py_minecraft_server.testing.stub_java import main\n"
+              f"sys.exit(main(sys.argv[1:], {startup_seconds!r}, {java_major!r}))\n")
+    if os.name == "nt":
+        script_location = f"{location}.py"
+        with open(script_location, "w") as writer:
+            writer.write(script)
+        location = f"{location}.bat"
+        with open(location, "w") as writer:
+            writer.write(f'@"{sys.executable}" "{script_location}" %*\n')
+        return location
+    with open(location, "w") as writer:
+        writer.write(f"#!{sys.executable}\n{script}")
+    os.chmod(location, os.stat(location).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    return location
@@ -1,3 +1,8 @@
 from .unsync import unsync_function
+from .paths import get_cache_dir
+from .http import HttpClient, AsyncHttpClient, get_http_client, get_async_http_client
+from .web import (soupify_url, simple_request, get_forge_url, get_vanilla_url, get_external_ip, set_external_ip_lookup,
+                  get_local_ip)
+from .version_index import VersionIndex, get_version_index, set_version_index
 from .validation import validate_version
-from .web import soupify_url, simple_request, get_forge_url, get_vanilla_url, get_external_ip, get_local_ip
+from .java_version import JavaRuntime, get_java_runtimes, get_java_versions, get_java_major, select_java
@@ -0,0 +1,213 @@
+from py_minecraft_server import logger
+from requests.adapters import HTTPAdapter
+import aiohttp
+import asyncio
+import random
+import requests
+import threading
+import time
+import weakref
+from typing import Optional, Union
+
+DEFAULT_HEADERS = {"user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:89.0) Gecko/20100101 Firefox/89.0"}
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def backoff_delay(attempt: int, base: float, cap: float = 30.0) -> float:
+    """Full jitter exponential backoff, a random delay between 0 and base * 2^attempt"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class _ResponseCache:
+    """A small ttl cache of successful responses keyed by url and headers"""
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(url: str, headers: Optional[dict]) -> tuple:
+        return url, tuple(sorted((headers or {}).items()))
+
+    def get(self, key: tuple):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                return None
+            return entry[1]
+
+    def put(self, key: tuple, value, ttl: float):
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                del self._entries[min(self._entries, key=lambda k: self._entries[k][0])]
+            self._entries[key] = (time.monotonic() + ttl, value)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class HttpClient:
+    def __init__(self, pool_size: int = 10, retries: int = 3, backoff: float = 0.5,
+                 timeout: Union[float, tuple] = (10, 60), headers: dict = None):
+        """
+        A blocking http client sharing one keep-alive connection pool for every request
+        :param pool_size: Connections kept open per host
+        :param retries: How many times connection errors and retryable statuses are retried
+        :param backoff: The base delay of the jittered exponential backoff between retries
+        :param timeout: The (connect, read) timeout of every request
+        :param headers: Headers sent with every request, defaults to a browser user-agent
+        """
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update(DEFAULT_HEADERS if headers is None else headers)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.cache = _ResponseCache()
+
+    def get(self, url: str, headers: dict = None, ignore_errors: bool = False, cache_ttl: float = 0,
+            retries: int = None, **kwargs) -> requests.Response:
+        """
+        Sends a GET with retries
+        :param url: The url to get
+        :param headers: Extra headers for this request
+        :param ignore_errors: If false raises ValueError when the final status isnt 200
+        :param cache_ttl: Serve and store successful responses in the response cache for this many seconds
+        :param retries: Overrides the client's retries for this request
+        """
+        cache_key = self.cache.key(url, headers)
+        if cache_ttl:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
+        response = self.request("GET", url, headers=headers, retries=retries, **kwargs)
+        if response.status_code != 200 and not ignore_errors:
+            raise ValueError(f"Response status code not 200 for {url}")
+        if cache_ttl and response.status_code == 200:
+            self.cache.put(cache_key, response, cache_ttl)
+        return response
+
+    def request(self, method: str, url: str, retries: int = None, **kwargs) -> requests.Response:
+        """Sends a request through the pool, retrying connection errors and retryable statuses"""
+        kwargs.setdefault("timeout", self.timeout)
+        retries = self.retries if retries is None else retries
+        for attempt in range(retries + 1):
+            try:
+                response = self.session.request(method, url, **kwargs)
+                if response.status_code not in RETRY_STATUSES or attempt == retries:
+                    return response
+                reason = f"status {response.status_code}"
+            except (requests.ConnectionError, requests.Timeout) as error:
+                if attempt == retries:
+                    raise
+                reason = str(error)
+            delay = backoff_delay(attempt, self.backoff)
+            logger.debug(f"{method} {url} failed ({reason}), retrying in {delay:.2f}s")
+            time.sleep(delay)
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncHttpClient:
+    def __init__(self, pool_size: int = 10, retries: int = 3, backoff: float = 0.5, connect_timeout: float = 10,
+                 read_timeout: float = 60, headers: dict = None):
+        """
+        The asyncio counterpart of HttpClient, one pooled aiohttp session is kept per event loop
+        :param pool_size: Connections kept open per host
+        :param retries: How many times connection errors and retryable statuses are retried
+        :param backoff: The base delay of the jittered exponential backoff between retries
+        :param connect_timeout: Seconds to wait for a connection
+        :param read_timeout: Seconds to wait between reads
+        :param headers: Headers sent with every request, defaults to a browser user-agent
+        """
+        self.pool_size = pool_size
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = aiohttp.ClientTimeout(total=None, sock_connect=connect_timeout, sock_read=read_timeout)
+        self.headers = DEFAULT_HEADERS if headers is None else headers
+        self.cache = _ResponseCache()
+        self._sessions = weakref.WeakKeyDictionary()
+
+    def session(self) -> aiohttp.ClientSession:
+        """Returns the pooled session of the running event loop, sessions cant be shared between loops"""
+        loop = asyncio.get_running_loop()
+        session = self._sessions.get(loop)
+        if session is None or session.closed:
+            session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit_per_host=self.pool_size, ttl_dns_cache=300),
+                timeout=self.timeout, headers=self.headers)
+            self._sessions[loop] = session
+        return session
+
+    async def request(self, method: str, url: str, retries: int = None, session: aiohttp.ClientSession = None,
+                      **kwargs) -> aiohttp.ClientResponse:
+        """
+        Sends a request through the pool, retrying connection errors and retryable statuses
+        The response body is left unread, use the response as an async context manager to release its connection
+        :param retries: Overrides the client's retries for this request
+        :param session: Send through this session rather than the pooled one
+        """
+        retries = self.retries if retries is None else retries
+        for attempt in range(retries + 1):
+            try:
+                response = await (session or self.session()).request(method, url, **kwargs)
+                if response.status not in RETRY_STATUSES or attempt == retries:
+                    return response
+                response.release()
+                reason = f"status {response.status}"
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as error:
+                if attempt == retries:
+                    raise
+                reason = str(error) or type(error).__name__
+            delay = backoff_delay(attempt, self.backoff)
+            logger.debug(f"{method} {url} failed ({reason}), retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+    async def get_bytes(self, url: str, headers: dict = None, ignore_errors: bool = False,
+                        cache_ttl: float = 0, retries: int = None) -> bytes:
+        """Gets the body of url with retries, see HttpClient.get"""
+        cache_key = self.cache.key(url, headers)
+        if cache_ttl:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
+        async with await self.request("GET", url, retries=retries, headers=headers) as response:
+            if response.status != 200 and not ignore_errors:
+                raise ValueError(f"Response status code not 200 for {url}")
+            body = await response.read()
+        if cache_ttl and response.status == 200:
+            self.cache.put(cache_key, body, cache_ttl)
+        return body
+
+    async def close(self):
+        """Closes the session of the running event loop"""
+        session = self._sessions.pop(asyncio.get_running_loop(), None)
+        if session is not None:
+            await session.close()
+
+
+_http_client = None
+_async_http_client = None
+
+
+def get_http_client() -> HttpClient:
+    """Returns the process wide blocking http client"""
+    global _http_client
+    if _http_client is None:
+        _http_client = HttpClient()
+    return _http_client
+
+
+def get_async_http_client() -> AsyncHttpClient:
+    """Returns the process wide asyncio http client"""
+    global _async_http_client
+    if _async_http_client is None:
+        _async_http_client = AsyncHttpClient()
+    return _async_http_client
@@ -1,41 +1,172 @@
 from py_minecraft_server import logger
-import re
+from py_minecraft_server.utils.paths import get_cache_dir
+import concurrent.futures
+import glob
+import json
 import os
+import re
+import shutil
 import subprocess
+import tempfile
+import threading
+from typing import Iterable, Optional
 
+JAVA_CACHE_FILENAME = "java_runtimes.json"
+JAVA_EXECUTABLE = "java.exe" if os.name == "nt" else "java"
+# java -version prints 'openjdk version "17.0.2" 2022-01-18', 'java version "1.8.0_301"' or 'openjdk version "21"'
+JAVA_VERSION_RE = re.compile(r"version \"(?P<version>(?P<first>\d+)(?:\.(?P<second>\d+))?[^\"]*)\"", re.IGNORECASE)
+# dirs holding one jdk per subdir, each with a bin dir
+JAVA_INSTALL_GLOBS = ["/usr/lib/jvm/*", "/usr/lib64/jvm/*", "/usr/java/*", "/opt/java/*",
+                      "/Library/Java/JavaVirtualMachines/*/Contents/Home",
+                      os.path.join(os.path.expanduser("~"), ".sdkman", "candidates", "java", "*"),
+                      os.path.join(os.path.expanduser("~"), ".jdks", "*"),
+                      os.path.join(os.environ.get("ProgramFiles", "C:\\Program Files"), "Java", "*"),
+                      os.path.join(os.environ.get("ProgramFiles", "C:\\Program Files"), "Eclipse Adoptium", "*")]
 
-def get_java_versions(java_calls=None):
-    """ Returns a dict of key=version val=location java versions located on the computer """
-    if java_calls is None:
-        java_calls = ["java"]
+_cache_lock = threading.Lock()
+
+
+class JavaRuntime:
+    def __init__(self, location: str, version: str, major: int):
+        self.location = location
+        self.version = version
+        self.major = major
+
+    def __repr__(self):
+        return f"JavaRuntime({self.major}, {self.version!r}, {self.location!r})"
+
+
+def parse_java_version(output: str) -> Optional[tuple[str, int]]:
+    """Returns (version, major version) from java -version output, 1.8.0_301 is major 8, None if not found"""
+    version_search = JAVA_VERSION_RE.search(output)
+    if not version_search:
+        return None
+    first = int(version_search.group("first"))
+    if first == 1 and version_search.group("second"):
+        return version_search.group("version"), int(version_search.group("second"))
+    return version_search.group("version"), first
+
+
+def find_java_candidates(java_calls: Iterable[str] = ("java",)) -> list[str]:
+    """
+    Returns the real paths of every java executable found, in order of preference: the java_calls, JAVA_HOME,
+    PATH then the usual install dirs (/usr/lib/jvm, sdkman, ...)
+    """
+    candidates = [shutil.which(java_call) for java_call in java_calls]
+    if os.environ.get("JAVA_HOME"):
+        candidates.append(os.path.join(os.environ["JAVA_HOME"], "bin", JAVA_EXECUTABLE))
+    candidates += [os.path.join(path_dir, JAVA_EXECUTABLE)
+                   for path_dir in os.environ.get("PATH", "").split(os.pathsep) if path_dir]
+    for install_glob in JAVA_INSTALL_GLOBS:
+        candidates += [os.path.join(install_dir, "bin", JAVA_EXECUTABLE)
+                       for install_dir in sorted(glob.glob(install_glob))]
+    found = []
+    for candidate in candidates:
+        if candidate and os.path.isfile(candidate) and os.access(candidate, os.X_OK):
+            # many of these are symlinks to the same jdk (/usr/bin/java, alternatives, sdkman's current)
+            real_location = os.path.realpath(candidate)
+            if real_location not in found:
+                found.append(real_location)
+    return found
+
+
+def probe_java(location: str, timeout: float = 30.0) -> Optional[JavaRuntime]:
+    """Runs java -version, returning None if it isnt a working java"""
+    try:
+        process = subprocess.run([location, "-version"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                 timeout=timeout)
+    except (OSError, subprocess.TimeoutExpired) as error:
+        logger.debug(f"Failed to run {location} -version ({error!r})")
+        return None
+    parsed = parse_java_version(process.stdout.decode("utf-8", "replace"))
+    if parsed is None:
+        logger.debug(f"No java version in the output of {location} -version")
+        return None
+    return JavaRuntime(location, *parsed)
 
-    version_dict = {}
-    version_re = re.compile(r"java\s*version\s*\"(?P<ver>\d*\.\d*)\.", re.IGNORECASE)
-
-    def get_version_from_out(output: str) -> str:
-        """ Searches line by line cmd outputs to find the java version """
-        for ver_line in output.split("\n"):
-            version_search = version_re.search(ver_line)
-            if version_search:
-                return version_search.group("ver")
-
-    def get_subproc_output(args: str, **kwargs) -> str:
-        """ returns the stdout + stderr from a subprocess """
-        proc = subprocess.run(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, **kwargs)
-        return str(proc.stdout.decode("utf-8") + proc.stderr.decode("utf-8"))
-
-    # find the java version called by "java" or whatever default call is supplied
-    for c in java_calls:
-        version = get_version_from_out(get_subproc_output(f"{c} -version"))
-        if all([num.isdigit() for num in version.split('.')]):
-            version_dict[version] = c
-
-    # find other versions installed on the path
-    for j in [[os.path.join(d, e) for e in os.listdir(d) if "java.exe" == e][0] for d in
-              [i for i in os.environ["PATH"].split(";") if "java" in i.lower()]]:
-        version = get_version_from_out(get_subproc_output(f"{j} -version"))
-        if version not in version_dict:
-            version_dict[version] = j
 
+def get_java_runtimes(java_calls: Iterable[str] = ("java",), use_cache: bool = True,
+                      max_workers: int = 8) -> list[JavaRuntime]:
+    """
+    Finds every java runtime on the machine, probing them concurrently
+    Probes are cached by binary path, mtime and size so later calls only launch new or changed javas
+    :param java_calls: Commands to resolve on PATH first, preferred when choosing between runtimes
+    :param use_cache: Reuse cached probes
+    :param max_workers: How many java -version processes run at once
+    """
+    candidates = find_java_candidates(java_calls)
+    cache_location = os.path.join(get_cache_dir(), JAVA_CACHE_FILENAME)
+    with _cache_lock:
+        cache = _read_cache(cache_location) if use_cache else {}
+        stats = {}
+        for candidate in candidates:
+            try:
+                candidate_stat = os.stat(candidate)
+                stats[candidate] = [candidate_stat.st_mtime_ns, candidate_stat.st_size]
+            except OSError:
+                continue
+        to_probe = [candidate for candidate in stats
+                    if cache.get(candidate, {}).get("stat") != stats[candidate]]
+        if to_probe:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=min(max_workers, len(to_probe))) as executor:
+                for candidate, runtime in zip(to_probe, executor.map(probe_java, to_probe)):
+                    cache[candidate] = {"stat": stats[candidate], "version": runtime.version if runtime else None,
+                                        "major": runtime.major if runtime else None}
+            _write_cache(cache_location, {location: probe for location, probe in cache.items()
+                                          if os.path.exists(location)})
+        logger.debug(f"Probed {len(to_probe)} of {len(stats)} java candidates, the rest were cached")
+    return [JavaRuntime(candidate, cache[candidate]["version"], cache[candidate]["major"]) for candidate in stats
+            if cache[candidate]["version"] is not None]
+
+
+def get_java_versions(java_calls: Iterable[str] = None) -> dict[int, str]:
+    """Returns a dict of key=major version val=location of the java versions located on the computer"""
+    version_dict = {}
+    for runtime in get_java_runtimes(java_calls or ("java",)):
+        version_dict.setdefault(runtime.major, runtime.location)
     logger.info(f"Found Java versions {[f'{k}={v}' for k, v in version_dict.items()]}")
     return version_dict
+
+
+def select_java(required_major: int, exact: bool = False, java_calls: Iterable[str] = ("java",)) -> JavaRuntime:
+    """
+    Picks the java to run a server with, the required major version if installed, otherwise the oldest newer one
+    :param required_major: The major java version the server needs, see VersionIndex.java_version
+    :param exact: Only accept the required major version, old forge versions dont run on newer javas
+    """
+    runtimes = get_java_runtimes(java_calls)
+    exact_runtimes = [runtime for runtime in runtimes if runtime.major == required_major]
+    if exact_runtimes:
+        return exact_runtimes[0]
+    newer_runtimes = [runtime for runtime in runtimes if runtime.major > required_major]
+    if newer_runtimes and not exact:
+        return min(newer_runtimes, key=lambda runtime: runtime.major)
+    raise ValueError(f"No java {required_major}{'' if exact else '+'} found, installed: "
+                     f"{sorted({runtime.major for runtime in runtimes})}")
+
+
+def get_java_major(java_ref: str) -> Optional[int]:
+    """Returns the major version of a java command or path, from the cache when possible, None if it doesnt run"""
+    location = shutil.which(java_ref)
+    if location is None:
+        return None
+    location = os.path.realpath(location)
+    for runtime in get_java_runtimes((java_ref,)):
+        if runtime.location == location:
+            return runtime.major
+    return None
+
+
+def _read_cache(cache_location: str) -> dict:
+    try:
+        with open(cache_location) as reader:
+            return json.load(reader)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_cache(cache_location: str, cache: dict):
+    handle, temp_location = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(cache_location))
+    with os.fdopen(handle, "w") as writer:
+        json.dump(cache, writer, indent=2)
+    os.replace(temp_location, cache_location)
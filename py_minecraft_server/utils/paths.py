@@ -0,0 +1,16 @@
+import os
+
+
+def get_cache_dir(*sub_dirs: str, create: bool = True) -> str:
+    """
+    Returns the library cache dir (or a sub dir of it), shared by every server on the machine
+    Honours PY_MINECRAFT_SERVER_CACHE, then XDG_CACHE_HOME, then ~/.cache
+    :param sub_dirs: Path parts to join onto the cache dir
+    :param create: Make the dir if it doesnt exist
+    """
+    root = os.environ.get("PY_MINECRAFT_SERVER_CACHE") or os.path.join(
+        os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"), "py-minecraft-server")
+    cache_dir = os.path.join(root, *sub_dirs)
+    if create:
+        os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
@@ -0,0 +1,209 @@
+from py_minecraft_server import logger
+import py_minecraft_server.utils
+import json
+import os
+import tempfile
+import threading
+import time
+from typing import Optional
+
+MANIFEST_URL = "https://piston-meta.mojang.com/mc/game/version_manifest_v2.json"
+FORGE_PROMOTIONS_URL = "https://files.minecraftforge.net/net/minecraftforge/forge/promotions_slim.json"
+FORGE_MAVEN_URL = "https://maven.minecraftforge.net/net/minecraftforge/forge"
+
+
+class _CachedJson:
+    """A json document cached on disk and revalidated with its ETag once older than ttl seconds"""
+    def __init__(self, url: str, cache_location: str, ttl: float):
+        self.url = url
+        self.cache_location = cache_location
+        self.meta_location = f"{cache_location}.meta"
+        self.ttl = ttl
+
+    def load(self) -> dict:
+        meta = self._read_json(self.meta_location) or {}
+        document = self._read_json(self.cache_location)
+        if document is not None and time.time() - meta.get("fetched", 0) < self.ttl:
+            return document
+
+        headers = {"If-None-Match": meta["etag"]} if document is not None and meta.get("etag") else {}
+        try:
+            response = py_minecraft_server.utils.simple_request(self.url, headers=headers, ignore_errors=True)
+        except OSError as error:
+            if document is None:
+                raise
+            logger.warning(f"Could not revalidate {self.url} ({error}), using the cached copy")
+            return document
+        if response.status_code == 304:
+            logger.debug(f"{self.url} not modified")
+        elif response.status_code == 200:
+            document = response.json()
+            self._write_json(self.cache_location, document)
+            meta["etag"] = response.headers.get("ETag")
+            logger.debug(f"Fetched {self.url} etag={meta['etag']}")
+        elif document is None:
+            raise ValueError(f"Response status code {response.status_code} for {self.url}")
+        else:
+            logger.warning(f"Could not revalidate {self.url} status={response.status_code}, using the cached copy")
+        meta["fetched"] = time.time()
+        self._write_json(self.meta_location, meta)
+        return document
+
+    def expire(self):
+        """Marks the cached copy stale so the next load revalidates it, keeping the ETag"""
+        meta = self._read_json(self.meta_location)
+        if meta is not None:
+            meta["fetched"] = 0
+            self._write_json(self.meta_location, meta)
+
+    @staticmethod
+    def _read_json(location: str) -> Optional[dict]:
+        try:
+            with open(location) as reader:
+                return json.load(reader)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _write_json(location: str, document: dict):
+        handle, temp_location = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(location))
+        with os.fdopen(handle, "w") as writer:
+            json.dump(document, writer)
+        os.replace(temp_location, location)
+
+
+class VersionIndex:
+    def __init__(self, cache_dir: str = None, ttl: float = 3600, manifest_url: str = MANIFEST_URL,
+                 forge_promotions_url: str = FORGE_PROMOTIONS_URL, forge_maven_url: str = FORGE_MAVEN_URL):
+        """
+        An index of every minecraft server version built from Mojang's version manifest
+        The manifest is fetched at most once per ttl and revalidated with its ETag, per version details are immutable
+        and cached on disk forever
+        :param cache_dir: Where to cache manifests, defaults to the library cache dir
+        :param ttl: Seconds before the cached manifests are revalidated
+        :param manifest_url: The version manifest, other urls are for mirrors and local stand ins
+        :param forge_promotions_url: The forge promotions json
+        :param forge_maven_url: The forge maven dir holding the installer of every build
+        """
+        self.cache_dir = cache_dir or py_minecraft_server.utils.get_cache_dir("versions")
+        os.makedirs(os.path.join(self.cache_dir, "details"), exist_ok=True)
+        self.ttl = ttl
+        self.forge_maven_url = forge_maven_url
+        self._manifest = _CachedJson(manifest_url, os.path.join(self.cache_dir, "version_manifest_v2.json"), ttl)
+        self._forge_promotions = _CachedJson(forge_promotions_url,
+                                             os.path.join(self.cache_dir, "forge_promotions.json"), ttl)
+        self._versions = None
+        self._latest = None
+        self._forge = None
+        self._details = {}
+        self._loaded_at = 0
+        self._lock = threading.RLock()
+
+    def _load(self):
+        with self._lock:
+            if self._versions is None or time.time() - self._loaded_at >= self.ttl:
+                manifest = self._manifest.load()
+                self._versions = {entry["id"]: entry for entry in manifest["versions"]}
+                self._latest = manifest["latest"]
+                self._loaded_at = time.time()
+        return self._versions
+
+    def _load_forge(self):
+        with self._lock:
+            if self._forge is None:
+                self._forge = self._forge_promotions.load()["promos"]
+        return self._forge
+
+    def refresh(self):
+        """Forces the manifests to be revalidated on the next lookup"""
+        with self._lock:
+            self._versions = None
+            self._forge = None
+            self._manifest.expire()
+            self._forge_promotions.expire()
+
+    def is_valid(self, version: str, is_forge: bool = False) -> bool:
+        """Returns True if version exists, forge versions must have a promoted build"""
+        if is_forge:
+            return self.forge_version(version) is not None
+        return version in self._load()
+
+    def release_type(self, version: str) -> str:
+        """Returns the release type of a version, release, snapshot, old_beta or old_alpha"""
+        return self._entry(version)["type"]
+
+    def latest(self, release_type: str = "release") -> str:
+        """Returns the latest release or snapshot version id"""
+        self._load()
+        return self._latest[release_type]
+
+    def versions(self, release_type: str = None) -> list[str]:
+        """Returns every version id newest first, optionally only of one release type"""
+        return [version for version, entry in self._load().items()
+                if release_type is None or entry["type"] == release_type]
+
+    def details(self, version: str) -> dict:
+        """Returns the full version json of a version, fetched once and cached forever"""
+        if version in self._details:
+            return self._details[version]
+        entry = self._entry(version)
+        # version jsons never change for a given sha1 so the disk copy never needs revalidating
+        details_location = os.path.join(self.cache_dir, "details", f"{version}-{entry.get('sha1', 'nosha')}.json")
+        details = _CachedJson(entry["url"], details_location, float("inf")).load()
+        self._details[version] = details
+        return details
+
+    def jar_url(self, version: str) -> str:
+        """Returns the download url of a vanilla server jar"""
+        try:
+            return self.details(version)["downloads"]["server"]["url"]
+        except KeyError:
+            raise ValueError(f"Version {version} has no server jar") from None
+
+    def jar_sha1(self, version: str) -> str:
+        """Returns the sha1 of a vanilla server jar"""
+        try:
+            return self.details(version)["downloads"]["server"]["sha1"]
+        except KeyError:
+            raise ValueError(f"Version {version} has no server jar") from None
+
+    def java_version(self, version: str) -> int:
+        """Returns the major java version a version requires, versions before 1.17 dont specify and run on 8"""
+        return self.details(version).get("javaVersion", {}).get("majorVersion", 8)
+
+    def forge_version(self, version: str) -> Optional[str]:
+        """Returns the recommended (or latest) forge build for a minecraft version, None if there is none"""
+        promotions = self._load_forge()
+        return promotions.get(f"{version}-recommended") or promotions.get(f"{version}-latest")
+
+    def forge_installer_url(self, version: str) -> str:
+        """Returns the download url of the forge installer for a minecraft version"""
+        forge_version = self.forge_version(version)
+        if forge_version is None:
+            raise ValueError(f"Illegal forge version, no forge download for version {version}")
+        build = f"{version}-{forge_version}"
+        return f"{self.forge_maven_url}/{build}/forge-{build}-installer.jar"
+
+    def _entry(self, version: str) -> dict:
+        try:
+            return self._load()[version]
+        except KeyError:
+            raise ValueError(f"Version does not exist {version}") from None
+
+
+_default_index = None
+
+
+def get_version_index() -> VersionIndex:
+    """Returns the process wide version index"""
+    global _default_index
+    if _default_index is None:
+        _default_index = VersionIndex()
+    return _default_index
+
+
+def set_version_index(index: Optional[VersionIndex]) -> Optional[VersionIndex]:
+    """Replaces the process wide version index, None resets it to the default, returns the previous index"""
+    global _default_index
+    previous, _default_index = _default_index, index
+    return previous
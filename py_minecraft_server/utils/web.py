@@ -1,21 +1,32 @@
+from py_minecraft_server import logger
+from py_minecraft_server.utils.http import get_http_client
 from bs4 import BeautifulSoup
 import requests
 import socket
+import threading
+import time
+from typing import Callable, Optional
 
+EXTERNAL_IP_URL = "https://api.ipify.org"
+EXTERNAL_IP_TTL = 60
+# best effort, so a slow or unreachable lookup is given up on quickly instead of retried
+EXTERNAL_IP_TIMEOUT = (2, 2)
 
-def soupify_url(url: str, headers: dict = None, ignore_errors: bool = False):
+# (expiry, ip) of the last lookup, failures are cached too so an offline host doesnt retry on every call
+_external_ip = (0.0, None)
+_external_ip_lock = threading.Lock()
+_external_ip_lookup = None
+
+
+def soupify_url(url: str, headers: dict = None, ignore_errors: bool = False, cache_ttl: float = 0):
     """Turns a url into SOUP"""
-    return BeautifulSoup(simple_request(url, headers, ignore_errors).content, "html.parser")
+    return BeautifulSoup(simple_request(url, headers, ignore_errors, cache_ttl).content, "html.parser")
 
 
-def simple_request(url: str, headers: dict = None, ignore_errors: bool = False) -> requests.Response:
-    """requests.get but with preset headers"""
-    if headers is None:
-        headers = {"user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:89.0) Gecko/20100101 Firefox/89.0", }
-    response = requests.get(url, headers=headers)
-    if response.status_code != 200 and not ignore_errors:
-        raise ValueError(f"Response status code not 200 for {url}")
-    return requests.get(url, headers=headers)
+def simple_request(url: str, headers: dict = None, ignore_errors: bool = False,
+                   cache_ttl: float = 0) -> requests.Response:
+    """GET through the shared http client, headers supplied are added to the client's preset headers"""
+    return get_http_client().get(url, headers=headers, ignore_errors=ignore_errors, cache_ttl=cache_ttl)
 
 
 def get_forge_url(version: str) -> str:
@@ -29,11 +40,33 @@ def get_vanilla_url(version: str) -> str:
 
 
 def get_external_ip():
-    """Retrieves the external IP via a website"""
-    request = requests.get("https://api.ipify.org")
-    if request.status_code == 200:
-        return requests.get("https://api.ipify.org").text
-    return None
+    """
+    Retrieves the external IP via a website, cached for a minute whether or not it succeeded
+    Blocks for up to a few seconds on a cold cache, run it in an executor from async code
+    """
+    global _external_ip
+    if _external_ip_lookup is not None:
+        return _external_ip_lookup()
+    with _external_ip_lock:
+        expiry, ip = _external_ip
+        if expiry > time.monotonic():
+            return ip
+        try:
+            request = get_http_client().get(EXTERNAL_IP_URL, ignore_errors=True, retries=0,
+                                            timeout=EXTERNAL_IP_TIMEOUT)
+            ip = request.text.strip() if request.status_code == 200 else None
+        except requests.RequestException as error:
+            logger.debug(f"External ip lookup failed: {error}")
+            ip = None
+        _external_ip = (time.monotonic() + EXTERNAL_IP_TTL, ip)
+        return ip
+
+
+def set_external_ip_lookup(lookup: Optional[Callable[[], Optional[str]]]) -> Optional[Callable[[], Optional[str]]]:
+    """Replaces how get_external_ip finds the ip, None resets it to asking the website, returns the previous lookup"""
+    global _external_ip_lookup
+    previous, _external_ip_lookup = _external_ip_lookup, lookup
+    return previous
 
 
 def get_local_ip():
@@ -0,0 +1,3 @@
+from .region import (RegionFile, parse_header, read_header, region_files, scan_regions, generated_mask,
+                     generation_progress, world_region_dirs, read_chunk, chunk_status, chunks_full)
+from .pregen import Pregenerator, pregenerate
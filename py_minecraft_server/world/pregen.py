@@ -0,0 +1,155 @@
+from py_minecraft_server import logger
+from py_minecraft_server.world.region import DIMENSION_REGION_DIRS, chunk_bounds, chunks_full, generated_mask
+import asyncio
+import os
+import time
+from typing import Callable
+
+import numpy as np
+
+# forceload refuses to add more than 256 chunks in one command, so tiles are at most 16x16 chunks
+TILE_WIDTH = 16
+
+
+class PregenTile:
+    def __init__(self, min_chunk_x: int, min_chunk_z: int, max_chunk_x: int, max_chunk_z: int):
+        """A rectangle of chunks forceloaded by one command, bounds inclusive"""
+        self.min_chunk_x = min_chunk_x
+        self.min_chunk_z = min_chunk_z
+        self.max_chunk_x = max_chunk_x
+        self.max_chunk_z = max_chunk_z
+        self.started = None
+
+    @property
+    def chunks(self) -> int:
+        return (self.max_chunk_x - self.min_chunk_x + 1) * (self.max_chunk_z - self.min_chunk_z + 1)
+
+    def block_bounds(self) -> str:
+        """The tile as forceload's from and to block columns"""
+        return f"{self.min_chunk_x * 16} {self.min_chunk_z * 16} {self.max_chunk_x * 16} {self.max_chunk_z * 16}"
+
+    def __repr__(self):
+        return f"PregenTile({self.min_chunk_x}, {self.min_chunk_z}, {self.max_chunk_x}, {self.max_chunk_z})"
+
+
+class Pregenerator:
+    def __init__(self, rcon, world_location: str, center_x: int = 0, center_z: int = 0, radius: int = 1000,
+                 dimension: str = "minecraft:overworld", max_loaded_tiles: int = 4, poll_interval: float = 5.0,
+                 tile_timeout: float = 300.0, progress: Callable[[dict], None] = None):
+        """
+        Generates every chunk within radius blocks (a square) of a block ahead of players, by forceloading tiles of up
+        to 256 chunks over rcon and releasing each once its chunks are saved fully generated to the region files
+        Tiles already fully generated are skipped, so an interrupted run resumes where it stopped
+        Needs minecraft 1.14.4+ for the forceload command
+        :param rcon: The AsyncRCON of the running server
+        :param world_location: The world dir, for reading generation progress from the region headers
+        :param dimension: The dimension to generate
+        :param max_loaded_tiles: How many tiles are forceloaded at once, more generates faster on more cores
+        :param poll_interval: Seconds between saves to check tiles for completion
+        :param tile_timeout: Seconds a tile may take before the run fails
+        :param progress: Called with the progress dict after every poll
+        """
+        if dimension not in DIMENSION_REGION_DIRS:
+            raise ValueError(f"Unknown dimension {dimension}, expected one of {list(DIMENSION_REGION_DIRS)}")
+        self.rcon = rcon
+        self.region_dir = os.path.join(world_location, DIMENSION_REGION_DIRS[dimension])
+        self.center_x = center_x
+        self.center_z = center_z
+        self.radius = radius
+        self.dimension = dimension
+        self.max_loaded_tiles = max_loaded_tiles
+        self.poll_interval = poll_interval
+        self.tile_timeout = tile_timeout
+        self.progress = progress
+        self.bounds = chunk_bounds(center_x, center_z, radius)
+
+    def tiles(self) -> list[PregenTile]:
+        """Splits the area into tiles ordered by distance from the center, so the spawn area generates first"""
+        min_chunk_x, min_chunk_z, max_chunk_x, max_chunk_z = self.bounds
+        tiles = [PregenTile(tile_x, tile_z, min(tile_x + TILE_WIDTH - 1, max_chunk_x),
+                            min(tile_z + TILE_WIDTH - 1, max_chunk_z))
+                 for tile_z in range(min_chunk_z, max_chunk_z + 1, TILE_WIDTH)
+                 for tile_x in range(min_chunk_x, max_chunk_x + 1, TILE_WIDTH)]
+        center_chunk_x, center_chunk_z = self.center_x >> 4, self.center_z >> 4
+        return sorted(tiles, key=lambda tile: ((tile.min_chunk_x + tile.max_chunk_x) / 2 - center_chunk_x) ** 2
+                      + ((tile.min_chunk_z + tile.max_chunk_z) / 2 - center_chunk_z) ** 2)
+
+    def _tile_done(self, mask, tile: PregenTile) -> bool:
+        """
+        A tile is done once all its chunks are stored with the full status, save-all also stores the part way
+        generated chunks around loaded ones, the header mask only rules out tiles with missing chunks cheaply
+        """
+        min_chunk_x, min_chunk_z = self.bounds[:2]
+        if not mask[tile.min_chunk_z - min_chunk_z:tile.max_chunk_z - min_chunk_z + 1,
+                    tile.min_chunk_x - min_chunk_x:tile.max_chunk_x - min_chunk_x + 1].all():
+            return False
+        return chunks_full(self.region_dir, tile.min_chunk_x, tile.min_chunk_z, tile.max_chunk_x, tile.max_chunk_z)
+
+    def _done_tiles(self, tiles: list[PregenTile]) -> tuple[list[PregenTile], np.ndarray]:
+        """Returns the done tiles of tiles and the stored mask, reads the region files so runs in an executor"""
+        mask = self._mask()
+        return [tile for tile in tiles if self._tile_done(mask, tile)], mask
+
+    def _mask(self):
+        return generated_mask(self.region_dir, *self.bounds)
+
+    async def _command(self, command: str) -> str:
+        if self.dimension != "minecraft:overworld":
+            command = f"execute in {self.dimension} run {command}"
+        return await self.rcon.command(command)
+
+    async def run(self) -> dict:
+        """Generates the area, returning the final progress"""
+        started = time.monotonic()
+        loop = asyncio.get_running_loop()
+        tiles = self.tiles()
+        done, mask = await loop.run_in_executor(None, self._done_tiles, tiles)
+        done_tiles = set(done)
+        pending = [tile for tile in tiles if tile not in done_tiles]
+        total_tiles = len(pending)
+        logger.info(f"Pregenerating {self.dimension} within {self.radius} of {self.center_x},{self.center_z}: "
+                    f"{int(mask.sum())}/{mask.size} chunks already stored, {len(done)} tiles already generated, "
+                    f"{total_tiles} tiles to go")
+        loaded = []
+        try:
+            while pending or loaded:
+                while pending and len(loaded) < self.max_loaded_tiles:
+                    tile = pending.pop(0)
+                    await self._command(f"forceload add {tile.block_bounds()}")
+                    tile.started = time.monotonic()
+                    loaded.append(tile)
+                await asyncio.sleep(self.poll_interval)
+                # chunks only reach the region files once saved
+                await self._command("save-all flush")
+                done, mask = await loop.run_in_executor(None, self._done_tiles, loaded)
+                for tile in done:
+                    await self._command(f"forceload remove {tile.block_bounds()}")
+                    loaded.remove(tile)
+                for tile in loaded:
+                    if time.monotonic() - tile.started > self.tile_timeout:
+                        raise TimeoutError(f"{tile} not generated after {self.tile_timeout}s")
+                progress = {"generated": int(mask.sum()), "total": int(mask.size),
+                            "tiles_done": total_tiles - len(pending) - len(loaded), "tiles": total_tiles,
+                            "elapsed": time.monotonic() - started}
+                if self.progress is not None:
+                    self.progress(progress)
+                logger.debug(f"Pregeneration {progress['generated']}/{progress['total']} chunks, "
+                             f"{progress['tiles_done']}/{total_tiles} tiles")
+        finally:
+            for tile in loaded:
+                try:
+                    await self._command(f"forceload remove {tile.block_bounds()}")
+                except (ConnectionError, asyncio.TimeoutError):
+                    logger.warning(f"Failed to release forceloaded {tile}")
+        mask = self._mask()
+        progress = {"generated": int(mask.sum()), "total": int(mask.size), "tiles_done": total_tiles,
+                    "tiles": total_tiles, "elapsed": time.monotonic() - started}
+        logger.info(f"Pregenerated {progress['generated']} chunks in {progress['elapsed']:.1f}s")
+        return progress
+
+
+async def pregenerate(rcon, world_location: str, radius: int, center_x: int = 0, center_z: int = 0,
+                      dimension: str = "minecraft:overworld", **kwargs) -> dict:
+    """Generates every chunk within radius blocks of a block, see Pregenerator"""
+    return await Pregenerator(rcon, world_location, center_x, center_z, radius, dimension, **kwargs).run()
+
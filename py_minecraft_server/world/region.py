@@ -0,0 +1,289 @@
+from py_minecraft_server import logger
+import gzip
+import mmap
+import os
+import re
+import zlib
+from typing import Iterable, Optional
+
+import numpy as np
+
+REGION_FILE_RE = re.compile(r"^r\.(?P<x>-?\d+)\.(?P<z>-?\d+)\.mca$")
+REGION_HEADER_SIZE = 8192
+REGION_SECTOR_SIZE = 4096
+REGION_WIDTH = 32
+CHUNKS_PER_REGION = REGION_WIDTH * REGION_WIDTH
+# region dirs of the vanilla dimensions inside a world dir
+DIMENSION_REGION_DIRS = {"minecraft:overworld": "region", "minecraft:the_nether": os.path.join("DIM-1", "region"),
+                         "minecraft:the_end": os.path.join("DIM1", "region")}
+_EMPTY_HEADER = np.zeros(2 * CHUNKS_PER_REGION, dtype=np.uint32)
+# chunk compression types, a type with the high bit set is stored in a c.x.z.mcc file next to the region
+CHUNK_GZIP = 1
+CHUNK_ZLIB = 2
+CHUNK_UNCOMPRESSED = 3
+CHUNK_LZ4 = 4
+CHUNK_EXTERNAL = 0x80
+# sizes of the fixed size nbt tags and of the items of the array tags, by tag id
+_NBT_SIZES = {1: 1, 2: 2, 3: 4, 4: 8, 5: 4, 6: 8}
+_NBT_ARRAY_SIZES = {7: 1, 11: 4, 12: 8}
+_NBT_END, _NBT_STRING, _NBT_LIST, _NBT_COMPOUND = 0, 8, 9, 10
+
+
+def parse_header(buffer) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Decodes a region header from any buffer holding at least its first 8KiB, with no python level loop
+    The chunk at region local (x, z) is at index x + z * 32
+    :return: (sector offsets, sector counts, timestamps), each 1024 long, absent chunks have offset 0
+    """
+    header = np.frombuffer(buffer, dtype=">u4", count=2 * CHUNKS_PER_REGION).astype(np.uint32)
+    locations = header[:CHUNKS_PER_REGION]
+    return locations >> 8, locations & 0xFF, header[CHUNKS_PER_REGION:]
+
+
+def region_coords(location: str) -> Optional[tuple[int, int]]:
+    """Returns the (x, z) of a region file from its r.x.z.mca name, None if it isnt a region file"""
+    name_match = REGION_FILE_RE.match(os.path.basename(location))
+    return (int(name_match.group("x")), int(name_match.group("z"))) if name_match else None
+
+
+def read_header(location: str) -> np.ndarray:
+    """
+    Reads the 8KiB header of a region file through mmap without reading the chunks
+    Files too small to hold a header (the server creates empty ones) read as having no chunks
+    :return: The raw 2048 big endian words, locations then timestamps, as native uint32
+    """
+    with open(location, "rb") as reader:
+        if os.fstat(reader.fileno()).st_size < REGION_HEADER_SIZE:
+            return _EMPTY_HEADER.copy()
+        with mmap.mmap(reader.fileno(), REGION_HEADER_SIZE, access=mmap.ACCESS_READ) as header_map:
+            # astype copies out of the map so it can be closed
+            return np.frombuffer(header_map, dtype=">u4", count=2 * CHUNKS_PER_REGION).astype(np.uint32)
+
+
+class RegionFile:
+    def __init__(self, location: str):
+        """An anvil region file, only its header is read"""
+        self.location = location
+        coords = region_coords(location)
+        if coords is None:
+            raise ValueError(f"Not a region file name {location}")
+        self.x, self.z = coords
+        self.size = os.path.getsize(location)
+        header = read_header(location)
+        self.offsets = header[:CHUNKS_PER_REGION] >> 8
+        self.sector_counts = header[:CHUNKS_PER_REGION] & 0xFF
+        self.timestamps = header[CHUNKS_PER_REGION:]
+
+    @property
+    def present(self) -> np.ndarray:
+        """A 32x32 bool grid indexed [z, x] of the chunks stored in the region"""
+        return (self.offsets != 0).reshape(REGION_WIDTH, REGION_WIDTH)
+
+    def chunk_coords(self) -> np.ndarray:
+        """Returns the absolute (x, z) chunk coords of every stored chunk as an (n, 2) array"""
+        z, x = np.nonzero(self.present)
+        return np.stack([x + self.x * REGION_WIDTH, z + self.z * REGION_WIDTH], axis=1)
+
+    def stats(self) -> dict:
+        present = self.offsets != 0
+        chunk_count = int(present.sum())
+        used_sectors = int(self.sector_counts[present].sum())
+        file_sectors = -(-self.size // REGION_SECTOR_SIZE)
+        timestamps = self.timestamps[present]
+        return {"x": self.x, "z": self.z, "location": self.location, "size": self.size, "chunks": chunk_count,
+                "used_bytes": used_sectors * REGION_SECTOR_SIZE,
+                # sectors no chunk points at, left behind when chunks grow and move to the end of the file
+                "free_bytes": max(0, file_sectors - 2 - used_sectors) * REGION_SECTOR_SIZE,
+                "oldest": int(timestamps.min()) if chunk_count else None,
+                "newest": int(timestamps.max()) if chunk_count else None}
+
+
+def region_files(region_dir: str) -> list[str]:
+    """Returns the region files of a region dir"""
+    if not os.path.isdir(region_dir):
+        return []
+    return [os.path.join(region_dir, filename) for filename in sorted(os.listdir(region_dir))
+            if REGION_FILE_RE.match(filename)]
+
+
+def scan_regions(region_dir: str) -> dict:
+    """
+    Summarises every region in a dir: per region sizes and chunk counts and the totals
+    Headers are stacked into one array so the counting over every region runs in numpy
+    """
+    locations = region_files(region_dir)
+    if not locations:
+        return {"regions": [], "region_count": 0, "chunks": 0, "size": 0, "used_bytes": 0, "free_bytes": 0}
+    headers = np.stack([read_header(location) for location in locations])
+    sizes = np.array([os.path.getsize(location) for location in locations], dtype=np.int64)
+    present = (headers[:, :CHUNKS_PER_REGION] >> 8) != 0
+    chunks = present.sum(axis=1)
+    used_sectors = np.where(present, headers[:, :CHUNKS_PER_REGION] & 0xFF, 0).sum(axis=1).astype(np.int64)
+    free_sectors = np.maximum(0, -(-sizes // REGION_SECTOR_SIZE) - 2 - used_sectors)
+    regions = [{"x": x, "z": z, "location": location, "size": int(size), "chunks": int(chunk_count),
+                "used_bytes": int(used) * REGION_SECTOR_SIZE, "free_bytes": int(free) * REGION_SECTOR_SIZE}
+               for location, (x, z), size, chunk_count, used, free in
+               zip(locations, map(region_coords, locations), sizes, chunks, used_sectors, free_sectors)]
+    return {"regions": regions, "region_count": len(regions), "chunks": int(chunks.sum()), "size": int(sizes.sum()),
+            "used_bytes": int(used_sectors.sum()) * REGION_SECTOR_SIZE,
+            "free_bytes": int(free_sectors.sum()) * REGION_SECTOR_SIZE}
+
+
+def chunk_bounds(center_x: int, center_z: int, radius: int) -> tuple[int, int, int, int]:
+    """Returns the (min x, min z, max x, max z) chunk coords, inclusive, covering radius blocks around a block"""
+    return ((center_x - radius) >> 4, (center_z - radius) >> 4, (center_x + radius) >> 4, (center_z + radius) >> 4)
+
+
+def generated_mask(region_dir: str, min_chunk_x: int, min_chunk_z: int, max_chunk_x: int,
+                   max_chunk_z: int) -> np.ndarray:
+    """
+    Returns a bool grid indexed [z, x] relative to the min corner of which chunks in the bounds are stored
+    Only the headers of the regions overlapping the bounds are read, so stored proto chunks count too, the
+    neighbours of generated chunks are saved part way generated, see chunks_full for finished chunks
+    """
+    mask = np.zeros((max_chunk_z - min_chunk_z + 1, max_chunk_x - min_chunk_x + 1), dtype=bool)
+    for region_z in range(min_chunk_z >> 5, (max_chunk_z >> 5) + 1):
+        for region_x in range(min_chunk_x >> 5, (max_chunk_x >> 5) + 1):
+            location = os.path.join(region_dir, f"r.{region_x}.{region_z}.mca")
+            if not os.path.isfile(location):
+                continue
+            present = (read_header(location)[:CHUNKS_PER_REGION] >> 8 != 0).reshape(REGION_WIDTH, REGION_WIDTH)
+            # the overlap of the region and the bounds, in absolute chunk coords
+            start_x = max(min_chunk_x, region_x * REGION_WIDTH)
+            end_x = min(max_chunk_x, region_x * REGION_WIDTH + REGION_WIDTH - 1)
+            start_z = max(min_chunk_z, region_z * REGION_WIDTH)
+            end_z = min(max_chunk_z, region_z * REGION_WIDTH + REGION_WIDTH - 1)
+            mask[start_z - min_chunk_z:end_z - min_chunk_z + 1, start_x - min_chunk_x:end_x - min_chunk_x + 1] = \
+                present[start_z & 31:(end_z & 31) + 1, start_x & 31:(end_x & 31) + 1]
+    return mask
+
+
+def _skip_nbt(data, position: int, tag_type: int) -> int:
+    """Returns the position after the payload of a tag starting at position"""
+    if tag_type in _NBT_SIZES:
+        return position + _NBT_SIZES[tag_type]
+    if tag_type in _NBT_ARRAY_SIZES:
+        return position + 4 + int.from_bytes(data[position:position + 4], "big", signed=True) * \
+            _NBT_ARRAY_SIZES[tag_type]
+    if tag_type == _NBT_STRING:
+        return position + 2 + int.from_bytes(data[position:position + 2], "big")
+    if tag_type == _NBT_LIST:
+        item_type, length = data[position], int.from_bytes(data[position + 1:position + 5], "big", signed=True)
+        position += 5
+        if item_type in _NBT_SIZES:
+            return position + length * _NBT_SIZES[item_type]
+        for _ in range(length):
+            position = _skip_nbt(data, position, item_type)
+        return position
+    if tag_type == _NBT_COMPOUND:
+        while data[position] != _NBT_END:
+            child_type = data[position]
+            position = _skip_nbt(data, position + 3 + int.from_bytes(data[position + 1:position + 3], "big"),
+                                 child_type)
+        return position + 1
+    raise ValueError(f"Unknown nbt tag type {tag_type}")
+
+
+def _find_status(data, position: int) -> Optional[str]:
+    """Walks the tags of the compound payload at position for its Status string, looking inside Level too"""
+    while data[position] != _NBT_END:
+        tag_type = data[position]
+        name_end = position + 3 + int.from_bytes(data[position + 1:position + 3], "big")
+        name = bytes(data[position + 3:name_end])
+        if tag_type == _NBT_STRING and name == b"Status":
+            length = int.from_bytes(data[name_end:name_end + 2], "big")
+            return bytes(data[name_end + 2:name_end + 2 + length]).decode("utf-8")
+        # before 1.18 the chunk is wrapped in a Level compound
+        if tag_type == _NBT_COMPOUND and name == b"Level":
+            return _find_status(data, name_end)
+        position = _skip_nbt(data, name_end, tag_type)
+    return None
+
+
+def chunk_status(chunk_nbt: bytes) -> Optional[str]:
+    """
+    Returns the generation Status of an uncompressed chunk, minecraft:full (full before 1.18) once finished
+    Only the tags before Status are walked, none are decoded into python objects
+    """
+    if not chunk_nbt or chunk_nbt[0] != _NBT_COMPOUND:
+        raise ValueError("Chunk nbt doesnt start with a compound")
+    return _find_status(chunk_nbt, 3 + int.from_bytes(chunk_nbt[1:3], "big"))
+
+
+def read_chunk(region_map, region_dir: str, chunk_x: int, chunk_z: int) -> Optional[bytes]:
+    """
+    Reads and decompresses the nbt of a chunk
+    :param region_map: A buffer of the whole region file holding the chunk, e.g. an mmap
+    :param region_dir: The region dir, for chunks too big for the region file
+    :return: The uncompressed nbt, None if the chunk isnt stored
+    """
+    index = (chunk_x & 31) + (chunk_z & 31) * REGION_WIDTH
+    offset = int.from_bytes(region_map[index * 4:index * 4 + 3], "big") * REGION_SECTOR_SIZE
+    if not offset or offset + 5 > len(region_map):
+        return None
+    length = int.from_bytes(region_map[offset:offset + 4], "big")
+    compression = region_map[offset + 4]
+    if compression & CHUNK_EXTERNAL:
+        with open(os.path.join(region_dir, f"c.{chunk_x}.{chunk_z}.mcc"), "rb") as reader:
+            data = reader.read()
+        compression &= ~CHUNK_EXTERNAL
+    else:
+        data = region_map[offset + 5:offset + 4 + length]
+    if compression == CHUNK_ZLIB:
+        return zlib.decompress(data)
+    if compression == CHUNK_GZIP:
+        return gzip.decompress(data)
+    if compression == CHUNK_UNCOMPRESSED:
+        return bytes(data)
+    raise ValueError(f"Unsupported chunk compression {compression} of chunk {chunk_x},{chunk_z} in {region_dir}"
+                     + (", set region-file-compression to deflate" if compression == CHUNK_LZ4 else ""))
+
+
+def chunks_full(region_dir: str, min_chunk_x: int, min_chunk_z: int, max_chunk_x: int, max_chunk_z: int) -> bool:
+    """
+    Returns True if every chunk in the bounds, inclusive, is stored fully generated
+    The edge chunks are read first, the part way generated neighbours of a generated area are found there, and the
+    check stops at the first chunk that isnt full
+    """
+    edge = [(x, z) for z in (min_chunk_z, max_chunk_z) for x in range(min_chunk_x, max_chunk_x + 1)] + \
+           [(x, z) for x in (min_chunk_x, max_chunk_x) for z in range(min_chunk_z + 1, max_chunk_z)]
+    inner = [(x, z) for z in range(min_chunk_z + 1, max_chunk_z) for x in range(min_chunk_x + 1, max_chunk_x)]
+    region_maps = {}
+    try:
+        for chunk_x, chunk_z in dict.fromkeys(edge + inner):
+            region = (chunk_x >> 5, chunk_z >> 5)
+            if region not in region_maps:
+                location = os.path.join(region_dir, f"r.{region[0]}.{region[1]}.mca")
+                if not os.path.isfile(location) or os.path.getsize(location) < REGION_HEADER_SIZE:
+                    return False
+                with open(location, "rb") as reader:
+                    region_maps[region] = mmap.mmap(reader.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                chunk_nbt = read_chunk(region_maps[region], region_dir, chunk_x, chunk_z)
+            except (zlib.error, EOFError, OSError) as error:
+                # the server may be rewriting the chunk, it is checked again on the next call
+                logger.debug(f"Failed to read chunk {chunk_x},{chunk_z} in {region_dir}: {error}")
+                return False
+            if chunk_nbt is None or (chunk_status(chunk_nbt) or "").split(":")[-1] != "full":
+                return False
+        return True
+    finally:
+        for region_map in region_maps.values():
+            region_map.close()
+
+
+def generation_progress(region_dir: str, center_x: int = 0, center_z: int = 0, radius: int = 1000) -> dict:
+    """Reports how many chunks within radius blocks (a square) of a block are generated"""
+    bounds = chunk_bounds(center_x, center_z, radius)
+    mask = generated_mask(region_dir, *bounds)
+    generated = int(mask.sum())
+    progress = {"generated": generated, "total": int(mask.size), "fraction": generated / mask.size}
+    logger.debug(f"Generation of {region_dir} within {radius} of {center_x},{center_z}: "
+                 f"{generated}/{mask.size} chunks")
+    return progress
+
+
+def world_region_dirs(world_location: str, dimensions: Iterable[str] = None) -> dict:
+    """Returns dimension: region dir for the vanilla dimensions of a world"""
+    return {dimension: os.path.join(world_location, DIMENSION_REGION_DIRS[dimension])
+            for dimension in (dimensions or DIMENSION_REGION_DIRS)}
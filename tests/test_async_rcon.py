@@ -0,0 +1,87 @@
+from py_minecraft_server.commands import AsyncRCON, RCONAuthenticationError, RCONPool
+from py_minecraft_server.testing import FakeRCONServer
+import asyncio
+
+import pytest
+
+
+def _run(test):
+    """Runs test with a started FakeRCONServer"""
+    async def run():
+        async with FakeRCONServer("secret") as server:
+            return await test(server)
+    return asyncio.run(run())
+
+
+def test_command():
+    async def test(server: FakeRCONServer):
+        async with AsyncRCON("127.0.0.1", "secret", server.port) as rcon:
+            assert await rcon.command("list") == "list"
+        assert server.commands == ["list"]
+    _run(test)
+
+
+def test_bad_password():
+    async def test(server: FakeRCONServer):
+        with pytest.raises(RCONAuthenticationError):
+            await AsyncRCON("127.0.0.1", "wrong", server.port).connect()
+    _run(test)
+
+
+def test_pipelined_commands_keep_their_order():
+    async def test(server: FakeRCONServer):
+        server.delay = 0.01
+        async with AsyncRCON("127.0.0.1", "secret", server.port) as rcon:
+            commands = [f"say {index}" for index in range(20)]
+            assert await rcon.commands(*commands) == commands
+        assert server.connections == 1
+    _run(test)
+
+
+def test_multi_packet_response():
+    async def test(server: FakeRCONServer):
+        server.handler = lambda command: "x" * 10000
+        async with AsyncRCON("127.0.0.1", "secret", server.port) as rcon:
+            assert await rcon.command("help") == "x" * 10000
+    _run(test)
+
+
+def test_reconnects_after_drop():
+    async def test(server: FakeRCONServer):
+        async with AsyncRCON("127.0.0.1", "secret", server.port) as rcon:
+            assert await rcon.command("first") == "first"
+            server.drop_connections()
+            await asyncio.sleep(0.05)
+            assert not rcon.connected
+            assert await rcon.command("second") == "second"
+        assert server.connections == 2
+    _run(test)
+
+
+def test_no_reconnect():
+    async def test(server: FakeRCONServer):
+        async with AsyncRCON("127.0.0.1", "secret", server.port, auto_reconnect=False) as rcon:
+            server.drop_connections()
+            await asyncio.sleep(0.05)
+            with pytest.raises(ConnectionError):
+                await rcon.command("list")
+    _run(test)
+
+
+def test_pool_broadcast():
+    async def test():
+        servers = [await FakeRCONServer("secret", handler=lambda command, index=index: f"{index} {command}").start()
+                   for index in range(3)]
+        pool = RCONPool()
+        try:
+            targets = [("127.0.0.1", "secret", server.port) for server in servers]
+            results = await pool.broadcast(targets, "save-all")
+            assert results == {("127.0.0.1", server.port): f"{index} save-all" for index, server in enumerate(servers)}
+            # the second broadcast reuses the pooled connections
+            await pool.broadcast(targets, "save-all")
+            assert [server.connections for server in servers] == [1, 1, 1]
+        finally:
+            await pool.close()
+            for server in servers:
+                await server.close()
+    asyncio.run(test())
@@ -0,0 +1,99 @@
+from py_minecraft_server.creation import BandwidthLimiter, download_file
+from py_minecraft_server.testing import FakeJarHost
+from py_minecraft_server.utils import get_async_http_client
+import asyncio
+import hashlib
+import json
+import os
+import time
+
+import pytest
+
+VERSION = "1.20.4"
+JAR_SIZE = 1024 * 1024
+
+
+@pytest.fixture
+def jar_host():
+    with FakeJarHost(jar_size=JAR_SIZE) as host:
+        yield host
+
+
+def _jar_url(host: FakeJarHost) -> str:
+    return f"{host.base_url}/v1/objects/{host.jar_sha1(VERSION)}/server.jar"
+
+
+def _download(url: str, save_location: str, **kwargs) -> str:
+    async def download():
+        try:
+            return await download_file(url, save_location, **kwargs)
+        finally:
+            await get_async_http_client().close()
+    return asyncio.run(download())
+
+
+def test_parallel_ranged_download(jar_host, tmp_path):
+    progress = []
+    location = _download(_jar_url(jar_host), str(tmp_path / "server.jar"), sha1=jar_host.jar_sha1(VERSION),
+                         chunks=4, min_chunk_size=64 * 1024, progress=lambda done, total: progress.append(done))
+    with open(location, "rb") as reader:
+        assert reader.read() == jar_host.jar(VERSION)
+    # one HEAD then a ranged GET per chunk
+    assert jar_host.requests[f"/v1/objects/{jar_host.jar_sha1(VERSION)}/server.jar"] == 5
+    assert progress[-1] == JAR_SIZE
+    assert not os.path.exists(f"{location}.part") and not os.path.exists(f"{location}.part.json")
+
+
+def test_single_stream_without_ranges(tmp_path):
+    with FakeJarHost(jar_size=JAR_SIZE, ranges=False) as host:
+        location = _download(_jar_url(host), str(tmp_path / "server.jar"), sha1=host.jar_sha1(VERSION))
+        with open(location, "rb") as reader:
+            assert reader.read() == host.jar(VERSION)
+        assert host.requests[f"/v1/objects/{host.jar_sha1(VERSION)}/server.jar"] == 2
+
+
+def test_resumes_partial_download(jar_host, tmp_path):
+    location = str(tmp_path / "server.jar")
+    half = JAR_SIZE // 2
+    # a previous attempt finished the first chunk and none of the second
+    with open(f"{location}.part", "wb") as writer:
+        writer.write(jar_host.jar(VERSION)[:half])
+        writer.truncate(JAR_SIZE)
+    with open(f"{location}.part.json", "w") as writer:
+        json.dump({"url": _jar_url(jar_host), "total": JAR_SIZE, "chunks": [[0, half, half], [half, half, JAR_SIZE]]},
+                  writer)
+    _download(_jar_url(jar_host), location, sha1=jar_host.jar_sha1(VERSION))
+    with open(location, "rb") as reader:
+        assert hashlib.sha1(reader.read()).hexdigest() == jar_host.jar_sha1(VERSION)
+    assert jar_host.bytes_sent == JAR_SIZE - half
+
+
+def test_retries_failed_requests(jar_host, tmp_path, monkeypatch):
+    jar_host.failures = 2
+    monkeypatch.setattr(get_async_http_client(), "backoff", 0.01)
+    location = _download(_jar_url(jar_host), str(tmp_path / "server.jar"), sha1=jar_host.jar_sha1(VERSION))
+    assert os.path.getsize(location) == JAR_SIZE
+
+
+def test_sha1_mismatch(jar_host, tmp_path):
+    location = str(tmp_path / "server.jar")
+    with pytest.raises(ValueError):
+        _download(_jar_url(jar_host), location, sha1="0" * 40)
+    assert not os.path.exists(location) and not os.path.exists(f"{location}.part")
+
+
+def test_bandwidth_cap(jar_host, tmp_path):
+    started = time.monotonic()
+    # the bucket starts with a second of burst, the rest of the file is paced
+    _download(_jar_url(jar_host), str(tmp_path / "server.jar"), max_bytes_per_second=JAR_SIZE // 2)
+    assert time.monotonic() - started >= 0.9
+
+
+def test_bandwidth_limiter_paces():
+    async def acquire() -> float:
+        limiter = BandwidthLimiter(100_000)
+        started = time.monotonic()
+        for _ in range(3):
+            await limiter.acquire(100_000)
+        return time.monotonic() - started
+    assert asyncio.run(acquire()) >= 1.9
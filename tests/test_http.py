@@ -0,0 +1,66 @@
+from py_minecraft_server.testing import FakeJarHost
+from py_minecraft_server.utils import AsyncHttpClient, HttpClient
+import aiohttp
+import asyncio
+import socket
+
+import pytest
+
+
+@pytest.fixture
+def jar_host():
+    with FakeJarHost(jar_size=64 * 1024) as host:
+        yield host
+
+
+def _closed_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def _get_bytes(client: AsyncHttpClient, url: str, **kwargs):
+    async def get():
+        try:
+            return await client.get_bytes(url, **kwargs)
+        finally:
+            await client.close()
+    return asyncio.run(get())
+
+
+def test_async_get_retries_retryable_statuses(jar_host):
+    jar_host.failures = 2
+    body = _get_bytes(AsyncHttpClient(backoff=0.01), jar_host.manifest_url)
+    assert b'"latest"' in body
+    assert jar_host.requests["/mc/game/version_manifest_v2.json"] == 3
+
+
+def test_async_get_gives_up_after_retries(jar_host):
+    jar_host.failures = 10
+    with pytest.raises(ValueError):
+        _get_bytes(AsyncHttpClient(backoff=0.01), jar_host.manifest_url, retries=1)
+    assert jar_host.requests["/mc/game/version_manifest_v2.json"] == 2
+
+
+def test_async_get_reraises_connection_errors():
+    with pytest.raises(aiohttp.ClientConnectionError):
+        _get_bytes(AsyncHttpClient(retries=2, backoff=0.01), f"http://127.0.0.1:{_closed_port()}/")
+
+
+def test_async_get_cache(jar_host):
+    client = AsyncHttpClient()
+    _get_bytes(client, jar_host.manifest_url, cache_ttl=60)
+    _get_bytes(client, jar_host.manifest_url, cache_ttl=60)
+    assert jar_host.requests["/mc/game/version_manifest_v2.json"] == 1
+
+
+def test_sync_get_retries(jar_host):
+    jar_host.failures = 1
+    client = HttpClient(backoff=0.01)
+    try:
+        assert client.get(jar_host.manifest_url).status_code == 200
+        jar_host.failures = 1
+        assert client.get(jar_host.manifest_url, ignore_errors=True, retries=0).status_code == 503
+    finally:
+        client.close()
+    assert jar_host.requests["/mc/game/version_manifest_v2.json"] == 3
@@ -0,0 +1,82 @@
+from py_minecraft_server.commands import StatusScanner, status_ping
+from py_minecraft_server.commands.status_ping import decode_varint, description_text, encode_varint
+from py_minecraft_server.testing import FakeStatusServer
+import asyncio
+import socket
+
+import pytest
+
+
+def _closed_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def test_varint_round_trip():
+    for value in (0, 1, 127, 128, 25565, 2 ** 31 - 1, -1):
+        assert decode_varint(encode_varint(value)) == (value, len(encode_varint(value)))
+    assert len(encode_varint(-1)) == 5
+
+
+def test_description_text():
+    assert description_text("§aHello §lworld") == "Hello world"
+    assert description_text({"text": "A ", "extra": [{"text": "§cMinecraft"}, " Server"]}) == "A Minecraft Server"
+
+
+def test_status_ping():
+    async def test():
+        async with FakeStatusServer(players_online=3, players_max=10, motd="Fleet §bserver") as server:
+            status = await status_ping("127.0.0.1", server.port)
+        assert status.online and status.version == "1.20.4" and status.protocol == 765
+        assert (status.players_online, status.players_max, status.motd) == (3, 10, "Fleet server")
+        assert status.latency_ms >= 0
+    asyncio.run(test())
+
+
+def test_status_ping_without_ping_answer():
+    async def test():
+        async with FakeStatusServer(answer_ping=False) as server:
+            assert (await status_ping("127.0.0.1", server.port)).online
+    asyncio.run(test())
+
+
+def test_status_ping_timeout():
+    async def test():
+        async with FakeStatusServer(delay=1.0) as server:
+            with pytest.raises(asyncio.TimeoutError):
+                await status_ping("127.0.0.1", server.port, timeout=0.1)
+            status = await StatusScanner(timeout=0.1).status("127.0.0.1", server.port)
+        assert not status.online and status.error
+    asyncio.run(test())
+
+
+def test_scanner_caches_and_shares_pings():
+    async def test():
+        scanner = StatusScanner(ttl=60)
+        async with FakeStatusServer(delay=0.05) as server:
+            statuses = await asyncio.gather(*[scanner.status("127.0.0.1", server.port) for _ in range(10)])
+            assert all(status.online for status in statuses)
+            assert server.status_requests == 1
+            server.players_online = 5
+            assert (await scanner.status("127.0.0.1", server.port)).players_online == 0
+            assert (await scanner.status("127.0.0.1", server.port, max_age=0)).players_online == 5
+            scanner.invalidate("127.0.0.1", server.port)
+            await scanner.status("127.0.0.1", server.port)
+            assert server.status_requests == 3
+    asyncio.run(test())
+
+
+def test_scan():
+    async def test():
+        servers = [await FakeStatusServer(players_online=index).start() for index in range(5)]
+        offline_port = _closed_port()
+        try:
+            targets = [("127.0.0.1", server.port) for server in servers] + [("127.0.0.1", offline_port)]
+            results = await StatusScanner(timeout=1.0).scan(targets)
+        finally:
+            for server in servers:
+                await server.close()
+        assert [results[("127.0.0.1", server.port)].players_online for server in servers] == list(range(5))
+        assert not results[("127.0.0.1", offline_port)].online
+    asyncio.run(test())